@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (
     Drug, DrugCategory, Patient, Sale, SaleItem, InventoryLog, 
-    DrugInteraction, UserProfile, Supplier, InvoiceUpload, InvoiceItem
+    DrugInteraction, UserProfile, Supplier, InvoiceUpload, InvoiceItem,
+    DailySalesSummary, DailyDrugSales, ReportJob
 )
 
 @admin.register(UserProfile)
@@ -85,3 +86,23 @@ class InvoiceItemAdmin(admin.ModelAdmin):
     list_filter = ('match_status', 'invoice__supplier')
     search_fields = ('extracted_name', 'extracted_brand', 'matched_drug__name')
     readonly_fields = ('match_confidence',)
+
+@admin.register(DailySalesSummary)
+class DailySalesSummaryAdmin(admin.ModelAdmin):
+    list_display = ('day', 'sale_count', 'revenue', 'updated_at')
+    date_hierarchy = 'day'
+    readonly_fields = ('day', 'sale_count', 'revenue', 'updated_at')
+
+@admin.register(DailyDrugSales)
+class DailyDrugSalesAdmin(admin.ModelAdmin):
+    list_display = ('day', 'drug_name', 'quantity', 'value')
+    date_hierarchy = 'day'
+    search_fields = ('drug_name',)
+    readonly_fields = ('day', 'drug_name', 'quantity', 'value')
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('report_type', 'export_format', 'start_date', 'end_date', 'status',
+                    'requested_by', 'created_at', 'finished_at', 'expires_at')
+    list_filter = ('report_type', 'export_format', 'status')
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'worker_id')
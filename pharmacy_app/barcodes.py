@@ -0,0 +1,158 @@
+from bisect import bisect_right
+import logging
+import threading
+import time
+
+from django.db import connection
+
+from .models import Drug
+from .utils import bump_cache_version_on_commit, cache_version, index_is_current
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION_KEY = 'barcode_index_version'
+INDEX_MAX_AGE = 300
+
+
+class BarcodeIndex:
+    """Barcodes of active drugs, for resolving till scans without querying.
+
+    Exact scans are a dict lookup. A partial scan matches, case-insensitively
+    like the old icontains fallback, every barcode containing it: all keys
+    are joined into one string that is searched with str.find. Among several
+    matches the drug first by name and brand wins, as with the old `.first()`
+    query, so a partial scan resolves to the same drug as before.
+    """
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.exact = {}
+        self.barcodes = {}
+
+        # rows come in the drug list order, so the position is the tie-break rank
+        entries = []
+        for rank, (drug_id, barcode) in enumerate(rows):
+            self.exact[barcode] = drug_id
+            self.barcodes[drug_id] = barcode
+            entries.append((barcode.upper(), rank, drug_id))
+        entries.sort()
+        keys = [key for key, _, _ in entries]
+        self.drugs = [(rank, drug_id) for _, rank, drug_id in entries]
+
+        # All keys in one newline separated string, with the offset each key starts at
+        self.joined_keys = '\n'.join(keys)
+        self.key_offsets = []
+        offset = 0
+        for key in keys:
+            self.key_offsets.append(offset)
+            offset += len(key) + 1
+
+    def __len__(self):
+        return len(self.exact)
+
+    def _first_containing(self, term):
+        if not term or '\n' in term:
+            return None
+        best = None
+        found = self.joined_keys.find(term)
+        while found != -1:
+            position = bisect_right(self.key_offsets, found) - 1
+            if best is None or self.drugs[position] < best:
+                best = self.drugs[position]
+            # Continue from the next key so each key is counted once
+            if position + 1 == len(self.key_offsets):
+                break
+            found = self.joined_keys.find(term, self.key_offsets[position + 1])
+        return best[1] if best else None
+
+    def find(self, barcode):
+        """Return the id of the drug a scanned (possibly partial) barcode belongs to, or None"""
+        drug_id = self.exact.get(barcode)
+        if drug_id is not None:
+            return drug_id
+        return self._first_containing(barcode.upper())
+
+    def is_current(self, drug):
+        """True if the index already holds this drug's barcode and active state"""
+        barcode = drug.barcode if drug.is_active and drug.barcode else None
+        return self.barcodes.get(drug.id) == barcode
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def invalidate_barcode_index(drug=None):
+    """Bump the index version once the current transaction commits.
+
+    When a drug is given nothing happens if the loaded index already has its
+    barcode and active state, so the stock updates of every sale do not
+    force a rebuild.
+    """
+    index = _index
+    if drug is not None and index is not None and index.is_current(drug):
+        return
+    bump_cache_version_on_commit(INDEX_VERSION_KEY)
+
+
+def get_barcode_index(stale=None):
+    """Return the process-local barcode index, loading it when stale.
+
+    Passing the index a caller found to be out of date forces a rebuild
+    unless another thread has already replaced it.
+    """
+    global _index
+    version = cache_version(INDEX_VERSION_KEY)
+    index = _index
+    if index is not stale and index_is_current(index, version, INDEX_MAX_AGE):
+        return index
+
+    with _index_lock:
+        if _index is stale or not index_is_current(_index, version, INDEX_MAX_AGE):
+            rows = (
+                Drug.objects.filter(is_active=True, barcode__isnull=False)
+                .exclude(barcode='')
+                .order_by('name', 'brand', 'id')
+                .values_list('id', 'barcode')
+                .iterator(chunk_size=5000)
+            )
+            _index = BarcodeIndex(rows, version)
+        return _index
+
+
+def warm_barcode_index():
+    """Load the barcode index in a background thread so the first scan does not wait for it"""
+    def load():
+        try:
+            index = get_barcode_index()
+            logger.info("Barcode index loaded with %d barcodes", len(index))
+        except Exception:
+            logger.exception("Error loading barcode index")
+        finally:
+            connection.close()
+
+    threading.Thread(target=load, name='barcode-index-warmup', daemon=True).start()
+
+
+def find_drug_by_barcode(barcode):
+    """Return the active drug a scanned barcode belongs to, or None.
+
+    The index picks the drug and one primary key query loads its current
+    price and stock, checking the barcode still matches. A stale entry (the
+    barcode was changed by another process) rebuilds the index once, and an
+    exact barcode the index does not know is still looked up by the unique
+    barcode column, so drugs added in another process scan immediately.
+    """
+    index = get_barcode_index()
+    for attempt in range(2):
+        drug_id = index.find(barcode)
+        if drug_id is None:
+            break
+        drug = Drug.objects.filter(id=drug_id, is_active=True, barcode=index.barcodes[drug_id]).order_by().first()
+        if drug is not None:
+            return drug
+        if attempt == 0:
+            index = get_barcode_index(stale=index)
+
+    return Drug.objects.filter(barcode=barcode, is_active=True).order_by().first()
@@ -0,0 +1,155 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.text import compress_string
+
+from .models import Drug, VersionCounter
+
+CATALOGUE_COUNTER = 'drug_catalogue'
+CATALOGUE_CHANGES_KEY = 'drug_catalogue_changes:{}'
+
+# Order of the values in each catalogue row sent to the tills
+CATALOGUE_FIELDS = ['id', 'name', 'brand', 'price', 'stock', 'barcode']
+
+# Tills further behind than this many versions reload the whole catalogue
+CATALOGUE_MAX_DELTA_VERSIONS = 1000
+
+
+def get_catalogue_version():
+    """Return the current drug catalogue version, 0 before the first change"""
+    version = VersionCounter.objects.filter(name=CATALOGUE_COUNTER).values_list('value', flat=True).first()
+    return version or 0
+
+
+def bump_catalogue_version():
+    """Start a new catalogue version and return it.
+
+    Concurrent callers always get distinct versions, so no change log
+    overwrites another: the counter row is bumped in one upsert on
+    PostgreSQL and SQLite and under a row lock elsewhere. The first version
+    is the current time in milliseconds, so a recreated database does not
+    repeat versions whose change logs may still be cached, and versions stay
+    exact as JavaScript numbers in the tills.
+    """
+    start = int(time.time() * 1000)
+    if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+        table = connection.ops.quote_name(VersionCounter._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (name, value) VALUES (%s, %s) "
+                f"ON CONFLICT (name) DO UPDATE SET value = {table}.value + 1 "
+                f"RETURNING value",
+                [CATALOGUE_COUNTER, start]
+            )
+            return cursor.fetchone()[0]
+
+    with transaction.atomic():
+        VersionCounter.objects.get_or_create(name=CATALOGUE_COUNTER, defaults={'value': start - 1})
+        counter = VersionCounter.objects.select_for_update().get(name=CATALOGUE_COUNTER)
+        counter.value += 1
+        counter.save(update_fields=['value'])
+        return counter.value
+
+
+def invalidate_drug_catalogue(drug_ids=None):
+    """Start a new catalogue version once the current transaction commits.
+
+    The ids of the changed drugs are logged under the new version, so tills
+    holding an older version fetch only those drugs. Without ids nothing is
+    logged and such tills reload the whole catalogue.
+    """
+    drug_ids = sorted(set(drug_ids)) if drug_ids is not None else None
+
+    def bump():
+        version = bump_catalogue_version()
+        if drug_ids is not None:
+            cache.set(CATALOGUE_CHANGES_KEY.format(version), drug_ids, settings.CATALOGUE_CHANGES_TIMEOUT)
+
+    transaction.on_commit(bump)
+
+
+def _catalogue_rows(drug_ids=None):
+    drugs = Drug.objects.filter(is_active=True)
+    if drug_ids is not None:
+        drugs = drugs.filter(id__in=drug_ids)
+    return [
+        (drug_id, name, brand, float(price), stock, barcode or '')
+        for drug_id, name, brand, price, stock, barcode in (
+            drugs.order_by('id')
+            .values_list('id', 'name', 'brand', 'selling_price', 'stock_quantity', 'barcode')
+            .iterator(chunk_size=5000)
+        )
+    ]
+
+
+def catalogue_changes(since, version):
+    """Return (changed rows, removed ids) between an older catalogue version and `version`, or None.
+
+    The drugs changed since then are collected from the change log of each
+    later version and loaded as they are now; those no longer active are
+    removed. None means a log entry is missing (expired, evicted from the
+    cache, or a change that logged no ids) and the till has to load the full
+    catalogue again.
+    """
+    try:
+        since = int(since)
+    except (TypeError, ValueError):
+        return None
+    if since == version:
+        return [], []
+    if not 0 < version - since <= CATALOGUE_MAX_DELTA_VERSIONS:
+        return None
+
+    keys = [CATALOGUE_CHANGES_KEY.format(v) for v in range(since + 1, version + 1)]
+    logs = cache.get_many(keys)
+    if len(logs) != len(keys):
+        return None
+
+    drug_ids = set().union(*logs.values())
+    changed = _catalogue_rows(drug_ids) if drug_ids else []
+    return changed, sorted(drug_ids - {row[0] for row in changed})
+
+
+_full_body = None
+_full_body_lock = threading.Lock()
+
+
+def catalogue_response_body(since=None, gzip=False):
+    """Return the JSON body (gzip compressed if asked) of a catalogue request.
+
+    A till sends the version it has cached as `since` and gets only the
+    drugs added or changed since then plus the ids of removed ones. Without
+    `since`, or when that version is too old, the whole catalogue is sent;
+    its compressed body is built once per version and process.
+    """
+    global _full_body
+    # The version is read before the rows, so the rows are never older than it
+    version = get_catalogue_version()
+    changes = catalogue_changes(since, version)
+
+    if changes is not None:
+        changed, removed = changes
+        content = json.dumps({
+            'version': version,
+            'full': False,
+            'fields': CATALOGUE_FIELDS,
+            'drugs': changed,
+            'removed': removed,
+        }, separators=(',', ':')).encode()
+        return compress_string(content) if gzip else content
+
+    with _full_body_lock:
+        if _full_body is None or _full_body[0] != version:
+            content = json.dumps({
+                'version': version,
+                'full': True,
+                'fields': CATALOGUE_FIELDS,
+                'drugs': _catalogue_rows(),
+                'removed': [],
+            }, separators=(',', ':')).encode()
+            _full_body = (version, content, compress_string(content))
+        return _full_body[2] if gzip else _full_body[1]
@@ -0,0 +1,216 @@
+import csv
+import io
+import itertools
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .catalogue import invalidate_drug_catalogue
+from .matching import invalidate_drug_match_index
+from .models import Drug, InventoryLog
+from .search import invalidate_search_index
+from .spreadsheets import cell_at, read_sheet_rows
+from .utils import invalidate_notification_counts
+
+# Spreadsheet columns, in order (see templates/drugs/import.html)
+IMPORT_COLUMNS = [
+    'name', 'brand', 'description', 'stock_quantity', 'cost_price',
+    'selling_price', 'reorder_level', 'expiry_date', 'batch_number',
+]
+# Fields an import may overwrite on drugs that already exist
+UPDATE_FIELDS = IMPORT_COLUMNS[2:]
+
+ERROR_REPORT_DIR = 'drug_imports'
+
+
+class DrugImportResult:
+    """Counts of an import and the spreadsheet rows it skipped"""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        # (row number, name, brand, message) of every skipped row
+        self.errors = []
+        self.error_report = None
+
+    @property
+    def imported(self):
+        return self.created + self.updated
+
+
+def _text(value, field, max_length=None, required=False):
+    if value is None or str(value).strip() == '':
+        if required:
+            raise ValueError(f"{field} is required")
+        return None
+    value = str(value).strip()
+    if max_length and len(value) > max_length:
+        raise ValueError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def _whole_number(value, field):
+    if value is None or value == '':
+        return 0
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"{field} '{value}' is not a number")
+    if not number.is_finite() or number != number.to_integral_value() or not 0 <= number < 2 ** 31:
+        raise ValueError(f"{field} '{value}' is not a whole number from 0 to {2 ** 31 - 1}")
+    return int(number)
+
+
+def _price(value, field):
+    if value is None or value == '':
+        return Decimal('0.00')
+    try:
+        price = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"{field} '{value}' is not a number")
+    # max_digits=10, decimal_places=2
+    if not price.is_finite() or not 0 <= price < 10 ** 8:
+        raise ValueError(f"{field} '{value}' is not a price from 0 to 99999999.99")
+    return price.quantize(Decimal('0.01'))
+
+
+def _expiry_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if value is None or str(value).strip() == '':
+        raise ValueError("Expiry Date is required")
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"Expiry Date '{value}' is not a YYYY-MM-DD date")
+
+
+def parse_drug_row(row):
+    """Return the Drug field values of one spreadsheet row, or raise ValueError.
+
+    Everything the database would reject is checked here, so one bad row
+    cannot abort the transaction the whole import runs in.
+    """
+    return {
+        'name': _text(cell_at(row, 0), 'Name', 100, required=True),
+        'brand': _text(cell_at(row, 1), 'Brand', 100, required=True),
+        'description': _text(cell_at(row, 2), 'Description'),
+        'stock_quantity': _whole_number(cell_at(row, 3), 'Stock Quantity'),
+        'cost_price': _price(cell_at(row, 4), 'Cost Price'),
+        'selling_price': _price(cell_at(row, 5), 'Selling Price'),
+        'reorder_level': _whole_number(cell_at(row, 6), 'Reorder Level'),
+        'expiry_date': _expiry_date(cell_at(row, 7)),
+        'batch_number': _text(cell_at(row, 8), 'Batch Number', 100),
+    }
+
+
+def _import_chunk(chunk, user, result):
+    """Create or update the drugs of one chunk of (row number, row) pairs"""
+    # Later rows for the same drug win, as they did with update_or_create
+    rows = {}
+    for row_number, row in chunk:
+        if not any(value not in (None, '') for value in row):
+            continue
+        try:
+            data = parse_drug_row(row)
+        except ValueError as e:
+            result.errors.append((row_number, cell_at(row, 0), cell_at(row, 1), str(e)))
+            continue
+        rows.pop((data['name'], data['brand']), None)
+        rows[(data['name'], data['brand'])] = (row_number, data)
+    if not rows:
+        return
+
+    # One query finds the existing drugs of the whole chunk
+    existing = {}
+    names = {name for name, _ in rows}
+    brands = {brand for _, brand in rows}
+    for drug in Drug.objects.filter(name__in=names, brand__in=brands):
+        existing.setdefault((drug.name, drug.brand), []).append(drug)
+
+    now = timezone.now()
+    new_drugs = []
+    changed_drugs = []
+    changed_fields = set()
+    for key, (row_number, data) in rows.items():
+        matches = existing.get(key, [])
+        if len(matches) > 1:
+            result.errors.append((row_number, key[0], key[1], f"{len(matches)} drugs already have this name and brand"))
+        elif matches:
+            drug = matches[0]
+            fields = [field for field in UPDATE_FIELDS if getattr(drug, field) != data[field]]
+            if fields:
+                for field in fields:
+                    setattr(drug, field, data[field])
+                drug.updated_at = now
+                changed_drugs.append(drug)
+                changed_fields.update(fields)
+            result.updated += 1
+        else:
+            new_drugs.append(Drug(**data))
+
+    Drug.objects.bulk_create(new_drugs)
+    # Only drugs and columns that differ are written; bulk_update builds a CASE per column.
+    # It also leaves auto_now fields alone, so updated_at is set above and listed here.
+    if changed_drugs:
+        Drug.objects.bulk_update(changed_drugs, sorted(changed_fields) + ['updated_at'])
+    InventoryLog.objects.bulk_create([
+        InventoryLog(
+            drug=drug,
+            quantity_change=drug.stock_quantity,
+            operation_type='ADD',
+            notes="Initial stock from Excel import",
+            user=user,
+        )
+        for drug in new_drugs
+    ])
+    result.created += len(new_drugs)
+
+
+def write_error_report(errors):
+    """Save the skipped rows as a CSV file and return its storage name"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Row', 'Name', 'Brand', 'Error'])
+    writer.writerows(errors)
+    filename = f"{ERROR_REPORT_DIR}/import_errors_{timezone.now():%Y%m%d_%H%M%S}.csv"
+    return default_storage.save(filename, ContentFile(output.getvalue().encode('utf-8')))
+
+
+def import_drugs(file, user=None, chunk_size=None):
+    """Create or update drugs from an Excel file, keyed by name and brand.
+
+    The sheet is streamed in read-only mode and written in chunks: one query
+    finds a chunk's existing drugs, then bulk_create and bulk_update write it.
+    All chunks share one transaction. Rows that cannot be imported are
+    skipped and listed in a CSV error report (see DrugImportResult).
+    """
+    chunk_size = chunk_size or settings.DRUG_IMPORT_CHUNK_SIZE
+    result = DrugImportResult()
+    # Row numbers as shown in Excel; the header is row 1
+    rows = enumerate(read_sheet_rows(file, min_row=2), start=2)
+
+    with transaction.atomic():
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            _import_chunk(chunk, user, result)
+
+        # bulk_create and bulk_update send no Drug signals
+        if result.imported:
+            invalidate_notification_counts()
+            invalidate_drug_catalogue()
+            invalidate_search_index('drugs')
+            invalidate_drug_match_index()
+
+    if result.errors:
+        result.error_report = write_error_report(result.errors)
+    return result
@@ -2,6 +2,8 @@ from django import forms
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.contrib.auth.models import User
 from django.forms import inlineformset_factory
+from django.core.exceptions import ValidationError
+from django.urls import reverse
 from django.utils import timezone
 from .models import (
     Drug, DrugCategory, Patient, Sale, SaleItem, 
@@ -9,6 +11,46 @@ from .models import (
     InvoiceUpload, InvoiceItem
 )
 
+class SelectedOptionSelect(forms.Select):
+    """Model select that renders only the empty choice and the selected object.
+    
+    The page fills in the other choices client-side, so the HTML does not
+    grow with the table. The field still validates against its full queryset.
+    """
+    def optgroups(self, name, value, attrs=None):
+        iterator = self.choices
+        field = iterator.field
+        choices = [('', field.empty_label)] if field.empty_label is not None else []
+        selected = [v for v in value if v]
+        if selected:
+            try:
+                objects = field.queryset.filter(**{f"{field.to_field_name or 'pk'}__in": selected})
+                choices += [iterator.choice(obj) for obj in objects]
+            except (ValueError, TypeError, ValidationError):
+                pass
+        
+        self.choices = choices
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = iterator
+
+class AutocompleteSelect(SelectedOptionSelect):
+    """Select that static/js/autocomplete.js turns into a search-as-you-type field.
+    
+    `source` names the search API queried ('drugs' or 'patients'). Only the
+    selected option is rendered; whatever is picked is validated against the
+    field's queryset as usual.
+    """
+    def __init__(self, source, attrs=None):
+        self.source = source
+        super().__init__(attrs)
+    
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-autocomplete-url'] = reverse('autocomplete_search', args=[self.source])
+        return attrs
+
 class UserLoginForm(AuthenticationForm):
     """Form for user login"""
     username = forms.CharField(widget=forms.TextInput(attrs={
@@ -137,7 +179,10 @@ class SaleForm(forms.ModelForm):
         model = Sale
         fields = ['patient', 'payment_method', 'payment_status', 'tax', 'discount', 'notes']
         widgets = {
-            'patient': forms.Select(attrs={'class': 'form-control'}),
+            'patient': AutocompleteSelect('patients', attrs={
+                'class': 'form-control',
+                'placeholder': 'Type to search patients...',
+            }),
             'payment_method': forms.TextInput(attrs={'class': 'form-control'}),
             'payment_status': forms.TextInput(attrs={'class': 'form-control'}),
             'tax': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
@@ -173,7 +218,11 @@ class SaleItemForm(forms.ModelForm):
         model = SaleItem
         fields = ['drug', 'quantity']
         widgets = {
-            'drug': forms.Select(attrs={'class': 'form-control drug-select'}),
+            # sales.js drives these from the cached drug catalogue rather than the search API
+            'drug': AutocompleteSelect('drugs', attrs={
+                'class': 'form-control drug-select',
+                'data-autocomplete-manual': 'true',
+            }),
             'quantity': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
         }
     
@@ -296,7 +345,10 @@ class InvoiceItemMatchForm(forms.ModelForm):
         model = InvoiceItem
         fields = ['matched_drug', 'quantity', 'cost_price', 'match_status']
         widgets = {
-            'matched_drug': forms.Select(attrs={'class': 'form-control'}),
+            'matched_drug': AutocompleteSelect('drugs', attrs={
+                'class': 'form-control',
+                'placeholder': 'Type to search drugs...',
+            }),
             'quantity': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
             'cost_price': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': 0}),
             'match_status': forms.Select(attrs={'class': 'form-control'}),
@@ -0,0 +1,117 @@
+from collections import namedtuple
+import threading
+import time
+
+from .models import Drug, DrugInteraction
+from .utils import bump_cache_version_on_commit, cache_version, index_is_current
+
+GRAPH_VERSION_KEY = 'drug_interaction_graph_version'
+GRAPH_MAX_AGE = 3600
+
+Edge = namedtuple('Edge', ['id', 'drug_one_id', 'drug_two_id', 'severity', 'description'])
+
+
+class InteractionGraph:
+    """Adjacency map of drug interactions keyed by drug id.
+
+    Each interaction is stored under both of its drugs, so lookups do not
+    depend on which drug is drug_one. If both orders of a pair exist, the
+    interaction with the lower id wins, as with the old `.first()` query.
+    """
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.adjacency = {}
+        self.size = 0
+
+        severities = {}
+        for row in rows:
+            interaction_id, drug_one_id, drug_two_id, severity, description = row
+            edge = Edge(interaction_id, drug_one_id, drug_two_id,
+                        severities.setdefault(severity, severity), description)
+            current = self.adjacency.get(drug_one_id, {}).get(drug_two_id)
+            if current is not None and current.id < interaction_id:
+                continue
+            self.adjacency.setdefault(drug_one_id, {})[drug_two_id] = edge
+            self.adjacency.setdefault(drug_two_id, {})[drug_one_id] = edge
+            if current is None:
+                self.size += 1
+
+    def get(self, drug_id, other_id):
+        """Return the interaction between two drugs, or None"""
+        return self.adjacency.get(drug_id, {}).get(other_id)
+
+    def neighbours(self, drug_id):
+        """Return a {other_drug_id: edge} dict of a drug's interactions"""
+        return self.adjacency.get(drug_id, {})
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def invalidate_interaction_graph():
+    """Bump the graph version once the current transaction commits"""
+    bump_cache_version_on_commit(GRAPH_VERSION_KEY)
+
+
+def get_interaction_graph():
+    """Return the process-local interaction graph, loading it when stale"""
+    global _graph
+    version = cache_version(GRAPH_VERSION_KEY)
+    graph = _graph
+    if index_is_current(graph, version, GRAPH_MAX_AGE):
+        return graph
+
+    with _graph_lock:
+        if not index_is_current(_graph, version, GRAPH_MAX_AGE):
+            rows = DrugInteraction.objects.values_list(
+                'id', 'drug_one_id', 'drug_two_id', 'severity', 'description'
+            ).iterator(chunk_size=5000)
+            _graph = InteractionGraph(rows, version)
+        return _graph
+
+
+def find_drug_interactions(drugs):
+    """Return warning dicts for every interacting pair among the given drugs"""
+    if len(drugs) < 2:
+        return []
+    graph = get_interaction_graph()
+
+    interactions = []
+    for i in range(len(drugs)):
+        for j in range(i + 1, len(drugs)):
+            drug1, drug2 = drugs[i], drugs[j]
+            interaction = graph.get(drug1.id, drug2.id)
+
+            if interaction and interaction.severity != 'NONE':
+                interactions.append({
+                    'drug1': drug1.name,
+                    'drug2': drug2.name,
+                    'severity': interaction.severity,
+                    'description': interaction.description
+                })
+
+    return interactions
+
+
+def get_drug_interactions(drug):
+    """Return unsaved DrugInteraction instances for a drug, with both drugs attached"""
+    edges = sorted(get_interaction_graph().neighbours(drug.id).values(), key=lambda edge: edge.id)
+    others = Drug.objects.in_bulk([edge.drug_two_id if edge.drug_one_id == drug.id else edge.drug_one_id
+                                   for edge in edges])
+    others[drug.id] = drug
+
+    interactions = []
+    for edge in edges:
+        if edge.drug_one_id not in others or edge.drug_two_id not in others:
+            continue
+        interactions.append(DrugInteraction(
+            id=edge.id,
+            drug_one=others[edge.drug_one_id],
+            drug_two=others[edge.drug_two_id],
+            severity=edge.severity,
+            description=edge.description,
+        ))
+    return interactions
@@ -0,0 +1,50 @@
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import InvoiceCounter
+
+# PL/pgSQL function (installed by migration 0014) returning the next invoice number
+# of a day from that day's sequence, creating the sequence on the day's first sale.
+# Sequences are not rolled back, so no lock is held until the sale commits.
+NEXT_INVOICE_NUMBER_FUNCTION = 'pharmacy_next_invoice_number'
+
+
+def format_invoice_number(day, number):
+    """Invoice number shown to customers, e.g. INV-20240131-00042.
+
+    Five or more digits keep sequence numbers apart from the four digit
+    random suffixes issued before the sequence existed.
+    """
+    return f"INV-{day.strftime('%Y%m%d')}-{number:05d}"
+
+
+def next_invoice_number(day):
+    """Return the next number in `day`'s invoice sequence (1, 2, 3, ...).
+
+    Concurrent callers always get distinct numbers, in one query on
+    PostgreSQL and SQLite. Numbers taken by sales that roll back are skipped
+    on PostgreSQL and reused elsewhere.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {NEXT_INVOICE_NUMBER_FUNCTION}(%s)", [day])
+            return cursor.fetchone()[0]
+
+    if connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert:
+        # A single upsert; SQLite serialises writers, so the increment is atomic
+        table = connection.ops.quote_name(InvoiceCounter._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (day, last_number) VALUES (%s, 1) "
+                f"ON CONFLICT (day) DO UPDATE SET last_number = last_number + 1 "
+                f"RETURNING last_number",
+                [day]
+            )
+            return cursor.fetchone()[0]
+
+    # Other databases: lock the day's counter row and bump it
+    with transaction.atomic():
+        InvoiceCounter.objects.get_or_create(day=day)
+        counter = InvoiceCounter.objects.select_for_update().get(day=day)
+        InvoiceCounter.objects.filter(day=day).update(last_number=F('last_number') + 1)
+        return counter.last_number + 1
@@ -0,0 +1,185 @@
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import get_template
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pypdf import PdfWriter
+import django
+import functools
+import io
+import multiprocessing
+import os
+import xhtml2pdf.pisa as pisa
+import zipfile
+
+from .models import Sale
+from .utils import start_of_day
+
+# Shown on the printed and PDF invoices
+COMPANY_DETAILS = {
+    'company_name': 'Pharmacy Management System',
+    'company_address': '123 Health Street, Medical City',
+    'company_phone': '+1 234 567 8900',
+    'company_email': 'info@pharmacymanagement.com',
+}
+
+INVOICE_PDF_TEMPLATE = 'sales/invoice_pdf.html'
+INVOICE_PRINT_CSS = 'css/invoice_print.css'
+
+
+@functools.lru_cache(maxsize=None)
+def get_invoice_print_css():
+    """Contents of the invoice print stylesheet, read once per process"""
+    with open(finders.find(INVOICE_PRINT_CSS), encoding='utf-8') as f:
+        return f.read()
+
+
+def invoice_context(sale, items):
+    """Template context for a sale invoice"""
+    return {'sale': sale, 'items': items, **COMPANY_DETAILS}
+
+
+def render_invoice_pdf(sale, items=None):
+    """Render one sale's invoice to PDF bytes, returning None if xhtml2pdf reports an error.
+
+    The print template is standalone and its stylesheet only uses selectors
+    xhtml2pdf understands, so unlike render_to_pdf there is no HTML rewriting.
+    """
+    if items is None:
+        items = sale.saleitems.all()
+    context = invoice_context(sale, items)
+    context['print_css'] = get_invoice_print_css()
+    html = get_template(INVOICE_PDF_TEMPLATE).render(context)
+
+    result = io.BytesIO()
+    pdf = pisa.pisaDocument(io.BytesIO(html.encode("UTF-8")), result)
+    if pdf.err:
+        return None
+    return result.getvalue()
+
+
+def _invoice_pdf_cache_key(sale_id):
+    return f"invoice_pdf:{sale_id}"
+
+
+def get_invoice_pdf(sale):
+    """Return the invoice PDF for a sale, rendering it only if it is not cached"""
+    key = _invoice_pdf_cache_key(sale.id)
+    pdf = cache.get(key)
+    if pdf is None:
+        pdf = render_invoice_pdf(sale)
+        if pdf is not None:
+            cache.set(key, pdf, settings.INVOICE_PDF_CACHE_TIMEOUT)
+    return pdf
+
+
+def invalidate_invoice_pdf(sale_id):
+    """Drop a sale's cached invoice PDF once the current transaction commits"""
+    transaction.on_commit(lambda: cache.delete(_invoice_pdf_cache_key(sale_id)))
+
+
+def invoice_batch_sales(start_date, end_date):
+    """Sales between two dates, oldest first, with patient, user and items loaded up front.
+
+    Patient and user come with the sales query and the items of every sale
+    with one prefetch query, so rendering the batch needs no further queries.
+    """
+    return (
+        Sale.objects.filter(
+            date__gte=start_of_day(start_date),
+            date__lt=start_of_day(end_date + timedelta(days=1))
+        )
+        .select_related('patient', 'user')
+        .prefetch_related('saleitems')
+        .order_by('date', 'id')
+    )
+
+
+def _render_invoices(sales, max_workers):
+    """Yield the rendered PDF (or None) of each sale in order, over a pool of worker processes"""
+    # Rendering is CPU bound, so more processes than cores only adds start-up cost
+    max_workers = min(max_workers, len(sales), os.cpu_count() or 1)
+    if max_workers <= 1:
+        for sale in sales:
+            yield render_invoice_pdf(sale, list(sale.saleitems.all()))
+        return
+
+    # Spawned workers do not inherit the parent's threads or DB connections. Sales are
+    # pickled with their related objects and items, so the workers never query the database.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                             initializer=django.setup) as executor:
+        yield from executor.map(
+            render_invoice_pdf,
+            sales,
+            [list(sale.saleitems.all()) for sale in sales],
+            chunksize=4,
+        )
+
+
+def iter_invoice_pdfs(sales, max_workers=1, progress_callback=None):
+    """Yield (sale, pdf) for each sale in order, pdf being None if it could not be rendered.
+
+    Invoices already in the cache are reused and the rest are rendered over
+    `max_workers` processes. Those are not cached: the sales were loaded
+    when the batch started, and a sale edited since then must not have its
+    old invoice stored after the edit dropped it. `progress_callback`
+    receives (invoices_done, invoices_total).
+    """
+    sales = list(sales)
+    total = len(sales)
+    cached = cache.get_many([_invoice_pdf_cache_key(sale.id) for sale in sales])
+    missing = [sale for sale in sales if _invoice_pdf_cache_key(sale.id) not in cached]
+    rendered = _render_invoices(missing, max_workers)
+
+    for done, sale in enumerate(sales, start=1):
+        key = _invoice_pdf_cache_key(sale.id)
+        pdf = cached[key] if key in cached else next(rendered)
+        if progress_callback:
+            progress_callback(done, total)
+        yield sale, pdf
+
+
+def invoice_pdf_filename(sale):
+    return f"Invoice_{sale.invoice_number}.pdf"
+
+
+def write_invoice_batch(start_date, end_date, export_format, output, max_workers=None, progress_callback=None):
+    """Write the invoices of all sales between two dates into the binary file `output`.
+
+    `export_format` is 'PDF' for one merged document (bookmarked by invoice
+    number) or 'ZIP' for an archive with one PDF per invoice. Returns
+    (invoices_written, invoice_numbers_that_failed); raises ValueError if
+    there was nothing to print.
+    """
+    if max_workers is None:
+        max_workers = settings.INVOICE_BATCH_WORKERS
+    sales = invoice_batch_sales(start_date, end_date)
+    pdfs = iter_invoice_pdfs(sales, max_workers, progress_callback)
+    written = 0
+    failed = []
+
+    if export_format == 'ZIP':
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for sale, pdf in pdfs:
+                if pdf is None:
+                    failed.append(sale.invoice_number)
+                    continue
+                archive.writestr(invoice_pdf_filename(sale), pdf)
+                written += 1
+        if not written:
+            raise ValueError("There are no invoices to print for this date range")
+    else:
+        merged = PdfWriter()
+        for sale, pdf in pdfs:
+            if pdf is None:
+                failed.append(sale.invoice_number)
+                continue
+            merged.append(io.BytesIO(pdf), outline_item=sale.invoice_number)
+            written += 1
+        if not written:
+            raise ValueError("There are no invoices to print for this date range")
+        merged.write(output)
+    return written, failed
@@ -0,0 +1,616 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from datetime import datetime, timedelta
+from PIL import Image
+import pytesseract
+import itertools
+import logging
+import os
+import re
+
+from .models import InvoiceUpload, InvoiceItem
+from .ocr import count_pdf_pages, ocr_pdf_pages
+from .ocr_cache import file_content_hash, get_ocr_cache
+from .spreadsheets import read_sheet_rows, cell_at
+from .matching import (
+    get_drug_match_index, MATCH_THRESHOLD, PARTIAL_MATCH_THRESHOLD
+)
+
+logger = logging.getLogger(__name__)
+
+# Header labels recognised in the first rows of Excel invoices
+EXCEL_HEADER_SCAN_ROWS = 10
+EXCEL_HEADER_NAMES = ['item', 'description', 'product', 'name', 'drug name']
+EXCEL_HEADER_QUANTITIES = ['qty', 'quantity', 'amount']
+EXCEL_HEADER_PRICES = ['price', 'unit price', 'cost', 'cost price']
+EXCEL_HEADER_BRANDS = ['brand', 'manufacturer']
+
+def truncate_field(value, max_length):
+    """Utility function to truncate text fields to prevent database errors"""
+    if value and len(value) > max_length:
+        return value[:max_length - 3] + '...'
+    return value
+
+def build_safe_invoice_item(invoice, name, brand, quantity, price, **kwargs):
+    """Build an unsaved invoice item with proper field truncation to prevent database errors"""
+    # Make sure name is never None, use a default value if it is
+    if name is None:
+        name = "Unknown Item"
+    
+    # Truncate text fields to fit database column limits
+    safe_name = truncate_field(name, 495)  # 500 char limit - buffer
+    safe_brand = truncate_field(brand, 250) if brand else None  # 255 char limit - buffer
+    
+    # Make sure quantity and price are also not None
+    quantity = quantity if quantity is not None else "1"
+    price = price if price is not None else "0.00"
+    
+    return InvoiceItem(
+        invoice=invoice,
+        extracted_name=safe_name,
+        extracted_brand=safe_brand,
+        extracted_quantity=quantity,
+        extracted_cost_price=price,
+        **kwargs
+    )
+
+def has_imported_items(invoice):
+    """True once any item of the invoice has been added to the inventory"""
+    return invoice.items.filter(is_imported=True).exists()
+
+def save_invoice_items(invoice, items, batch_size=None):
+    """Replace an invoice's items with unsaved ones, in batches with bulk_create inside one transaction.
+
+    Items from an earlier run are deleted first, so reprocessing never
+    duplicates them; an invoice with imported items cannot be reprocessed.
+    Only one batch is held in memory at a time; returns the number of items saved.
+    """
+    batch_size = batch_size or settings.INVOICE_ITEM_BATCH_SIZE
+    saved = 0
+    batch = []
+    
+    with transaction.atomic():
+        if has_imported_items(invoice):
+            raise ValueError("Items of this invoice have already been imported to the inventory.")
+        invoice.items.all().delete()
+        
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                InvoiceItem.objects.bulk_create(batch)
+                saved += len(batch)
+                batch = []
+        if batch:
+            InvoiceItem.objects.bulk_create(batch)
+            saved += len(batch)
+    
+    logger.info("Saved %d invoice items", saved)
+    return saved
+
+def extract_text_items(invoice, extracted_text):
+    """Yield unsaved invoice items found in OCR text"""
+    # This is a simplified version; in a real system, this would be more sophisticated
+    # Look for tables of items, which typically have quantity, description, and price
+    
+    # Use regex patterns to find items with quantity and price
+    item_patterns = [
+        r'(\d+)\s*x?\s*([A-Za-z0-9\s\-\+]+)\s*\$?(\d+[\.,]\d{2})',  # Quantity, Name, Price
+        r'([A-Za-z0-9\s\-\+]+)\s*(\d+)\s*(?:tablets|capsules|units|pcs)\s*\$?(\d+[\.,]\d{2})',  # Name, Quantity, Price
+        r'([A-Za-z0-9\s\-\+]+)\s*(\d+)\s*(?:mg|ml|g)\s*\$?(\d+[\.,]\d{2})',  # Name, Strength, Price
+    ]
+    
+    for pattern in item_patterns:
+        matches = re.findall(pattern, extracted_text, re.IGNORECASE | re.MULTILINE)
+        for match in matches:
+            # The order of fields in the match may vary depending on the pattern
+            if re.match(r'\d+', match[0]):  # If first group is numeric, it's likely quantity
+                quantity = match[0]
+                name = match[1].strip()
+                price = match[2].replace(',', '.')
+            else:  # First group is likely the name
+                name = match[0].strip()
+                quantity = match[1]
+                price = match[2].replace(',', '.')
+            
+            # Extract brand if possible (often in parentheses)
+            brand = None
+            brand_match = re.search(r'\(([A-Za-z0-9\s\-\+]+)\)', name)
+            if brand_match:
+                brand = brand_match.group(1).strip()
+                name = name.replace(f"({brand})", "").strip()
+            
+            yield build_safe_invoice_item(
+                invoice=invoice,
+                name=name,
+                brand=brand,
+                quantity=quantity,
+                price=price
+            )
+
+# Invoice Processing Functions
+def process_pdf_invoice(invoice, progress_callback=None):
+    """Process a PDF invoice using OCR to extract items"""
+    # Get file path
+    file_path = invoice.file.path
+    logger.info("Processing PDF invoice: %s", file_path)
+    
+    # Check if file exists
+    if not os.path.exists(file_path):
+        logger.error("File not found: %s", file_path)
+        raise FileNotFoundError(f"Invoice file not found: {file_path}")
+    
+    try:
+        # Reuse OCR text from earlier runs on identical file contents
+        ocr_cache = get_ocr_cache()
+        content_hash = file_content_hash(file_path)
+        page_count = ocr_cache.get_page_count(content_hash)
+        if page_count is None:
+            page_count = count_pdf_pages(file_path)
+            ocr_cache.set_page_count(content_hash, page_count)
+        
+        page_texts = {}
+        for page_number in range(1, page_count + 1):
+            text = ocr_cache.get_page(content_hash, page_number)
+            if text is not None:
+                page_texts[page_number] = text
+        missing_pages = [page for page in range(1, page_count + 1) if page not in page_texts]
+        invoice.ocr_cache_hits = len(page_texts)
+        invoice.ocr_cache_misses = len(missing_pages)
+        logger.info("OCR cache: %d page(s) cached, %d to process", invoice.ocr_cache_hits, invoice.ocr_cache_misses)
+        
+        if missing_pages:
+            # Rasterise and OCR pages lazily, spread over a pool of worker processes
+            logger.info("OCR of %d PDF pages using %d worker(s)", len(missing_pages), settings.INVOICE_OCR_WORKERS)
+            
+            def report_pages(done, total):
+                logger.info("OCR completed for %d of %d pages", done, total)
+                if progress_callback:
+                    progress_callback(int(done * 80 / total))
+            
+            new_texts = ocr_pdf_pages(
+                file_path,
+                page_numbers=missing_pages,
+                max_workers=settings.INVOICE_OCR_WORKERS,
+                dpi=settings.INVOICE_OCR_DPI,
+                progress_callback=report_pages,
+            )
+            for page_number, text in new_texts.items():
+                ocr_cache.set_page(content_hash, page_number, text)
+            page_texts.update(new_texts)
+            ocr_cache.evict()
+        elif progress_callback:
+            progress_callback(80)
+        
+        # Reassemble the text in page order
+        extracted_text = ""
+        for page_number in range(1, page_count + 1):
+            extracted_text += f"\n\n---- PAGE {page_number} ----\n\n{page_texts[page_number]}"
+    except Exception as e:
+        logger.error("Error in PDF processing: %s", e)
+        raise
+    
+    # Extract invoice details (if not already provided)
+    if not invoice.invoice_number:
+        # Look for invoice number patterns
+        invoice_number_patterns = [
+            r'invoice\s*#?\s*:?\s*([A-Za-z0-9\-]+)',
+            r'invoice\s*number\s*:?\s*([A-Za-z0-9\-]+)',
+            r'inv\s*#?\s*:?\s*([A-Za-z0-9\-]+)',
+        ]
+        
+        for pattern in invoice_number_patterns:
+            match = re.search(pattern, extracted_text, re.IGNORECASE)
+            if match:
+                invoice.invoice_number = match.group(1).strip()
+                invoice.save()
+                break
+    
+    # Extract invoice date (if not already provided)
+    if not invoice.invoice_date:
+        date_patterns = [
+            r'date\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+            r'invoice\s*date\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+        ]
+        
+        for pattern in date_patterns:
+            match = re.search(pattern, extracted_text, re.IGNORECASE)
+            if match:
+                date_str = match.group(1)
+                try:
+                    # Try different date formats
+                    for fmt in ['%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%m-%d-%Y']:
+                        try:
+                            date_obj = datetime.strptime(date_str, fmt)
+                            invoice.invoice_date = date_obj
+                            invoice.save()
+                            break
+                        except ValueError:
+                            continue
+                except Exception:
+                    pass
+                break
+    
+    # Extract items from the invoice
+    return save_invoice_items(invoice, extract_text_items(invoice, extracted_text))
+
+def process_image_invoice(invoice, progress_callback=None):
+    """Process an image invoice using OCR to extract items"""
+    # Similar to PDF processing but starts with the image directly
+    file_path = invoice.file.path
+    logger.info("Processing image invoice: %s", file_path)
+    
+    # Check if file exists
+    if not os.path.exists(file_path):
+        logger.error("File not found: %s", file_path)
+        raise FileNotFoundError(f"Invoice file not found: {file_path}")
+    
+    try:
+        # Reuse OCR text from earlier runs on identical file contents
+        ocr_cache = get_ocr_cache()
+        content_hash = file_content_hash(file_path)
+        extracted_text = ocr_cache.get_page(content_hash, 1)
+        invoice.ocr_cache_hits = 1 if extracted_text is not None else 0
+        invoice.ocr_cache_misses = 1 - invoice.ocr_cache_hits
+        
+        if extracted_text is None:
+            # Open the image
+            logger.debug("Opening image file")
+            image = Image.open(file_path)
+            logger.debug("Image opened: %s, %s", image.format, image.size)
+            
+            # Extract text using OCR
+            logger.debug("Applying OCR to image")
+            extracted_text = pytesseract.image_to_string(image)
+            ocr_cache.set_page(content_hash, 1, extracted_text)
+            ocr_cache.evict()
+        logger.info("OCR extraction completed. Extracted %d characters", len(extracted_text))
+        if progress_callback:
+            progress_callback(80)
+    except Exception as e:
+        logger.error("Error in image processing: %s", e)
+        raise
+    
+    # The rest is the same as PDF processing
+    # Extract invoice details (if not already provided)
+    if not invoice.invoice_number:
+        invoice_number_patterns = [
+            r'invoice\s*#?\s*:?\s*([A-Za-z0-9\-]+)',
+            r'invoice\s*number\s*:?\s*([A-Za-z0-9\-]+)',
+            r'inv\s*#?\s*:?\s*([A-Za-z0-9\-]+)',
+        ]
+        
+        for pattern in invoice_number_patterns:
+            match = re.search(pattern, extracted_text, re.IGNORECASE)
+            if match:
+                invoice.invoice_number = match.group(1).strip()
+                invoice.save()
+                break
+    
+    # Extract invoice date (if not already provided)
+    if not invoice.invoice_date:
+        date_patterns = [
+            r'date\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+            r'invoice\s*date\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+        ]
+        
+        for pattern in date_patterns:
+            match = re.search(pattern, extracted_text, re.IGNORECASE)
+            if match:
+                date_str = match.group(1)
+                try:
+                    # Try different date formats
+                    for fmt in ['%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%m-%d-%Y']:
+                        try:
+                            date_obj = datetime.strptime(date_str, fmt)
+                            invoice.invoice_date = date_obj
+                            invoice.save()
+                            break
+                        except ValueError:
+                            continue
+                except Exception:
+                    pass
+                break
+    
+    # Extract items using the same patterns as the PDF function
+    return save_invoice_items(invoice, extract_text_items(invoice, extracted_text))
+
+def detect_invoice_columns(rows):
+    """Find the header row and 0-based column indexes in the first rows of a sheet.
+
+    Returns (header_row, columns) where header_row is the number of leading
+    rows to skip and columns maps 'name', 'quantity', 'price' and 'brand' to
+    a column index or None.
+    """
+    header_row = None
+    columns = {'name': None, 'quantity': None, 'price': None, 'brand': None}
+    
+    # Look for common header names
+    for row_idx, row in enumerate(rows, 1):
+        for col_idx, value in enumerate(row):
+            cell_value = str(value).lower() if value else ""
+            if cell_value:
+                if cell_value in EXCEL_HEADER_NAMES:
+                    header_row = row_idx
+                    columns['name'] = col_idx
+                elif cell_value in EXCEL_HEADER_QUANTITIES:
+                    header_row = row_idx
+                    columns['quantity'] = col_idx
+                elif cell_value in EXCEL_HEADER_PRICES:
+                    header_row = row_idx
+                    columns['price'] = col_idx
+                elif cell_value in EXCEL_HEADER_BRANDS:
+                    header_row = row_idx
+                    columns['brand'] = col_idx
+        
+        # If we found at least name and price columns, we can proceed
+        if header_row and columns['name'] is not None and columns['price'] is not None:
+            break
+    
+    # If no explicit headers found, assume first row is header
+    if not header_row:
+        header_row = 1
+        # Try to guess columns based on the kind of data in the second row
+        first_row = rows[0] if rows else ()
+        second_row = rows[1] if len(rows) > 1 else ()
+        for col_idx in range(len(first_row)):
+            second_row_cell = cell_at(second_row, col_idx)
+            
+            if second_row_cell:
+                if isinstance(second_row_cell, str) and len(second_row_cell) > 3:
+                    # Longer text is likely the name
+                    columns['name'] = col_idx
+                elif isinstance(second_row_cell, (int, float)) and second_row_cell > 0 and second_row_cell < 1000:
+                    # Smaller numbers might be quantities
+                    if columns['quantity'] is None:
+                        columns['quantity'] = col_idx
+                    # Larger numbers might be prices
+                    elif columns['price'] is None and second_row_cell > 1:
+                        columns['price'] = col_idx
+    
+    # If still can't determine columns, make a best guess:
+    # name, quantity and price are often the first three columns
+    for key, default in (('name', 0), ('quantity', 1), ('price', 2)):
+        if columns[key] is None:
+            columns[key] = default
+    
+    return header_row, columns
+
+def iter_excel_invoice_rows(file_path):
+    """Stream (name, quantity, price, brand) tuples from the data rows of an invoice workbook"""
+    rows = read_sheet_rows(file_path)
+    
+    # Buffer just the first rows to find the header, then keep streaming the rest
+    head = list(itertools.islice(rows, EXCEL_HEADER_SCAN_ROWS))
+    header_row, columns = detect_invoice_columns(head)
+    logger.debug("Excel header row %s, columns %s", header_row, columns)
+    
+    return (
+        (
+            cell_at(row, columns['name']),
+            cell_at(row, columns['quantity']),
+            cell_at(row, columns['price']),
+            cell_at(row, columns['brand']),
+        )
+        for row in itertools.chain(head[header_row:], rows)
+    )
+
+def process_excel_invoice(invoice, progress_callback=None):
+    """Process an Excel invoice to extract items"""
+    file_path = invoice.file.path
+    logger.info("Processing Excel invoice: %s", file_path)
+    
+    # Check if file exists
+    if not os.path.exists(file_path):
+        logger.error("File not found: %s", file_path)
+        raise FileNotFoundError(f"Invoice file not found: {file_path}")
+    
+    try:
+        logger.debug("Opening Excel workbook in read-only mode")
+        rows = iter_excel_invoice_rows(file_path)
+    except Exception as e:
+        logger.error("Error loading Excel file: %s", e)
+        raise
+    
+    # Extract items from rows after the header
+    def extract_rows():
+        for name_cell, quantity, price, brand in rows:
+            # Skip empty rows
+            if not name_cell:
+                continue
+            
+            # Skip rows where name is a header or subtotal
+            if isinstance(name_cell, str):
+                if any(x in name_cell.lower() for x in ['total', 'subtotal', 'item', 'product', 'description']):
+                    continue
+            
+            # Skip if missing essential data
+            if not price:
+                continue
+            
+            yield build_safe_invoice_item(
+                invoice=invoice,
+                name=str(name_cell),
+                brand=str(brand) if brand else None,
+                quantity=str(quantity) if quantity is not None else '1',
+                price=str(price)
+            )
+    
+    count = save_invoice_items(invoice, extract_rows())
+    
+    if progress_callback:
+        progress_callback(80)
+    
+    return count
+
+def match_invoice_items(invoice):
+    """Match extracted invoice items with drugs in the database"""
+    # Get the shared drug index for matching
+    index = get_drug_match_index()
+    
+    # Get all items from this invoice
+    items = list(InvoiceItem.objects.filter(invoice=invoice))
+    updated_items = []
+    
+    for item in items:
+        if not item.extracted_name and not item.extracted_brand:
+            continue
+        
+        # Find the best candidate using trigram lookup plus fuzzy rerank
+        best_match, best_score = index.best_match(item.extracted_name, item.extracted_brand)
+        
+        # Update the item with the match information
+        if best_match and best_score >= MATCH_THRESHOLD:
+            item.matched_drug_id = best_match['id']
+            item.match_status = 'MATCHED'
+            item.match_confidence = min(best_score, 100)  # Cap at 100
+            
+            # If we have quantity info, save it
+            if item.extracted_quantity:
+                try:
+                    quantity = int(float(item.extracted_quantity.replace(',', '.')))
+                    item.quantity = quantity
+                except (ValueError, TypeError):
+                    pass
+            
+            # If we have price info, save it
+            if item.extracted_cost_price:
+                try:
+                    cost_price = float(item.extracted_cost_price.replace(',', '.'))
+                    item.cost_price = cost_price
+                except (ValueError, TypeError):
+                    pass
+        elif best_match and best_score >= PARTIAL_MATCH_THRESHOLD:
+            item.matched_drug_id = best_match['id']
+            item.match_status = 'PARTIAL_MATCH'
+            item.match_confidence = best_score
+        else:
+            # No good match found
+            item.match_status = 'UNMATCHED'
+        
+        updated_items.append(item)
+    
+    # Write all match results back in a few batched UPDATE statements
+    InvoiceItem.objects.bulk_update(
+        updated_items,
+        ['matched_drug', 'match_status', 'match_confidence', 'quantity', 'cost_price'],
+        batch_size=settings.INVOICE_ITEM_BATCH_SIZE
+    )
+
+# Invoice Processing Queue
+INVOICE_PROCESSORS = {
+    'PDF': process_pdf_invoice,
+    'IMAGE': process_image_invoice,
+    'EXCEL': process_excel_invoice,
+}
+
+def process_invoice(invoice, progress_callback=None):
+    """Extract and match the items of an invoice and record the outcome on it"""
+    logger.info("Processing invoice ID %s with file type: %s", invoice.id, invoice.file_type)
+    
+    processor = INVOICE_PROCESSORS.get(invoice.file_type)
+    if processor is None:
+        raise ValueError(f"Unsupported file type: {invoice.file_type}")
+    
+    item_count = processor(invoice, progress_callback=progress_callback)
+    logger.info("%s processing completed with %d items", invoice.file_type, item_count)
+    
+    # Auto-match items with drugs in the database
+    match_invoice_items(invoice)
+    if progress_callback:
+        progress_callback(95)
+    
+    # Update invoice status
+    invoice.total_items_found = invoice.items.count()
+    invoice.total_items_matched = invoice.items.filter(match_status__in=['MATCHED', 'MANUALLY_MATCHED']).count()
+    
+    if invoice.total_items_matched == 0:
+        invoice.processing_status = 'FAILED'
+        invoice.processing_notes = "No items could be matched to drugs in the database."
+    elif invoice.total_items_matched < invoice.total_items_found:
+        invoice.processing_status = 'PARTIALLY_PROCESSED'
+        invoice.processing_notes = f"{invoice.total_items_matched} out of {invoice.total_items_found} items matched."
+    else:
+        invoice.processing_status = 'COMPLETED'
+        invoice.processing_notes = "All items matched successfully."
+    
+    invoice.progress = 100
+    invoice.processing_finished_at = timezone.now()
+    invoice.save()
+    return invoice
+
+def enqueue_invoice(invoice):
+    """Queue an invoice for processing by the background worker.
+
+    The status is changed with one conditional UPDATE, so an invoice a
+    worker has already claimed is never reset to PENDING (e.g. by a double
+    click). Returns False, leaving the invoice untouched, in that case.
+    """
+    queued = InvoiceUpload.objects.filter(id=invoice.id).exclude(processing_status='PROCESSING').update(
+        processing_status='PENDING',
+        processing_notes="Waiting for a worker to process this invoice.",
+        progress=0,
+        worker_id=None,
+        processing_started_at=None,
+        processing_finished_at=None,
+        ocr_cache_hits=0,
+        ocr_cache_misses=0,
+    )
+    return bool(queued)
+
+def claim_next_invoice(worker_id):
+    """Atomically claim the oldest pending invoice for a worker.
+    
+    Uses SELECT ... FOR UPDATE SKIP LOCKED where the database supports it so
+    concurrent workers never wait on each other, and a conditional UPDATE so
+    an invoice can only ever be claimed once.
+    """
+    with transaction.atomic():
+        pending = InvoiceUpload.objects.filter(processing_status='PENDING').order_by('upload_date', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        invoice_id = pending.values_list('id', flat=True).first()
+        if invoice_id is None:
+            return None
+        
+        claimed = InvoiceUpload.objects.filter(id=invoice_id, processing_status='PENDING').update(
+            processing_status='PROCESSING',
+            processing_notes="Processing started.",
+            progress=0,
+            worker_id=worker_id,
+            processing_started_at=timezone.now(),
+            processing_finished_at=None,
+        )
+    
+    if not claimed:
+        return None
+    return InvoiceUpload.objects.get(id=invoice_id)
+
+def release_stale_invoices(timeout):
+    """Requeue invoices stuck in PROCESSING for longer than `timeout` seconds (e.g. after a worker crash)"""
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return InvoiceUpload.objects.filter(
+        processing_status='PROCESSING',
+        processing_started_at__lt=cutoff,
+    ).update(
+        processing_status='PENDING',
+        processing_notes="Requeued after the previous worker stopped responding.",
+        progress=0,
+        worker_id=None,
+    )
+
+def run_claimed_invoice(invoice):
+    """Process an invoice claimed by a worker, recording failures on the invoice"""
+    def report_progress(percent):
+        invoice.progress = percent
+        InvoiceUpload.objects.filter(id=invoice.id).update(progress=percent)
+    
+    try:
+        process_invoice(invoice, progress_callback=report_progress)
+    except Exception as e:
+        logger.exception("Error in invoice processing of invoice %s", invoice.id)
+        invoice.processing_status = 'FAILED'
+        invoice.processing_notes = f"Error processing invoice: {str(e)}"
+        invoice.processing_finished_at = timezone.now()
+        invoice.save()
+    return invoice
@@ -0,0 +1,179 @@
+from datetime import date
+from decimal import Decimal
+import random
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from pharmacy_app.barcodes import BarcodeIndex, find_drug_by_barcode, get_barcode_index, invalidate_barcode_index
+from pharmacy_app.models import Drug
+
+BENCH_NAME_PREFIX = 'BENCH-BARCODE-'
+
+
+def legacy_find_drug_by_barcode(barcode):
+    """The lookup get_drug_by_barcode did before the barcode index"""
+    try:
+        return Drug.objects.get(barcode=barcode, is_active=True)
+    except Drug.DoesNotExist:
+        drugs = Drug.objects.filter(barcode__icontains=barcode, is_active=True)
+        if drugs.exists():
+            return drugs.first()
+        return None
+
+
+def random_barcode(rng):
+    return ''.join(rng.choice('0123456789') for _ in range(13))
+
+
+def make_scans(barcodes, count, rng):
+    """Till scans: mostly exact, some with digits missing at either end, some unknown"""
+    scans = []
+    for _ in range(count):
+        barcode = rng.choice(barcodes)
+        roll = rng.random()
+        if roll < 0.8:
+            scans.append(barcode)
+        elif roll < 0.88:
+            scans.append(barcode[:-3])
+        elif roll < 0.95:
+            scans.append(barcode[3:])
+        else:
+            scans.append(random_barcode(rng))
+    return scans
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {
+        'p50': samples[len(samples) // 2],
+        'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark barcode scans: the in-memory index alone, then many concurrent tills against the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--barcodes', type=int, default=50000,
+                            help='Synthetic barcodes for the in-memory index benchmark')
+        parser.add_argument('--drugs', type=int, default=20000,
+                            help='Barcoded drugs inserted for the till benchmark (deleted afterwards)')
+        parser.add_argument('--tills', type=int, default=50, help='Concurrent tills (threads) scanning')
+        parser.add_argument('--scans', type=int, default=200, help='Scans per till')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--i-know-this-writes', action='store_true',
+                            help='Run even though DEBUG is off; the drugs are written to the configured database')
+
+    def handle(self, *args, **options):
+        if not (settings.DEBUG or options['i_know_this_writes']):
+            raise CommandError("This benchmark inserts drugs into the configured database. "
+                               "Run it with DEBUG on or pass --i-know-this-writes.")
+        rng = random.Random(options['seed'])
+        self.benchmark_index(options['barcodes'], rng)
+
+        # The tills run on their own connections, so the drugs are committed and deleted afterwards
+        self.generate_drugs(options['drugs'], rng)
+        try:
+            self.benchmark_tills(options['tills'], options['scans'], rng)
+        finally:
+            deleted, _ = Drug.objects.filter(name__startswith=BENCH_NAME_PREFIX).delete()
+            invalidate_barcode_index()
+            self.stdout.write(f"Deleted {deleted} benchmark drug(s).")
+
+    def generate_drugs(self, count, rng, batch_size=5000):
+        taken = set(Drug.objects.exclude(barcode=None).values_list('barcode', flat=True))
+        barcodes = list({random_barcode(rng) for _ in range(count)} - taken)
+        for offset in range(0, len(barcodes), batch_size):
+            Drug.objects.bulk_create([
+                Drug(
+                    name=f"{BENCH_NAME_PREFIX}{offset + n:06d}",
+                    brand='Benchmark',
+                    barcode=barcode,
+                    cost_price=Decimal('1.00'),
+                    selling_price=Decimal('2.00'),
+                    expiry_date=date(2099, 1, 1),
+                )
+                for n, barcode in enumerate(barcodes[offset:offset + batch_size])
+            ])
+        invalidate_barcode_index()
+        self.stdout.write(f"Inserted {len(barcodes)} barcoded benchmark drugs.")
+
+    def benchmark_index(self, count, rng):
+        barcodes = list({random_barcode(rng) for _ in range(count)})
+        rows = [(drug_id, barcode) for drug_id, barcode in enumerate(barcodes, start=1)]
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        index = BarcodeIndex(rows)
+        build_time = time.perf_counter() - started
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(f"In-memory index: {len(index)} barcodes, built in {build_time:.2f}s, "
+                          f"{memory / 1024 / 1024:.1f} MB")
+        kinds = {
+            'exact': barcodes,
+            'prefix': [barcode[:-3] for barcode in barcodes],
+            'suffix': [barcode[3:] for barcode in barcodes],
+            'unknown': [f"X{barcode}" for barcode in barcodes],
+        }
+        for kind, samples in kinds.items():
+            timings = []
+            for barcode in rng.sample(samples, min(2000, len(samples))):
+                started = time.perf_counter()
+                index.find(barcode)
+                timings.append((time.perf_counter() - started) * 1e6)
+            stats = percentiles(timings)
+            self.stdout.write(f"  {kind:>8} scan: p50 {stats['p50']:8.1f} us, p99 {stats['p99']:8.1f} us")
+
+    def benchmark_tills(self, tills, scans_per_till, rng):
+        barcodes = list(
+            Drug.objects.filter(is_active=True, barcode__isnull=False).exclude(barcode='')
+            .values_list('barcode', flat=True)
+        )
+        scans = [make_scans(barcodes, scans_per_till, rng) for _ in range(tills)]
+        get_barcode_index()
+
+        # Both lookups must pick the same drug for every scan
+        mismatches = sum(
+            1 for till_scans in scans for barcode in till_scans
+            if legacy_find_drug_by_barcode(barcode) != find_drug_by_barcode(barcode)
+        )
+        self.stdout.write(f"Index and legacy lookups disagree on {mismatches} of {tills * scans_per_till} scans.")
+
+        self.stdout.write(f"{tills} tills x {scans_per_till} scans over {len(barcodes)} barcoded drugs:")
+        for label, lookup in [('legacy queries', legacy_find_drug_by_barcode),
+                              ('barcode index', find_drug_by_barcode)]:
+            timings = []
+            lock = threading.Lock()
+
+            def till(till_scans):
+                local = []
+                try:
+                    for barcode in till_scans:
+                        started = time.perf_counter()
+                        lookup(barcode)
+                        local.append((time.perf_counter() - started) * 1000)
+                finally:
+                    connection.close()
+                with lock:
+                    timings.extend(local)
+
+            threads = [threading.Thread(target=till, args=(till_scans,)) for till_scans in scans]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            stats = percentiles(timings)
+            self.stdout.write(
+                f"  {label:>15}: p50 {stats['p50']:7.2f} ms, p99 {stats['p99']:7.2f} ms, "
+                f"{len(timings) / elapsed:7.0f} scans/s"
+            )
@@ -0,0 +1,156 @@
+from datetime import date
+from decimal import Decimal
+import os
+import tempfile
+import time
+import tracemalloc
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from openpyxl import load_workbook
+import xlsxwriter
+
+from pharmacy_app.drug_imports import import_drugs
+from pharmacy_app.models import Drug, InventoryLog
+
+BENCH_NAME_PREFIX = 'BENCH-IMPORT-'
+
+
+class Rollback(Exception):
+    pass
+
+
+def make_drug_workbook(path, rows, bad_every):
+    """Write a drug import sheet with a header and `rows` drug rows, every `bad_every`th one invalid"""
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    sheet = workbook.add_worksheet('Drugs')
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+    sheet.write_row(0, 0, ['Name', 'Brand', 'Description', 'Stock Quantity', 'Cost Price',
+                           'Selling Price', 'Reorder Level', 'Expiry Date', 'Batch Number'])
+    for n in range(rows):
+        stock = 'lots' if bad_every and n % bad_every == bad_every - 1 else n % 500
+        sheet.write_row(n + 1, 0, [
+            f"{BENCH_NAME_PREFIX}{n:06d}", 'Benchmark', 'Generated drug', stock,
+            round(1 + n % 90 * 0.5, 2), round(2 + n % 90 * 0.75, 2), 10,
+        ])
+        sheet.write_datetime(n + 1, 7, date(2030, 1 + n % 12, 1), date_format)
+        sheet.write(n + 1, 8, f"B{n % 1000:04d}")
+    workbook.close()
+
+
+def legacy_import_drugs(path, user=None):
+    """The import loop drug_import ran before the bulk import engine"""
+    workbook = load_workbook(path)
+    sheet = workbook.active
+    imported = 0
+    errors = 0
+    for row in sheet.iter_rows(min_row=2):
+        try:
+            drug_data = {
+                'name': row[0].value,
+                'brand': row[1].value,
+                'description': row[2].value,
+                'stock_quantity': int(row[3].value or 0),
+                'cost_price': float(row[4].value or 0),
+                'selling_price': float(row[5].value or 0),
+                'reorder_level': int(row[6].value or 0),
+                'expiry_date': row[7].value,
+                'batch_number': row[8].value,
+            }
+            drug, created = Drug.objects.update_or_create(
+                name=drug_data['name'],
+                brand=drug_data['brand'],
+                defaults=drug_data
+            )
+            if created:
+                InventoryLog.objects.create(
+                    drug=drug,
+                    quantity_change=drug.stock_quantity,
+                    operation_type='ADD',
+                    notes="Initial stock from Excel import",
+                    user=user
+                )
+            imported += 1
+        except Exception:
+            errors += 1
+    return imported, errors
+
+
+def bulk_import_drugs(path, chunk_size):
+    result = import_drugs(path, chunk_size=chunk_size)
+    if result.error_report:
+        default_storage.delete(result.error_report)
+    return result.imported, len(result.errors)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the drug spreadsheet import: bulk chunked engine vs the old per-row update_or_create loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help='Rows in the generated import sheet')
+        parser.add_argument('--existing', type=float, default=0.2,
+                            help='Fraction of the rows that update drugs which already exist')
+        parser.add_argument('--bad-every', type=int, default=100, help='Make every Nth row invalid (0 for none)')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Rows per chunk (default DRUG_IMPORT_CHUNK_SIZE)')
+        parser.add_argument('--legacy-rows', type=int, default=5000,
+                            help='Rows imported with the old loop for comparison (0 to skip)')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            runs = [('bulk', options['rows'], lambda path: bulk_import_drugs(path, options['chunk_size']))]
+            if options['legacy_rows']:
+                runs.append(('legacy', options['legacy_rows'], legacy_import_drugs))
+
+            self.stdout.write(f"{'import':>8} {'rows':>8} {'seconds':>8} {'rows/s':>8} {'queries':>8} "
+                              f"{'peak MB':>8} {'imported':>9} {'errors':>7}")
+            for label, rows, run in runs:
+                path = os.path.join(tmpdir, f"drugs_{rows}.xlsx")
+                if not os.path.exists(path):
+                    make_drug_workbook(path, rows, options['bad_every'])
+                self.measure(label, rows, run, path, int(rows * options['existing']))
+        self.stdout.write("Imported drugs rolled back.")
+
+    def create_existing(self, count, batch_size=5000):
+        """Insert the drugs the first `count` sheet rows will update: a restock with new prices"""
+        for offset in range(0, count, batch_size):
+            Drug.objects.bulk_create([
+                Drug(
+                    name=f"{BENCH_NAME_PREFIX}{n:06d}",
+                    brand='Benchmark',
+                    description='Generated drug',
+                    stock_quantity=0,
+                    cost_price=Decimal('1.00'),
+                    selling_price=Decimal('2.00'),
+                    reorder_level=10,
+                    expiry_date=date(2030, 1 + n % 12, 1),
+                    batch_number=f"B{n % 1000:04d}",
+                )
+                for n in range(offset, min(offset + batch_size, count))
+            ])
+
+    def measure(self, label, rows, run, path, existing):
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        try:
+            with transaction.atomic():
+                self.create_existing(existing)
+                with connection.execute_wrapper(count_queries):
+                    tracemalloc.start()
+                    started = time.perf_counter()
+                    imported, errors = run(path)
+                    elapsed = time.perf_counter() - started
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                raise Rollback()
+        except Rollback:
+            pass
+
+        self.stdout.write(
+            f"{label:>8} {rows:>8} {elapsed:>8.2f} {rows / elapsed:>8.0f} {queries[0]:>8} "
+            f"{peak / 1024 / 1024:>8.1f} {imported:>9} {errors:>7}"
+        )
@@ -0,0 +1,85 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from pharmacy_app.matching import DrugMatchIndex, build_search_terms
+
+
+SYLLABLES = ['am', 'ox', 'cil', 'lin', 'pra', 'zol', 'met', 'for', 'min', 'ator',
+             'va', 'sta', 'tin', 'cet', 'iri', 'zine', 'par', 'ace', 'ta', 'mol',
+             'ibu', 'pro', 'fen', 'dex', 'lor', 'ata', 'dine', 'lev', 'thy', 'rox']
+BRANDS = ['Pfizer', 'Novartis', 'Sanofi', 'Bayer', 'Roche', 'Merck', 'Abbott',
+          'Teva', 'Cipla', 'Sandoz', 'Hikma', 'Julphar', 'Pioneer', 'Sama']
+
+
+def make_catalogue(size, rng):
+    """Generate a synthetic drug catalogue of the given size"""
+    drugs = []
+    for drug_id in range(1, size + 1):
+        name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        strength = f"{rng.choice([5, 10, 20, 50, 100, 250, 500])}mg"
+        drugs.append({'id': drug_id, 'name': f"{name} {strength}", 'brand': rng.choice(BRANDS)})
+    return drugs
+
+
+def add_noise(text, rng):
+    """Introduce an OCR-like typo into a string"""
+    if len(text) < 4:
+        return text
+    pos = rng.randrange(len(text))
+    return text[:pos] + rng.choice(string.ascii_lowercase) + text[pos + 1:]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the trigram drug matcher against a full catalogue scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,30000',
+                            help='Comma separated catalogue sizes to benchmark')
+        parser.add_argument('--items', type=int, default=200,
+                            help='Number of invoice lines to match per catalogue')
+        parser.add_argument('--full-scan-limit', type=int, default=10000,
+                            help='Largest catalogue size for which the full scan is also timed')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        sizes = [int(size) for size in options['sizes'].split(',')]
+
+        self.stdout.write(f"{'drugs':>8} {'build s':>8} {'index ms/item':>14} "
+                          f"{'scan ms/item':>13} {'agreement':>10}")
+
+        for size in sizes:
+            drugs = make_catalogue(size, rng)
+            queries = []
+            for drug in rng.sample(drugs, min(options['items'], size)):
+                queries.append((add_noise(drug['name'], rng), drug['brand']))
+
+            start = time.perf_counter()
+            index = DrugMatchIndex(drugs)
+            build_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            index_results = [index.best_match(name, brand) for name, brand in queries]
+            index_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            scan_ms = None
+            agreement = None
+            if size <= options['full_scan_limit']:
+                start = time.perf_counter()
+                scan_scores = []
+                for name, brand in queries:
+                    terms = build_search_terms(name, brand)
+                    search_brand = brand.lower()
+                    scan_scores.append(max(index.score(drug_id, terms, search_brand) for drug_id in index.drugs))
+                scan_ms = (time.perf_counter() - start) * 1000 / len(queries)
+                same = sum(1 for (_, score), best in zip(index_results, scan_scores) if score == best)
+                agreement = same / len(queries)
+
+            self.stdout.write(
+                f"{size:>8} {build_time:>8.2f} {index_ms:>14.2f} "
+                f"{(f'{scan_ms:.2f}' if scan_ms is not None else '-'):>13} "
+                f"{(f'{agreement:.0%}' if agreement is not None else '-'):>10}"
+            )
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+from io import BytesIO
+import multiprocessing
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+import xlsxwriter
+
+from pharmacy_app.utils import write_xlsx
+
+
+def sales_rows(count):
+    """Yield a header and `count` synthetic rows shaped like the sales report export"""
+    yield ['Invoice #', 'Date', 'Patient Name', 'Total Amount', 'Items Count', 'Payment Method', 'Status']
+    start = datetime(2025, 1, 1)
+    for n in range(count):
+        yield [
+            f"INV-{n:09d}",
+            (start + timedelta(seconds=30 * n)).strftime('%Y-%m-%d %H:%M'),
+            'Walk-In Customer' if n % 3 else f"Patient {n % 5000}",
+            float(10 + n % 250),
+            1 + n % 12,
+            'Cash',
+            'Paid',
+        ]
+
+
+def write_in_memory(count):
+    """The previous export path: default xlsxwriter mode into a BytesIO"""
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output)
+    worksheet = workbook.add_worksheet('Sales Report')
+    header_format = workbook.add_format({'bold': True, 'bg_color': '#f2f2f2'})
+    for row_number, row in enumerate(sales_rows(count)):
+        worksheet.write_row(row_number, 0, row, header_format if row_number == 0 else None)
+    workbook.close()
+    return len(output.getvalue())
+
+
+def write_streamed(count):
+    """The current export path: constant_memory workbook written to a temp file, as report jobs do"""
+    with tempfile.TemporaryFile(suffix='.xlsx') as output:
+        write_xlsx(output, [('Sales Report', sales_rows(count))])
+        return output.tell()
+
+
+MODES = {'in-memory': write_in_memory, 'constant-memory': write_streamed}
+
+
+def measure(mode, count, results):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    size = MODES[mode](count)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((size, elapsed, baseline / 1024, peak / 1024))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark peak RSS and time of the Excel report export across row counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Comma separated row counts')
+        parser.add_argument('--modes', default=','.join(MODES),
+                            help=f"Comma separated export modes ({', '.join(MODES)})")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        modes = options['modes'].split(',')
+        # Each run gets a fresh process so its peak RSS is not inherited from a previous run
+        context = multiprocessing.get_context('spawn')
+
+        self.stdout.write(f"{'mode':>16} {'rows':>9} {'seconds':>8} {'file MB':>8} {'start MB':>9} {'peak MB':>8}")
+        for mode in modes:
+            for count in sizes:
+                results = context.Queue()
+                process = context.Process(target=measure, args=(mode, count, results))
+                process.start()
+                size, elapsed, baseline, peak = results.get()
+                process.join()
+                self.stdout.write(
+                    f"{mode:>16} {count:>9} {elapsed:>8.1f} {size / 1024 / 1024:>8.1f} "
+                    f"{baseline:>9.1f} {peak:>8.1f}"
+                )
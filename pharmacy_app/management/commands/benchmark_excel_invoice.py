@@ -0,0 +1,72 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+import openpyxl
+import xlsxwriter
+
+from pharmacy_app.invoice_processing import iter_excel_invoice_rows
+
+
+def make_invoice_workbook(path, rows):
+    """Write a synthetic supplier price list with a header and `rows` item lines.
+
+    Uses xlsxwriter like most spreadsheet software, writing the sheet's
+    dimension record up front; openpyxl's write-only mode omits it, which
+    makes read-only loading scan the whole sheet.
+    """
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    sheet = workbook.add_worksheet('Invoice')
+    sheet.write_row(0, 0, ['Supplier Price List'])
+    sheet.write_row(1, 0, ['Drug Name', 'Brand', 'Qty', 'Unit Price'])
+    for n in range(rows):
+        sheet.write_row(n + 2, 0, [
+            f"Amoxicillin {250 + n % 500}mg Capsules", 'Pfizer', n % 50 + 1, round(1.5 + n % 300 * 0.25, 2)
+        ])
+    sheet.write_row(rows + 2, 0, ['Total'])
+    workbook.close()
+
+
+def parse_full(path):
+    """Previous approach: full-mode workbook with per-cell lookups"""
+    workbook = openpyxl.load_workbook(path, data_only=True)
+    sheet = workbook.active
+    count = 0
+    for row_idx, _ in enumerate(sheet.iter_rows(min_row=3), 3):
+        name = sheet.cell(row=row_idx, column=1).value
+        price = sheet.cell(row=row_idx, column=4).value
+        if name and price:
+            count += 1
+    return count
+
+
+def parse_streaming(path):
+    """Read-only streaming parser used by invoice processing"""
+    return sum(1 for name, _, price, _ in iter_excel_invoice_rows(path) if name and price)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark full-mode vs read-only streaming parsing of Excel invoices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Numbers of item rows in the generated workbooks')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'rows':>8} {'parser':>10} {'seconds':>8} {'peak MB':>8} {'items':>8}")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for size in options['sizes']:
+                path = os.path.join(tmpdir, f"invoice_{size}.xlsx")
+                make_invoice_workbook(path, size)
+                for label, parse in (('full', parse_full), ('streaming', parse_streaming)):
+                    tracemalloc.start()
+                    started = time.perf_counter()
+                    count = parse(path)
+                    elapsed = time.perf_counter() - started
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    self.stdout.write(
+                        f"{size:>8} {label:>10} {elapsed:>8.2f} {peak / 1024 / 1024:>8.1f} {count:>8}"
+                    )
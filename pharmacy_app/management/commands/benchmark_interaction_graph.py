@@ -0,0 +1,70 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from pharmacy_app.interactions import InteractionGraph
+
+
+SEVERITIES = ['SEVERE', 'MODERATE', 'MILD', 'NONE']
+
+
+def make_interactions(count, drug_count, rng):
+    """Generate synthetic (id, drug_one_id, drug_two_id, severity, description) rows"""
+    rows = []
+    for interaction_id in range(1, count + 1):
+        drug_one_id, drug_two_id = rng.sample(range(1, drug_count + 1), 2)
+        severity = rng.choice(SEVERITIES)
+        rows.append((interaction_id, drug_one_id, drug_two_id, severity,
+                     f"Combined use may alter plasma levels ({severity.lower()} risk, ref {interaction_id})."))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Benchmark building and querying the in-memory drug interaction graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interactions', type=int, default=100000)
+        parser.add_argument('--drugs', type=int, default=20000)
+        parser.add_argument('--baskets', type=int, default=10000,
+                            help='Number of sale baskets to check')
+        parser.add_argument('--basket-size', type=int, default=12)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rows = make_interactions(options['interactions'], options['drugs'], rng)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        graph = InteractionGraph(rows)
+        build_time = time.perf_counter() - start
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        baskets = [rng.sample(range(1, options['drugs'] + 1), options['basket_size'])
+                   for _ in range(options['baskets'])]
+
+        start = time.perf_counter()
+        found = 0
+        for basket in baskets:
+            for i in range(len(basket)):
+                for j in range(i + 1, len(basket)):
+                    if graph.get(basket[i], basket[j]):
+                        found += 1
+        basket_us = (time.perf_counter() - start) * 1e6 / len(baskets)
+
+        start = time.perf_counter()
+        for basket in baskets:
+            for drug_id in basket:
+                graph.neighbours(drug_id)
+        neighbour_us = (time.perf_counter() - start) * 1e6 / (len(baskets) * options['basket_size'])
+
+        pairs = options['basket_size'] * (options['basket_size'] - 1) // 2
+        self.stdout.write(f"Interactions loaded:   {graph.size}")
+        self.stdout.write(f"Build time:            {build_time:.2f}s")
+        self.stdout.write(f"Graph memory:          {memory / 1024 / 1024:.1f} MB")
+        self.stdout.write(f"Basket check:          {basket_us:.1f} us per {options['basket_size']}-drug basket "
+                          f"({pairs} pairs, {found} interactions found)")
+        self.stdout.write(f"Neighbour lookup:      {neighbour_us:.2f} us per drug")
@@ -0,0 +1,105 @@
+import threading
+import time
+import uuid
+from datetime import datetime, time as day_time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.utils import timezone
+
+from pharmacy_app.models import Sale
+
+STRESS_NOTE = 'benchmark_invoice_numbers'
+
+
+def legacy_invoice_number(day):
+    """The random four digit suffix used before invoice numbers came from a sequence"""
+    return f"INV-{day.strftime('%Y%m%d')}-{str(uuid.uuid4().int)[:4]}"
+
+
+class Command(BaseCommand):
+    help = 'Stress test invoice numbering by creating many sales on one day from concurrent threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sales', type=int, default=10000, help='Number of sales to create')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent threads creating sales')
+        parser.add_argument('--date', default='2000-01-01',
+                            help='Day the sales are dated (YYYY-MM-DD); pick one without real sales')
+        parser.add_argument('--legacy', action='store_true',
+                            help='Number sales with the old random suffix instead, for comparison')
+        parser.add_argument('--keep', action='store_true', help='Do not delete the created sales afterwards')
+        parser.add_argument('--i-know-this-writes', action='store_true',
+                            help='Run even though DEBUG is off; the sales are written to the configured database')
+
+    def handle(self, *args, **options):
+        # The threads commit on their own connections, so the sales cannot be rolled back
+        if not (settings.DEBUG or options['i_know_this_writes']):
+            raise CommandError("This benchmark writes sales to the configured database. "
+                               "Run it with DEBUG on or pass --i-know-this-writes.")
+        try:
+            day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError("--date must be YYYY-MM-DD")
+        sale_date = timezone.make_aware(datetime.combine(day, day_time(12)))
+        total = options['sales']
+        threads = options['threads']
+
+        created = []
+        errors = {'collisions': 0, 'other': 0}
+        lock = threading.Lock()
+
+        def create_sales(count):
+            try:
+                for _ in range(count):
+                    sale = Sale(date=sale_date, notes=STRESS_NOTE)
+                    if options['legacy']:
+                        sale.invoice_number = legacy_invoice_number(day)
+                    try:
+                        # One transaction per sale, like a till checkout
+                        with transaction.atomic():
+                            sale.save()
+                    except IntegrityError:
+                        with lock:
+                            errors['collisions'] += 1
+                        continue
+                    except DatabaseError as e:
+                        with lock:
+                            errors['other'] += 1
+                        self.stderr.write(f"Sale failed: {e}")
+                        continue
+                    with lock:
+                        created.append(sale.invoice_number)
+            finally:
+                connection.close()
+
+        per_thread = [total // threads + (1 if i < total % threads else 0) for i in range(threads)]
+        workers = [threading.Thread(target=create_sales, args=(count,)) for count in per_thread if count]
+
+        try:
+            self.stdout.write(f"Creating {total} sales dated {day} from {len(workers)} thread(s)...")
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+
+            distinct = len(set(created))
+            self.stdout.write(
+                f"Created {len(created)} sales in {elapsed:.2f}s ({len(created) / elapsed:.0f} sales/s), "
+                f"{distinct} distinct invoice numbers"
+            )
+            if errors['collisions']:
+                self.stdout.write(self.style.ERROR(
+                    f"{errors['collisions']} sale(s) aborted by duplicate invoice numbers"
+                ))
+            if errors['other']:
+                self.stdout.write(self.style.ERROR(f"{errors['other']} sale(s) failed with other database errors"))
+            if distinct == len(created) == total:
+                self.stdout.write(self.style.SUCCESS("Every sale got a unique invoice number."))
+        finally:
+            if not options['keep']:
+                with transaction.atomic():
+                    deleted, _ = Sale.objects.filter(notes=STRESS_NOTE, date=sale_date).delete()
+                self.stdout.write(f"Deleted {deleted} benchmark row(s).")
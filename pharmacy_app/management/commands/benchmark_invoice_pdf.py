@@ -0,0 +1,53 @@
+import itertools
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy_app.invoice_pdf import get_invoice_pdf, invoice_context, render_invoice_pdf, _invoice_pdf_cache_key
+from pharmacy_app.models import Sale
+from pharmacy_app.utils import render_to_pdf
+
+
+class Command(BaseCommand):
+    help = 'Benchmark rendering sequential sale invoice PDFs (old page template vs print template vs cache)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100,
+                            help='Number of invoices to render (the latest sales are reused if there are fewer)')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        sales = list(
+            Sale.objects.select_related('patient', 'user').prefetch_related('saleitems').order_by('-id')[:count]
+        )
+        if not sales:
+            raise CommandError("There are no sales to render.")
+        invoices = list(itertools.islice(itertools.cycle(sales), count))
+
+        def page_template(sale):
+            # The previous path: the full screen invoice page through render_to_pdf
+            return render_to_pdf('sales/invoice.html', invoice_context(sale, sale.saleitems.all()))
+
+        def print_template(sale):
+            return render_invoice_pdf(sale, sale.saleitems.all())
+
+        cache.delete_many([_invoice_pdf_cache_key(sale.id) for sale in sales])
+        runs = [
+            ('page template', page_template),
+            ('print template', print_template),
+            ('cached, first print', get_invoice_pdf),
+            ('cached, reprint', get_invoice_pdf),
+        ]
+
+        self.stdout.write(f"Rendering {count} invoices ({len(sales)} distinct sales)")
+        self.stdout.write(f"{'path':>20} {'total s':>8} {'ms/invoice':>11} {'avg KB':>7}")
+        for label, render in runs:
+            size = 0
+            started = time.perf_counter()
+            for sale in invoices:
+                size += len(render(sale) or b'')
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{label:>20} {elapsed:>8.2f} {elapsed * 1000 / count:>11.1f} {size / count / 1024:>7.1f}"
+            )
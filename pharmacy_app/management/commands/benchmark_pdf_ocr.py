@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+from queue import Empty
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from pdf2image import convert_from_path
+import pytesseract
+
+from pharmacy_app.ocr import ocr_pdf_pages
+
+
+def make_invoice_pdf(path, pages, lines_per_page=40):
+    """Write a synthetic multi-page supplier invoice PDF"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    pdf = canvas.Canvas(path, pagesize=A4)
+    width, height = A4
+    for page in range(1, pages + 1):
+        pdf.setFont('Helvetica-Bold', 14)
+        pdf.drawString(50, height - 50, f"Invoice #BENCH-001    Date: 01/03/2025    Page {page}")
+        pdf.setFont('Helvetica', 10)
+        for line in range(lines_per_page):
+            y = height - 90 - line * 18
+            pdf.drawString(50, y, f"{line + 1} x Amoxicillin {250 + line}mg (Pfizer) ${line + 1}.50")
+        pdf.showPage()
+    pdf.save()
+
+
+def run_mode(mode, path, workers, queue):
+    """Run one OCR strategy in a separate process and report time and peak memory"""
+    try:
+        started = time.perf_counter()
+        if mode == 'full':
+            # Previous approach: rasterise the whole document up front
+            images = convert_from_path(path)
+            text = "".join(pytesseract.image_to_string(image) for image in images)
+        else:
+            text = "".join(ocr_pdf_pages(path, max_workers=workers).values())
+        elapsed = time.perf_counter() - started
+    except Exception as e:
+        queue.put(f"{type(e).__name__}: {e}")
+        return
+
+    own_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    queue.put((elapsed, own_rss, child_rss, len(text)))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark full-document vs page-streaming pooled OCR on a synthetic PDF invoice'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('spawn')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'invoice.pdf')
+            make_invoice_pdf(path, options['pages'])
+            self.stdout.write(f"Generated {options['pages']}-page invoice at {path}")
+            self.stdout.write(f"{'mode':>22} {'seconds':>8} {'peak RSS MB':>12} {'worker RSS MB':>14}")
+
+            modes = [
+                ('full', 1, 'full document'),
+                ('stream', 1, 'streamed, 1 worker'),
+                ('stream', options['workers'], f"streamed, {options['workers']} workers"),
+            ]
+            for mode, workers, label in modes:
+                # Each run gets a fresh process so peak RSS figures are independent
+                queue = context.Queue()
+                process = context.Process(target=run_mode, args=(mode, path, workers, queue))
+                process.start()
+                result = self.wait_for_result(process, queue)
+                if isinstance(result, str):
+                    raise CommandError(f"{label} run failed: {result}")
+
+                elapsed, own_rss, child_rss, _ = result
+                # ru_maxrss is reported in kilobytes on Linux
+                self.stdout.write(
+                    f"{label:>22} {elapsed:>8.1f} {own_rss / 1024:>12.0f} {child_rss / 1024:>14.0f}"
+                )
+
+    def wait_for_result(self, process, queue):
+        """Wait for a benchmark process to report, without hanging if it dies"""
+        while True:
+            try:
+                result = queue.get(timeout=1)
+                break
+            except Empty:
+                if not process.is_alive():
+                    result = f"process exited with code {process.exitcode}"
+                    break
+        process.join()
+        return result
@@ -0,0 +1,100 @@
+from datetime import timedelta
+from decimal import Decimal
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from pharmacy_app.models import Sale
+from pharmacy_app.pagination import encode_cursor, keyset_page
+from pharmacy_app.utils import start_of_day
+from pharmacy_app.views import SALE_LIST_ORDERING
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark sale list page latency (keyset vs OFFSET) over generated sales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sales', type=int, default=1000000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the generated sales instead of rolling them back')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.generate(options['sales'])
+                self.measure(options)
+                if not options['keep']:
+                    raise Rollback()
+        except Rollback:
+            self.stdout.write("Generated sales rolled back.")
+
+    def generate(self, count, batch_size=10000):
+        """Insert `count` sales spread over the last three years"""
+        now = timezone.now()
+        span = timedelta(days=3 * 365).total_seconds()
+        started = time.perf_counter()
+        for offset in range(0, count, batch_size):
+            Sale.objects.bulk_create([
+                Sale(
+                    invoice_number=f"BENCH-{n:09d}",
+                    date=now - timedelta(seconds=span * n / count),
+                    subtotal=Decimal('10.00'),
+                    total_amount=Decimal('10.00'),
+                )
+                for n in range(offset, min(offset + batch_size, count))
+            ], batch_size=batch_size)
+        self.stdout.write(f"Inserted {count} sales in {time.perf_counter() - started:.1f}s")
+
+    def timed(self, func, repeat):
+        """Return the median wall time of func() in milliseconds"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def measure(self, options):
+        page_size = options['page_size']
+        repeat = options['repeat']
+        sales = Sale.objects.select_related('patient', 'user')
+        total = sales.count()
+
+        self.stdout.write(f"{'depth':>8} {'row':>9} {'keyset ms':>10} {'offset ms':>10}")
+        for depth in (0, 0.01, 0.1, 0.5, 0.9):
+            position = int(total * depth)
+            cursor = None
+            if position:
+                # Cursor of the row just before the page, as the view would have issued it
+                last = sales.order_by(*SALE_LIST_ORDERING).values_list('date', 'id')[position - 1]
+                cursor = encode_cursor(list(last))
+            keyset_ms = self.timed(
+                lambda: keyset_page(sales, SALE_LIST_ORDERING, cursor, page_size), repeat
+            )
+            offset_ms = self.timed(
+                lambda: list(sales.order_by(*SALE_LIST_ORDERING)[position:position + page_size]), repeat
+            )
+            self.stdout.write(f"{depth:>8.0%} {position:>9} {keyset_ms:>10.2f} {offset_ms:>10.2f}")
+
+        # A one-week date filter, as the old __date lookups and as a half-open range
+        last_day = timezone.localdate() - timedelta(days=365)
+        first_day = last_day - timedelta(days=6)
+        cast_ms = self.timed(
+            lambda: list(sales.filter(date__date__gte=first_day, date__date__lte=last_day)
+                         .order_by(*SALE_LIST_ORDERING)[:page_size]), repeat
+        )
+        range_ms = self.timed(
+            lambda: list(sales.filter(date__gte=start_of_day(first_day),
+                                      date__lt=start_of_day(last_day + timedelta(days=1)))
+                         .order_by(*SALE_LIST_ORDERING)[:page_size]), repeat
+        )
+        self.stdout.write(f"One-week filter: date__date {cast_ms:.2f} ms, half-open range {range_ms:.2f} ms")
@@ -0,0 +1,76 @@
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from pharmacy_app.invoice_pdf import invoice_batch_sales, write_invoice_batch
+from pharmacy_app.reports import report_filename
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = "Render the invoices of a day's (or a date range's) sales into one merged PDF or a ZIP of PDFs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Print the invoices of this day (YYYY-MM-DD, default today)')
+        parser.add_argument('--from', dest='start', help='First day of a date range (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='end', help='Last day of a date range (YYYY-MM-DD, default --from)')
+        parser.add_argument('--zip', action='store_true', help='Write a ZIP with one PDF per invoice')
+        parser.add_argument('--workers', type=int, default=settings.INVOICE_BATCH_WORKERS,
+                            help='Processes used to render invoices')
+        parser.add_argument('--output', help='File to write (default Invoices_<from>_to_<to>.pdf/.zip)')
+
+    def handle(self, *args, **options):
+        if options['date'] and options['start']:
+            raise CommandError("Use either --date or --from/--to")
+        if options['start']:
+            start_date = parse_date(options['start'])
+            end_date = parse_date(options['end']) if options['end'] else start_date
+        else:
+            start_date = end_date = parse_date(options['date']) if options['date'] else timezone.now().date()
+        if start_date > end_date:
+            raise CommandError("--to must not be before --from")
+
+        export_format = 'ZIP' if options['zip'] else 'PDF'
+        output_path = options['output'] or report_filename(
+            'INVOICES', start_date, end_date, export_format.lower()
+        )
+
+        total = invoice_batch_sales(start_date, end_date).count()
+        if not total:
+            raise CommandError(f"There are no sales between {start_date} and {end_date}.")
+        self.stdout.write(
+            f"Rendering {total} invoice(s) from {start_date} to {end_date} with {options['workers']} worker(s)..."
+        )
+
+        step = max(1, total // 20)
+
+        def report_progress(done, total):
+            if done % step == 0 or done == total:
+                self.stdout.write(f"  {done}/{total} invoices ({done * 100 // total}%)")
+
+        started = time.monotonic()
+        try:
+            with open(output_path, 'wb') as output:
+                written, failed = write_invoice_batch(
+                    start_date, end_date, export_format, output,
+                    max_workers=options['workers'], progress_callback=report_progress,
+                )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if failed:
+            self.stderr.write(self.style.WARNING(
+                f"{len(failed)} invoice(s) could not be rendered: {', '.join(failed)}"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} invoice(s) to {output_path} in {time.monotonic() - started:.1f}s"
+        ))
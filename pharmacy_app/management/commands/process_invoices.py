@@ -0,0 +1,81 @@
+import os
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+
+from pharmacy_app.invoice_processing import (
+    claim_next_invoice, release_stale_invoices, run_claimed_invoice
+)
+
+
+class Command(BaseCommand):
+    help = 'Run background workers that process pending uploaded invoices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of concurrent worker threads in this process')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait before checking an empty queue again')
+        parser.add_argument('--stale-timeout', type=int, default=3600,
+                            help='Requeue invoices stuck in PROCESSING for this many seconds')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling forever')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.stop_event = threading.Event()
+        base_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        released = release_stale_invoices(options['stale_timeout'])
+        if released:
+            self.stdout.write(self.style.WARNING(f"Requeued {released} stale invoice(s)."))
+
+        threads = [
+            threading.Thread(target=self.work, args=(f"{base_id}:{n}",), daemon=True)
+            for n in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+
+        self.stdout.write(f"Started {len(threads)} invoice worker(s) on {base_id}.")
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers after their current invoice...")
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+    def work(self, worker_id):
+        """Claim and process invoices until stopped (or the queue is empty with --once)"""
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                try:
+                    invoice = claim_next_invoice(worker_id)
+                except OperationalError as e:
+                    # Lock contention or a dropped connection; back off and retry
+                    self.stderr.write(f"[{worker_id}] Could not claim an invoice: {e}")
+                    self.stop_event.wait(self.options['poll_interval'])
+                    continue
+
+                if invoice is None:
+                    if self.options['once']:
+                        break
+                    self.stop_event.wait(self.options['poll_interval'])
+                    continue
+
+                started = time.monotonic()
+                self.stdout.write(f"[{worker_id}] Processing invoice {invoice.id}")
+                run_claimed_invoice(invoice)
+                self.stdout.write(
+                    f"[{worker_id}] Invoice {invoice.id} finished as {invoice.processing_status} "
+                    f"in {time.monotonic() - started:.1f}s"
+                )
+        finally:
+            connection.close()
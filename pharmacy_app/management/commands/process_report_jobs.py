@@ -0,0 +1,67 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+
+from pharmacy_app.report_jobs import (
+    claim_next_report_job, delete_expired_report_jobs, release_stale_report_jobs, run_report_job
+)
+
+
+class Command(BaseCommand):
+    help = 'Run a background worker that renders queued report exports and invoice batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait before checking an empty queue again')
+        parser.add_argument('--stale-timeout', type=int, default=3600,
+                            help='Requeue report jobs stuck in PROCESSING for this many seconds')
+        parser.add_argument('--cleanup-interval', type=int, default=300,
+                            help='Seconds between sweeps that delete expired report files')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling forever')
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        released = release_stale_report_jobs(options['stale_timeout'])
+        if released:
+            self.stdout.write(self.style.WARNING(f"Requeued {released} stale report job(s)."))
+
+        self.stdout.write(f"Started report worker {worker_id}.")
+        last_cleanup = None
+        try:
+            while True:
+                close_old_connections()
+                if last_cleanup is None or time.monotonic() - last_cleanup >= options['cleanup_interval']:
+                    deleted = delete_expired_report_jobs()
+                    if deleted:
+                        self.stdout.write(f"Deleted {deleted} expired report export(s).")
+                    last_cleanup = time.monotonic()
+
+                try:
+                    job = claim_next_report_job(worker_id)
+                except OperationalError as e:
+                    # Lock contention or a dropped connection; back off and retry
+                    self.stderr.write(f"Could not claim a report job: {e}")
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                started = time.monotonic()
+                self.stdout.write(f"Rendering report job {job.id} ({job})")
+                run_report_job(job)
+                self.stdout.write(
+                    f"Report job {job.id} finished as {job.status} in {time.monotonic() - started:.1f}s"
+                )
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping report worker.")
+        finally:
+            connection.close()
@@ -0,0 +1,21 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from pharmacy_app.rollups import rebuild_daily_sales
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollup tables from the raw sales and sale items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='first_day', type=date.fromisoformat,
+                            help='First day to rebuild (YYYY-MM-DD); defaults to the first sale')
+        parser.add_argument('--to', dest='last_day', type=date.fromisoformat,
+                            help='Last day to rebuild (YYYY-MM-DD); defaults to the latest sale')
+
+    def handle(self, *args, **options):
+        days, drug_rows = rebuild_daily_sales(options['first_day'], options['last_day'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {days} daily summaries and {drug_rows} daily drug rows."
+        ))
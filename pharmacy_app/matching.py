@@ -0,0 +1,166 @@
+from collections import Counter, defaultdict
+from fuzzywuzzy import fuzz
+import threading
+import time
+
+from .utils import bump_cache_version_on_commit, cache_version, index_is_current
+
+# Similarity thresholds used when auto-matching invoice items
+MATCH_THRESHOLD = 70  # 70% similarity or better is a match
+PARTIAL_MATCH_THRESHOLD = 50  # 50-70% similarity is a partial match
+
+# Bonus applied when the extracted brand equals the drug brand exactly
+BRAND_BONUS = 20
+
+# Number of trigram candidates passed on to the fuzzy rerank
+CANDIDATE_LIMIT = 50
+
+# Trigrams found in more than this share of drugs carry almost no signal and
+# are only used when the rarer trigrams produce no candidates at all
+COMMON_TRIGRAM_RATIO = 0.05
+
+INDEX_VERSION_KEY = 'drug_match_index_version'
+INDEX_MAX_AGE = 300
+
+
+def trigrams(text):
+    """Return the set of padded character trigrams for a string"""
+    text = f"  {text.strip()} " if text else ""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def build_search_terms(name, brand):
+    """Build the lower-cased name/brand combinations used for fuzzy matching"""
+    name = name.lower() if name else ""
+    brand = brand.lower() if brand else ""
+
+    terms = []
+    if name:
+        terms.append(name)
+    if brand:
+        terms.append(brand)
+        if name:
+            terms.append(f"{name} {brand}")
+            terms.append(f"{brand} {name}")
+    return terms
+
+
+class DrugMatchIndex:
+    """Trigram index over drug names and brands.
+
+    Candidate drugs are found through an inverted trigram index and only the
+    best candidates are reranked with the same fuzzy scoring that was
+    previously applied to the whole catalogue.
+    """
+
+    def __init__(self, drugs, version=None):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.drugs = {}
+        self.postings = defaultdict(list)
+
+        for drug in drugs:
+            drug_name = drug['name'].lower() if drug['name'] else ""
+            drug_brand = drug['brand'].lower() if drug['brand'] else ""
+            self.drugs[drug['id']] = {
+                'id': drug['id'],
+                'name': drug['name'],
+                'brand': drug['brand'],
+                'match_brand': drug_brand,
+                'match_strings': build_search_terms(drug_name, drug_brand),
+            }
+            for gram in trigrams(drug_name) | trigrams(drug_brand):
+                self.postings[gram].append(drug['id'])
+
+        self.common_limit = max(CANDIDATE_LIMIT, int(len(self.drugs) * COMMON_TRIGRAM_RATIO))
+
+    def __len__(self):
+        return len(self.drugs)
+
+    def is_current(self, drug_id, name, brand):
+        """Check whether the index already holds this drug with the same name and brand"""
+        drug = self.drugs.get(drug_id)
+        return drug is not None and drug['name'] == name and drug['brand'] == brand
+
+    def candidates(self, name, brand=None, limit=CANDIDATE_LIMIT):
+        """Return ids of the drugs sharing the most trigrams with the query"""
+        grams = trigrams(name.lower() if name else "") | trigrams(brand.lower() if brand else "")
+        postings = sorted(
+            (self.postings[gram] for gram in grams if gram in self.postings),
+            key=len
+        )
+
+        counts = Counter()
+        for posting in postings:
+            if len(posting) > self.common_limit and counts:
+                break
+            counts.update(posting)
+
+        return [drug_id for drug_id, _ in counts.most_common(limit)]
+
+    def score(self, drug_id, search_terms, search_brand):
+        """Score a drug against the search terms the same way as the full scan did"""
+        drug = self.drugs[drug_id]
+        bonus = BRAND_BONUS if search_brand and drug['match_brand'] and search_brand == drug['match_brand'] else 0
+
+        best_score = 0
+        for search in search_terms:
+            for match in drug['match_strings']:
+                score = fuzz.ratio(search, match) + bonus
+                if score > best_score:
+                    best_score = score
+        return best_score
+
+    def rank(self, name, brand=None, limit=5):
+        """Return (drug, score) pairs for the best matching drugs, best first"""
+        search_terms = build_search_terms(name, brand)
+        if not search_terms:
+            return []
+        search_brand = brand.lower() if brand else ""
+
+        scored = [
+            (self.drugs[drug_id], self.score(drug_id, search_terms, search_brand))
+            for drug_id in self.candidates(name, brand)
+        ]
+        scored.sort(key=lambda pair: pair[1], reverse=True)
+        return scored[:limit]
+
+    def best_match(self, name, brand=None):
+        """Return the best matching (drug, score) pair or (None, 0)"""
+        ranked = self.rank(name, brand, limit=1)
+        return ranked[0] if ranked else (None, 0)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_drug_match_index():
+    """Return the process-local drug match index, loading it when stale"""
+    global _index
+    from .models import Drug
+
+    version = cache_version(INDEX_VERSION_KEY)
+    index = _index
+    if index_is_current(index, version, INDEX_MAX_AGE):
+        return index
+
+    with _index_lock:
+        if not index_is_current(_index, version, INDEX_MAX_AGE):
+            _index = DrugMatchIndex(
+                Drug.objects.values('id', 'name', 'brand').iterator(chunk_size=2000),
+                version
+            )
+        return _index
+
+
+def invalidate_drug_match_index(drug=None):
+    """Bump the index version once the current transaction commits.
+
+    When a drug is given nothing happens if the loaded index already has
+    that drug's name and brand, so stock updates do not force a rebuild.
+    """
+    index = _index
+    if drug is not None and index is not None and index.is_current(drug.id, drug.name, drug.brand):
+        return
+    bump_cache_version_on_commit(INDEX_VERSION_KEY)
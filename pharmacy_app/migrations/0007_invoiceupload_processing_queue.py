@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0006_userprofile_dark_mode'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceupload',
+            name='processing_finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoiceupload',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoiceupload',
+            name='progress',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Processing progress in percent'),
+        ),
+        migrations.AddField(
+            model_name='invoiceupload',
+            name='worker_id',
+            field=models.CharField(blank=True, help_text='Worker currently processing this invoice', max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceupload',
+            index=models.Index(fields=['processing_status', 'upload_date'], name='pharmacy_ap_process_d8aa51_idx'),
+        ),
+    ]
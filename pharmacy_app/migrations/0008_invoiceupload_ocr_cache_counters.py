@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0007_invoiceupload_processing_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceupload',
+            name='ocr_cache_hits',
+            field=models.PositiveIntegerField(default=0, help_text='Pages served from the OCR cache on the last run'),
+        ),
+        migrations.AddField(
+            model_name='invoiceupload',
+            name='ocr_cache_misses',
+            field=models.PositiveIntegerField(default=0, help_text='Pages that needed OCR on the last run'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:13
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    """Fill the rollup tables from existing sales so reports are correct straight away"""
+    Sale = apps.get_model('pharmacy_app', 'Sale')
+    SaleItem = apps.get_model('pharmacy_app', 'SaleItem')
+    DailySalesSummary = apps.get_model('pharmacy_app', 'DailySalesSummary')
+    DailyDrugSales = apps.get_model('pharmacy_app', 'DailyDrugSales')
+
+    DailySalesSummary.objects.bulk_create([
+        DailySalesSummary(day=row['day'], sale_count=row['sale_count'], revenue=row['revenue'])
+        for row in Sale.objects.annotate(day=TruncDate('date')).values('day').annotate(
+            sale_count=Count('id'),
+            revenue=Sum('total_amount')
+        ).order_by('day')
+    ], batch_size=1000)
+    DailyDrugSales.objects.bulk_create([
+        DailyDrugSales(day=row['day'], drug_name=row['drug_name'],
+                       quantity=row['total_quantity'], value=row['total_value'])
+        for row in SaleItem.objects.annotate(day=TruncDate('sale__date')).values('day', 'drug_name').annotate(
+            total_quantity=Sum('quantity'),
+            total_value=Sum(F('quantity') * F('price'))
+        ).order_by('day', 'drug_name')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0010_sale_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('sale_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Sales Summaries',
+                'ordering': ['day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyDrugSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('drug_name', models.CharField(max_length=200)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Drug Sales',
+                'unique_together': {('day', 'drug_name')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0012_report_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='progress',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Percent complete while generating'),
+        ),
+        migrations.AlterField(
+            model_name='reportjob',
+            name='export_format',
+            field=models.CharField(choices=[('PDF', 'PDF'), ('EXCEL', 'Excel'), ('ZIP', 'ZIP of PDFs')], max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='reportjob',
+            name='report_type',
+            field=models.CharField(choices=[('SALES', 'Sales Report'), ('INVENTORY', 'Inventory Report'), ('INVOICES', 'Sale Invoices')], max_length=20),
+        ),
+    ]
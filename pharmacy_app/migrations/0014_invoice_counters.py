@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+# Next invoice number of a day from a per-day sequence, created on the day's first sale
+CREATE_NEXT_INVOICE_NUMBER_FUNCTION = """
+CREATE OR REPLACE FUNCTION pharmacy_next_invoice_number(for_day date) RETURNS bigint AS $$
+DECLARE
+    seq_name text := 'pharmacy_app_invoice_seq_' || to_char(for_day, 'YYYYMMDD');
+BEGIN
+    BEGIN
+        RETURN nextval(seq_name::regclass);
+    EXCEPTION WHEN undefined_table THEN
+        BEGIN
+            EXECUTE format('CREATE SEQUENCE %I', seq_name);
+        EXCEPTION WHEN duplicate_table OR unique_violation THEN
+            -- Another sale created the day's sequence first
+            NULL;
+        END;
+        RETURN nextval(seq_name::regclass);
+    END;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def create_next_invoice_number_function(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        # No params, so the driver leaves the %I in format() alone
+        schema_editor.execute(CREATE_NEXT_INVOICE_NUMBER_FUNCTION, params=None)
+
+
+def drop_next_invoice_number_function(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP FUNCTION IF EXISTS pharmacy_next_invoice_number(date)")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy_app', '0013_invoice_batch_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceCounter',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_next_invoice_number_function, drop_next_invoice_number_function),
+    ]
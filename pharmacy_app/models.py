@@ -2,7 +2,6 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 from django.utils import timezone
-import uuid
 
 class UserProfile(models.Model):
     """Profile model extending the built-in User model"""
@@ -51,6 +50,10 @@ class Drug(models.Model):
     
     class Meta:
         ordering = ['name', 'brand']
+        indexes = [
+            # Serves the keyset-paginated drug list
+            models.Index(fields=['name', 'brand', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.brand})"
@@ -150,6 +153,10 @@ class Sale(models.Model):
     
     class Meta:
         ordering = ['-date']
+        indexes = [
+            # Serves date range filters and the keyset-paginated sale list
+            models.Index(fields=['date', 'id']),
+        ]
     
     def __str__(self):
         return f"Invoice #{self.invoice_number} - {self.patient}"
@@ -160,16 +167,33 @@ class Sale(models.Model):
         super().save(*args, **kwargs)
     
     def generate_invoice_number(self):
-        """Generate a unique invoice number"""
-        # Format: INV-YYYYMMDD-XXXX
-        today = timezone.now().strftime('%Y%m%d')
-        random_suffix = str(uuid.uuid4().int)[:4]
-        return f"INV-{today}-{random_suffix}"
+        """Generate a unique invoice number from the per-day invoice sequence"""
+        from .invoice_numbers import format_invoice_number, next_invoice_number
+        
+        # Format: INV-YYYYMMDD-NNNNN, numbered from 1 each (local) day
+        day = timezone.localtime(self.date).date()
+        return format_invoice_number(day, next_invoice_number(day))
     
     @property
     def item_count(self):
         return self.saleitems.count()
 
+class InvoiceCounter(models.Model):
+    """Last sale invoice number issued on a day, for databases without sequences"""
+    day = models.DateField(primary_key=True)
+    last_number = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.day}: {self.last_number}"
+
+class VersionCounter(models.Model):
+    """Named counter whose every bump returns a distinct value, e.g. the drug catalogue version"""
+    name = models.CharField(max_length=100, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
 class SaleItem(models.Model):
     """Model for individual items in a sale"""
     sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='saleitems')
@@ -185,6 +209,34 @@ class SaleItem(models.Model):
     def total_price(self):
         return self.quantity * self.price
 
+class DailySalesSummary(models.Model):
+    """Sale count and revenue for one day, kept in step with the Sale table"""
+    day = models.DateField(unique=True)
+    sale_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['day']
+        verbose_name_plural = "Daily Sales Summaries"
+
+    def __str__(self):
+        return f"{self.day}: {self.sale_count} sales, {self.revenue}"
+
+class DailyDrugSales(models.Model):
+    """Units sold and sales value of one drug name on one day"""
+    day = models.DateField()
+    drug_name = models.CharField(max_length=200)
+    quantity = models.PositiveIntegerField(default=0)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('day', 'drug_name')
+        verbose_name_plural = "Daily Drug Sales"
+
+    def __str__(self):
+        return f"{self.day}: {self.drug_name} x {self.quantity}"
+
 class InventoryLog(models.Model):
     """Model for tracking inventory changes"""
     OPERATION_CHOICES = [
@@ -275,6 +327,17 @@ class InvoiceUpload(models.Model):
     total_items_found = models.IntegerField(default=0)
     total_items_matched = models.IntegerField(default=0)
     output_file = models.FileField(upload_to='invoice_outputs/', blank=True, null=True)
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Processing progress in percent")
+    worker_id = models.CharField(max_length=100, blank=True, null=True, help_text="Worker currently processing this invoice")
+    processing_started_at = models.DateTimeField(blank=True, null=True)
+    processing_finished_at = models.DateTimeField(blank=True, null=True)
+    ocr_cache_hits = models.PositiveIntegerField(default=0, help_text="Pages served from the OCR cache on the last run")
+    ocr_cache_misses = models.PositiveIntegerField(default=0, help_text="Pages that needed OCR on the last run")
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['processing_status', 'upload_date']),
+        ]
     
     def __str__(self):
         return f"Invoice {self.invoice_number or 'Unknown'} - {self.supplier.name if self.supplier else 'Unknown'}"
@@ -308,3 +371,70 @@ class InvoiceItem(models.Model):
     
     def __str__(self):
         return f"{self.extracted_name} ({self.get_match_status_display()})"
+
+class ReportJob(models.Model):
+    """A report export or invoice batch rendered in the background by the report worker"""
+    REPORT_CHOICES = [
+        ('SALES', 'Sales Report'),
+        ('INVENTORY', 'Inventory Report'),
+        ('INVOICES', 'Sale Invoices'),
+    ]
+    
+    FORMAT_CHOICES = [
+        ('PDF', 'PDF'),
+        ('EXCEL', 'Excel'),
+        ('ZIP', 'ZIP of PDFs'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('PENDING', 'Queued'),
+        ('PROCESSING', 'Generating'),
+        ('COMPLETED', 'Ready'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    ACTIVE_STATUSES = ['PENDING', 'PROCESSING']
+    
+    report_type = models.CharField(max_length=20, choices=REPORT_CHOICES)
+    export_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percent complete while generating")
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    file = models.FileField(upload_to='report_exports/', blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    worker_id = models.CharField(max_length=100, blank=True, null=True, help_text="Worker currently rendering this report")
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField(blank=True, null=True, help_text="The file is deleted after this time")
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['report_type', 'export_format', 'start_date', 'end_date']),
+            models.Index(fields=['expires_at']),
+        ]
+        constraints = [
+            # At most one queued or running job per identical request
+            models.UniqueConstraint(
+                fields=['report_type', 'export_format', 'start_date', 'end_date'],
+                condition=models.Q(status__in=['PENDING', 'PROCESSING']),
+                name='unique_active_report_job',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_report_type_display()} {self.start_date} to {self.end_date} ({self.export_format}, {self.status})"
+    
+    @property
+    def is_finished(self):
+        return self.status not in self.ACTIVE_STATUSES
+    
+    @property
+    def is_ready(self):
+        return self.status == 'COMPLETED' and bool(self.file) and (
+            self.expires_at is None or self.expires_at > timezone.now()
+        )
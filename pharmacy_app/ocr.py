@@ -0,0 +1,60 @@
+"""OCR helpers for invoice processing.
+
+This module deliberately avoids Django imports so its functions can run in
+freshly spawned pool worker processes.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pdf2image import convert_from_path, pdfinfo_from_path
+import multiprocessing
+import pytesseract
+
+DEFAULT_DPI = 200
+
+
+def count_pdf_pages(file_path):
+    """Return the number of pages in a PDF without rasterising it"""
+    return pdfinfo_from_path(file_path)['Pages']
+
+
+def ocr_pdf_page(file_path, page_number, dpi=DEFAULT_DPI):
+    """Rasterise a single PDF page and return its OCR text"""
+    images = convert_from_path(file_path, dpi=dpi, first_page=page_number, last_page=page_number)
+    try:
+        return "".join(pytesseract.image_to_string(image) for image in images)
+    finally:
+        for image in images:
+            image.close()
+
+
+def ocr_pdf_pages(file_path, page_numbers=None, max_workers=1, dpi=DEFAULT_DPI, progress_callback=None):
+    """OCR PDF pages and return a {page_number: text} dict.
+
+    Pages are rasterised one at a time inside the workers, so at most
+    `max_workers` page images are held in memory whatever the document
+    length. `progress_callback` receives (pages_done, pages_total).
+    """
+    if page_numbers is None:
+        page_numbers = range(1, count_pdf_pages(file_path) + 1)
+    page_numbers = list(page_numbers)
+    total = len(page_numbers)
+    texts = {}
+
+    if max_workers <= 1 or total <= 1:
+        for page_number in page_numbers:
+            texts[page_number] = ocr_pdf_page(file_path, page_number, dpi)
+            if progress_callback:
+                progress_callback(len(texts), total)
+        return texts
+
+    # Spawned workers do not inherit the parent's threads or DB connections
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(max_workers, total), mp_context=context) as executor:
+        futures = {
+            executor.submit(ocr_pdf_page, file_path, page_number, dpi): page_number
+            for page_number in page_numbers
+        }
+        for future in as_completed(futures):
+            texts[futures[future]] = future.result()
+            if progress_callback:
+                progress_callback(len(texts), total)
+    return texts
@@ -0,0 +1,118 @@
+from django.conf import settings
+import hashlib
+import os
+import tempfile
+
+
+def file_content_hash(file_path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """On-disk cache of OCR text keyed by file content hash and page number.
+
+    Entries are plain text files laid out as <root>/<hash[:2]>/<hash>/<page>.txt.
+    Reads refresh an entry's modification time, and once the cache grows
+    past `max_bytes` the least recently used entries are removed.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _entry_dir(self, content_hash):
+        return os.path.join(self.root, content_hash[:2], content_hash)
+
+    def _entry_path(self, content_hash, key):
+        return os.path.join(self._entry_dir(content_hash), f"{key}.txt")
+
+    def _read(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                value = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def _write(self, path, value):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get_page(self, content_hash, page_number):
+        """Return cached OCR text for a page, or None on a miss"""
+        return self._read(self._entry_path(content_hash, page_number))
+
+    def set_page(self, content_hash, page_number, text):
+        """Store OCR text for a page"""
+        self._write(self._entry_path(content_hash, page_number), text)
+
+    def get_page_count(self, content_hash):
+        """Return the cached page count of a document, or None if unknown"""
+        value = self._read(self._entry_path(content_hash, 'pages'))
+        try:
+            return int(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def set_page_count(self, content_hash, page_count):
+        """Store the page count of a document"""
+        self._write(self._entry_path(content_hash, 'pages'), str(page_count))
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+            # Drop the document and prefix directories once they are empty
+            entry_dir = os.path.dirname(path)
+            for directory in (entry_dir, os.path.dirname(entry_dir)):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+        return removed
+
+
+def get_ocr_cache():
+    """Return the OCR cache configured in settings"""
+    return OCRCache(settings.OCR_CACHE_DIR, settings.OCR_CACHE_MAX_BYTES)
@@ -0,0 +1,91 @@
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+import base64
+import binascii
+import datetime
+import json
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """JSON encoder that keeps microseconds, which DjangoJSONEncoder drops"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    """Encode the ordering values of the last row on a page as an opaque cursor"""
+    data = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """Decode a cursor back into its list of ordering values, raising ValueError if invalid"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def cursor_values(model, ordering, values):
+    """Convert decoded cursor values to the Python types of the ordering fields.
+
+    Raises ValueError for a value the field cannot hold, so a tampered
+    cursor is rejected before the query runs instead of failing inside it.
+    """
+    converted = []
+    for field, value in zip(ordering, values):
+        if value is None or isinstance(value, (list, dict)):
+            raise ValueError("Invalid cursor")
+        try:
+            converted.append(model._meta.get_field(field.lstrip('-')).to_python(value))
+        except (ValidationError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {e}")
+    return converted
+
+
+def keyset_filter(ordering, values):
+    """Build a Q matching rows that sort strictly after `values` in `ordering`.
+
+    `ordering` uses order_by() syntax; every field must be non-null and the
+    last one unique (usually the primary key) so rows have a total order.
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f"{name}__{lookup}": values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    # Redundant bound on the leading field lets the database range-scan its index
+    first = ordering[0]
+    bound = 'lte' if first.startswith('-') else 'gte'
+    return Q(**{f"{first.lstrip('-')}__{bound}": values[0]}) & condition
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=50):
+    """Return (items, next_cursor) for the page of `queryset` after `cursor`.
+
+    Pages are fetched with an indexed range condition instead of OFFSET, so
+    deep pages cost the same as the first. next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = cursor_values(queryset.model, ordering, decode_cursor(cursor, len(ordering)))
+        queryset = queryset.filter(keyset_filter(ordering, values))
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
+    return items, next_cursor
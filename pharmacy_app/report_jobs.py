@@ -0,0 +1,142 @@
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import tempfile
+
+from .invoice_pdf import write_invoice_batch
+from .models import ReportJob
+from .reports import report_filename, write_report
+
+logger = logging.getLogger(__name__)
+
+FILE_EXTENSIONS = {'PDF': 'pdf', 'EXCEL': 'xlsx', 'ZIP': 'zip'}
+
+
+def request_report_job(report_type, export_format, start_date, end_date, user=None):
+    """Return (job, created) for a report export, reusing an identical job where possible.
+
+    A queued or running job for the same report, range and format is shared
+    rather than rendered twice. Finished exports are never reused, since a
+    past sale can still be edited or deleted.
+    """
+    identical = ReportJob.objects.filter(
+        report_type=report_type,
+        export_format=export_format,
+        start_date=start_date,
+        end_date=end_date,
+    )
+    active = identical.filter(status__in=ReportJob.ACTIVE_STATUSES)
+    job = active.order_by('-created_at').first()
+    if job:
+        return job, False
+
+    try:
+        with transaction.atomic():
+            return ReportJob.objects.create(
+                report_type=report_type,
+                export_format=export_format,
+                start_date=start_date,
+                end_date=end_date,
+                requested_by=user,
+            ), True
+    except IntegrityError:
+        # An identical request was queued between our check and insert (and may have finished since)
+        return identical.order_by('-created_at').first(), False
+
+
+def claim_next_report_job(worker_id):
+    """Atomically claim the oldest queued report job for a worker"""
+    with transaction.atomic():
+        pending = ReportJob.objects.filter(status='PENDING').order_by('created_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        job_id = pending.values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+
+        claimed = ReportJob.objects.filter(id=job_id, status='PENDING').update(
+            status='PROCESSING',
+            progress=0,
+            worker_id=worker_id,
+            started_at=timezone.now(),
+        )
+
+    if not claimed:
+        return None
+    return ReportJob.objects.get(id=job_id)
+
+
+def release_stale_report_jobs(timeout):
+    """Requeue report jobs stuck in PROCESSING for longer than `timeout` seconds (e.g. after a worker crash)"""
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return ReportJob.objects.filter(status='PROCESSING', started_at__lt=cutoff).update(
+        status='PENDING',
+        worker_id=None,
+    )
+
+
+def report_job_progress(job):
+    """Progress callback that records a job's percent complete whenever it changes"""
+    def record(done, total):
+        percent = int(done * 100 / total)
+        if percent != job.progress:
+            job.progress = percent
+            ReportJob.objects.filter(id=job.id).update(progress=percent)
+    return record
+
+
+def run_report_job(job):
+    """Render a claimed report job to a file under MEDIA_ROOT, recording failures on the job"""
+    expires_at = timezone.now() + timedelta(hours=settings.REPORT_JOB_EXPIRY_HOURS)
+    job.error = None
+    try:
+        with tempfile.TemporaryFile() as output:
+            if job.report_type == 'INVOICES':
+                written, failed = write_invoice_batch(job.start_date, job.end_date, job.export_format, output,
+                                                      progress_callback=report_job_progress(job))
+                if failed:
+                    # The batch is still delivered; the missing invoices are listed on the job
+                    job.error = f"{len(failed)} invoice(s) could not be rendered: {', '.join(failed)}"
+            else:
+                write_report(job.report_type, job.export_format, job.start_date, job.end_date, output)
+            output.seek(0)
+            filename = report_filename(
+                job.report_type, job.start_date, job.end_date, FILE_EXTENSIONS[job.export_format]
+            )
+            job.file.save(filename, File(output), save=False)
+        job.status = 'COMPLETED'
+    except Exception as e:
+        logger.exception("Report job %s failed", job.id)
+        job.status = 'FAILED'
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.expires_at = expires_at
+    job.save(update_fields=['file', 'status', 'progress', 'error', 'finished_at', 'expires_at'])
+    return job
+
+
+def delete_expired_report_jobs():
+    """Delete finished report jobs past their expiry together with their files"""
+    expired = ReportJob.objects.filter(expires_at__lt=timezone.now()).exclude(
+        status__in=ReportJob.ACTIVE_STATUSES
+    )
+    count = 0
+    for job in expired.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        count += 1
+    return count
+
+
+def recent_report_jobs(report_type, limit=10):
+    """Latest export jobs of one report type that have not expired, for the page that requests them"""
+    return list(
+        ReportJob.objects.filter(report_type=report_type)
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()))
+        .order_by('-created_at')[:limit]
+    )
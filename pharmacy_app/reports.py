@@ -0,0 +1,179 @@
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from datetime import timedelta
+
+from .models import Drug, InventoryLog, Sale
+from .rollups import get_sales_totals, get_daily_sales, get_top_drugs
+from .utils import render_to_pdf, start_of_day, write_xlsx
+from .valuation import get_inventory_valuation, low_stock_filter, expiring_filter
+
+
+# Download name prefix of each ReportJob report type
+REPORT_TITLES = {'SALES': 'Sales_Report', 'INVENTORY': 'Inventory_Report', 'INVOICES': 'Invoices'}
+
+
+def report_filename(report_type, start_date, end_date, extension):
+    """Download name of an exported report, e.g. Sales_Report_2024-01-01_to_2024-01-31.pdf"""
+    title = REPORT_TITLES[report_type]
+    return f"{title}_{start_date.strftime('%Y-%m-%d')}_to_{end_date.strftime('%Y-%m-%d')}.{extension}"
+
+
+def sales_report_context(start_date, end_date):
+    """Figures and querysets shown on (and exported from) the sales report"""
+    # Filter sales by date range
+    sales = Sale.objects.filter(
+        date__gte=start_of_day(start_date),
+        date__lt=start_of_day(end_date + timedelta(days=1))
+    )
+
+    # Summary statistics, daily breakdown and top drugs read the daily rollups for
+    # closed days and only aggregate today's sales from the raw tables
+    total_sales, total_revenue = get_sales_totals(start_date, end_date)
+    avg_sale_value = total_revenue / total_sales if total_sales > 0 else 0
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'total_sales': total_sales,
+        'total_revenue': total_revenue,
+        'avg_sale_value': avg_sale_value,
+        'daily_sales': get_daily_sales(start_date, end_date),
+        'top_drugs': get_top_drugs(start_date, end_date, limit=10),
+        'sales': sales,
+    }
+
+
+def inventory_report_context(start_date, end_date):
+    """Figures and querysets shown on (and exported from) the inventory report"""
+    # Get all active drugs
+    drugs = Drug.objects.filter(is_active=True).select_related('category')
+
+    # Stock value, per-category subtotals and alert counts come from one aggregate query
+    valuation = get_inventory_valuation(drugs)
+
+    # Get low stock drugs
+    low_stock_drugs = drugs.filter(low_stock_filter())
+
+    # Get expiring drugs (within 2 months)
+    expiring_drugs = drugs.filter(expiring_filter())
+
+    # Get inventory movement during the period
+    inventory_logs = InventoryLog.objects.filter(
+        timestamp__gte=start_of_day(start_date),
+        timestamp__lt=start_of_day(end_date + timedelta(days=1))
+    ).select_related('drug', 'user')
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'drugs': drugs,
+        'valuation': valuation,
+        'total_stock_value': valuation['total_stock_value'],
+        'low_stock_drugs': low_stock_drugs,
+        'expiring_drugs': expiring_drugs,
+        'inventory_logs': inventory_logs,
+    }
+
+
+def sales_report_rows(sales):
+    """Yield the sales report header and one row per sale, read in chunks with their item counts"""
+    yield ['Invoice #', 'Date', 'Patient Name', 'Total Amount', 'Items Count', 'Payment Method', 'Status']
+
+    rows = sales.annotate(items_count=Count('saleitems')).order_by('-date', '-id').values_list(
+        'invoice_number', 'date', 'patient_id', 'patient__first_name', 'patient__last_name',
+        'patient__is_walk_in', 'total_amount', 'items_count', 'payment_method', 'payment_status'
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    for (invoice_number, date, patient_id, first_name, last_name,
+         is_walk_in, total_amount, items_count, payment_method, payment_status) in rows:
+        if patient_id is None:
+            patient_name = 'N/A'
+        elif is_walk_in:
+            patient_name = 'Walk-In Customer'
+        else:
+            patient_name = f"{first_name} {last_name}"
+        yield [
+            invoice_number,
+            date.strftime('%Y-%m-%d %H:%M'),
+            patient_name,
+            float(total_amount),
+            items_count,
+            payment_method,
+            payment_status
+        ]
+
+
+def inventory_stock_rows(drugs):
+    """Yield the header and one row per drug with its stock value, read in chunks"""
+    yield ['Drug Name', 'Brand', 'Category', 'Current Stock', 'Reorder Level',
+           'Cost Price', 'Selling Price', 'Expiry Date', 'Stock Value']
+
+    drug_rows = drugs.order_by('name', 'brand', 'id').values_list(
+        'name', 'brand', 'category__name', 'stock_quantity', 'reorder_level',
+        'cost_price', 'selling_price', 'expiry_date'
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    for name, brand, category, stock, reorder_level, cost_price, selling_price, expiry_date in drug_rows:
+        yield [
+            name,
+            brand,
+            category or 'N/A',
+            stock,
+            reorder_level,
+            float(cost_price),
+            float(selling_price),
+            expiry_date.strftime('%Y-%m-%d'),
+            float(stock * cost_price)
+        ]
+
+
+def inventory_movement_rows(inventory_logs):
+    """Yield the header and one row per inventory log, read in chunks"""
+    yield ['Date', 'Drug Name', 'Quantity Change', 'Operation Type', 'Reference', 'User', 'Notes']
+
+    operation_types = dict(InventoryLog.OPERATION_CHOICES)
+    log_rows = inventory_logs.order_by('-timestamp', '-id').values_list(
+        'timestamp', 'drug__name', 'quantity_change', 'operation_type', 'reference', 'user__username', 'notes'
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    for timestamp, drug_name, quantity_change, operation_type, reference, username, notes in log_rows:
+        yield [
+            timestamp.strftime('%Y-%m-%d %H:%M'),
+            drug_name or 'N/A',
+            quantity_change,
+            operation_types.get(operation_type, operation_type),
+            reference or 'N/A',
+            username or 'N/A',
+            notes or 'N/A'
+        ]
+
+
+def inventory_report_rows(drugs, inventory_logs):
+    """Yield the inventory report's stock rows, a blank line, then its movement rows"""
+    yield from inventory_stock_rows(drugs)
+    yield []
+    yield ['Inventory Movement:']
+    yield from inventory_movement_rows(inventory_logs)
+
+
+def write_report(report_type, export_format, start_date, end_date, output):
+    """Render a sales or inventory report as PDF or Excel into the binary file `output`"""
+    if report_type == 'SALES':
+        context = sales_report_context(start_date, end_date)
+    else:
+        context = inventory_report_context(start_date, end_date)
+
+    if export_format == 'PDF':
+        # Add current date to context for footer
+        context['current_date'] = timezone.now()
+        # Use a simplified template for PDF to avoid CSS parsing issues
+        template = 'reports/sales_report_pdf.html' if report_type == 'SALES' else 'reports/inventory_report_pdf.html'
+        pdf = render_to_pdf(template, context)
+        if pdf is None:
+            raise ValueError("The PDF renderer could not convert the report")
+        output.write(pdf)
+    elif report_type == 'SALES':
+        write_xlsx(output, [('Sales Report', sales_report_rows(context['sales']))])
+    else:
+        write_xlsx(output, [
+            ('Current Inventory', inventory_stock_rows(context['drugs'])),
+            ('Inventory Movement', inventory_movement_rows(context['inventory_logs'])),
+        ])
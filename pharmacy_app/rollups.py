@@ -0,0 +1,195 @@
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from datetime import timedelta
+import decimal
+import functools
+
+from .models import Sale, SaleItem, DailySalesSummary, DailyDrugSales
+from .utils import start_of_day
+
+
+def sale_day(sale):
+    """Local calendar day a sale belongs to in the rollups"""
+    return timezone.localtime(sale.date).date()
+
+
+def _sales_between(first_day=None, last_day=None, prefix=''):
+    """Filter kwargs for sales on first_day..last_day inclusive, as a half-open range"""
+    filters = {}
+    if first_day is not None:
+        filters[f'{prefix}date__gte'] = start_of_day(first_day)
+    if last_day is not None:
+        filters[f'{prefix}date__lt'] = start_of_day(last_day + timedelta(days=1))
+    return filters
+
+
+def _drug_totals(queryset, *group_by):
+    return queryset.values(*group_by, 'drug_name').annotate(
+        total_quantity=Sum('quantity'),
+        total_value=Sum(F('quantity') * F('price'))
+    )
+
+
+def refresh_daily_sales(day):
+    """Recompute the rollup rows for one day from that day's sales and items"""
+    with transaction.atomic():
+        # Locking the summary row serialises concurrent refreshes of the same day,
+        # and the totals are read after the lock so the last writer sees every sale
+        summary, _ = DailySalesSummary.objects.select_for_update().get_or_create(day=day)
+        totals = Sale.objects.filter(**_sales_between(day, day)).aggregate(
+            sale_count=Count('id'),
+            revenue=Sum('total_amount')
+        )
+        summary.sale_count = totals['sale_count']
+        summary.revenue = totals['revenue'] or 0
+        summary.save()
+
+        DailyDrugSales.objects.filter(day=day).delete()
+        DailyDrugSales.objects.bulk_create([
+            DailyDrugSales(
+                day=day,
+                drug_name=row['drug_name'],
+                quantity=row['total_quantity'],
+                value=row['total_value'],
+            )
+            for row in _drug_totals(SaleItem.objects.filter(**_sales_between(day, day, 'sale__')))
+        ])
+
+
+def schedule_daily_sales_refresh(day):
+    """Refresh the rollup for `day` once the current transaction commits.
+
+    A sale edit or delete touches many rows of the same day, so a day already
+    waiting for this transaction's commit is not queued twice.
+    """
+    if connection.in_atomic_block:
+        for _, callback, _ in connection.run_on_commit:
+            if getattr(callback, 'func', None) is refresh_daily_sales and callback.args == (day,):
+                return
+    # update_wrapper gives the partial the __qualname__ Django logs when a robust callback fails
+    callback = functools.update_wrapper(functools.partial(refresh_daily_sales, day), refresh_daily_sales)
+    transaction.on_commit(callback, robust=True)
+
+
+def rebuild_daily_sales(first_day=None, last_day=None):
+    """Recreate all rollup rows in a date range (inclusive) from the raw sales tables"""
+    sales = Sale.objects.filter(**_sales_between(first_day, last_day))
+    items = SaleItem.objects.filter(**_sales_between(first_day, last_day, 'sale__'))
+    day_range = _day_filters(first_day, last_day)
+
+    with transaction.atomic():
+        DailySalesSummary.objects.filter(**day_range).delete()
+        DailyDrugSales.objects.filter(**day_range).delete()
+        summaries = DailySalesSummary.objects.bulk_create([
+            DailySalesSummary(day=row['day'], sale_count=row['sale_count'], revenue=row['revenue'])
+            for row in sales.annotate(day=TruncDate('date')).values('day').annotate(
+                sale_count=Count('id'),
+                revenue=Sum('total_amount')
+            ).order_by('day')
+        ], batch_size=1000)
+        drug_rows = DailyDrugSales.objects.bulk_create([
+            DailyDrugSales(day=row['day'], drug_name=row['drug_name'],
+                           quantity=row['total_quantity'], value=row['total_value'])
+            for row in _drug_totals(items.annotate(day=TruncDate('sale__date')), 'day')
+            .order_by('day', 'drug_name')
+        ], batch_size=1000)
+    return len(summaries), len(drug_rows)
+
+
+def _split_days(first_day, last_day):
+    """Split a date range into the closed days read from the rollups and the
+    days from today onwards read from raw rows. Either part may be None."""
+    today = timezone.localdate()
+    yesterday = today - timedelta(days=1)
+
+    closed = None
+    if first_day is None or first_day <= yesterday:
+        closed = (first_day, yesterday if last_day is None else min(last_day, yesterday))
+
+    current = None
+    if last_day is None or last_day >= today:
+        current = (today if first_day is None else max(first_day, today), last_day)
+    return closed, current
+
+
+def _day_filters(first_day, last_day):
+    filters = {}
+    if first_day is not None:
+        filters['day__gte'] = first_day
+    if last_day is not None:
+        filters['day__lte'] = last_day
+    return filters
+
+
+def get_sales_totals(first_day=None, last_day=None):
+    """Return (sale_count, revenue) for sales from first_day to last_day inclusive"""
+    closed, current = _split_days(first_day, last_day)
+    sale_count, revenue = 0, decimal.Decimal('0.00')
+
+    if closed:
+        totals = DailySalesSummary.objects.filter(**_day_filters(*closed)).aggregate(
+            sale_count=Sum('sale_count'),
+            revenue=Sum('revenue')
+        )
+        sale_count += totals['sale_count'] or 0
+        revenue += totals['revenue'] or 0
+    if current:
+        totals = Sale.objects.filter(**_sales_between(*current)).aggregate(
+            sale_count=Count('id'),
+            revenue=Sum('total_amount')
+        )
+        sale_count += totals['sale_count']
+        revenue += totals['revenue'] or 0
+    return sale_count, revenue
+
+
+def get_daily_sales(first_day, last_day):
+    """Return [{'day', 'count', 'total'}] for each day with sales, oldest first"""
+    closed, current = _split_days(first_day, last_day)
+    days = []
+
+    if closed:
+        days.extend(
+            {'day': row['day'], 'count': row['sale_count'], 'total': row['revenue']}
+            for row in DailySalesSummary.objects.filter(sale_count__gt=0, **_day_filters(*closed))
+            .values('day', 'sale_count', 'revenue').order_by('day')
+        )
+    if current:
+        days.extend(
+            Sale.objects.filter(**_sales_between(*current))
+            .annotate(day=TruncDate('date')).values('day')
+            .annotate(count=Count('id'), total=Sum('total_amount'))
+            .order_by('day')
+        )
+    return days
+
+
+def get_top_drugs(first_day, last_day, limit=10):
+    """Return [{'drug_name', 'total_quantity', 'total_value'}] for the best-selling drugs"""
+    closed, current = _split_days(first_day, last_day)
+
+    closed_rows = []
+    if closed:
+        closed_rows = DailyDrugSales.objects.filter(**_day_filters(*closed)).values('drug_name').annotate(
+            total_quantity=Sum('quantity'),
+            total_value=Sum('value')
+        ).order_by('-total_quantity', 'drug_name')
+    if not current:
+        return list(closed_rows[:limit])
+
+    current_rows = _drug_totals(SaleItem.objects.filter(**_sales_between(*current, 'sale__')))
+    if not closed:
+        return list(current_rows.order_by('-total_quantity', 'drug_name')[:limit])
+
+    merged = {}
+    for row in list(closed_rows) + list(current_rows):
+        drug = merged.setdefault(row['drug_name'], {
+            'drug_name': row['drug_name'],
+            'total_quantity': 0,
+            'total_value': decimal.Decimal('0.00'),
+        })
+        drug['total_quantity'] += row['total_quantity']
+        drug['total_value'] += row['total_value']
+    return sorted(merged.values(), key=lambda drug: (-drug['total_quantity'], drug['drug_name']))[:limit]
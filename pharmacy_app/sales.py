@@ -0,0 +1,117 @@
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+import decimal
+
+from .models import Drug, SaleItem, InventoryLog
+from .catalogue import invalidate_drug_catalogue
+from .utils import invalidate_notification_counts
+
+
+class InsufficientStockError(Exception):
+    """Raised when a basket asks for more units of a drug than are in stock"""
+
+    def __init__(self, shortages):
+        # shortages is a list of (drug, available, requested) tuples
+        self.shortages = shortages
+        super().__init__("; ".join(
+            f"Not enough stock for {drug.name}. Available: {available}"
+            for drug, available, _ in shortages
+        ))
+
+
+class _StockChanged(Exception):
+    pass
+
+
+def _basket_totals(lines):
+    totals = {}
+    for drug, quantity in lines:
+        totals[drug.id] = totals.get(drug.id, 0) + quantity
+    return totals
+
+
+def _shortages(basket_drugs, totals, stock):
+    return [
+        (basket_drugs[drug_id], stock.get(drug_id, 0), quantity)
+        for drug_id, quantity in totals.items()
+        if stock.get(drug_id, 0) < quantity
+    ]
+
+
+def commit_sale(sale, lines):
+    """Save a sale with its items and take the sold units out of stock atomically.
+
+    `lines` is a list of (drug, quantity) pairs. Basket drugs are locked and
+    decremented with one conditional F() update, and the sale items and
+    inventory logs are bulk-created, all in one transaction. Nothing is
+    saved if any drug is short, in which case InsufficientStockError is raised.
+    """
+    basket_drugs = {drug.id: drug for drug, _ in lines}
+    totals = _basket_totals(lines)
+
+    try:
+        with transaction.atomic():
+            # Lock in id order so concurrent baskets cannot deadlock each other
+            drugs = {
+                drug.id: drug
+                for drug in Drug.objects.select_for_update().filter(id__in=totals).order_by('id')
+            }
+            shortages = _shortages(
+                basket_drugs, totals,
+                {drug_id: drug.stock_quantity for drug_id, drug in drugs.items()}
+            )
+            if shortages:
+                raise InsufficientStockError(shortages)
+
+            # The stock condition is repeated in the UPDATE for databases without row locks
+            if totals:
+                in_stock = Q()
+                for drug_id, quantity in totals.items():
+                    in_stock |= Q(id=drug_id, stock_quantity__gte=quantity)
+                updated = Drug.objects.filter(in_stock).update(
+                    stock_quantity=F('stock_quantity') - Case(
+                        *[When(id=drug_id, then=quantity) for drug_id, quantity in totals.items()]
+                    )
+                )
+                if updated != len(totals):
+                    raise _StockChanged()
+
+            subtotal = decimal.Decimal('0.00')
+            items = []
+            for drug, quantity in lines:
+                locked = drugs[drug.id]
+                items.append(SaleItem(
+                    drug=locked,
+                    drug_name=locked.name,
+                    quantity=quantity,
+                    price=locked.selling_price,
+                ))
+                subtotal += locked.selling_price * quantity
+
+            sale.subtotal = subtotal
+            sale.total_amount = subtotal + sale.tax - sale.discount
+            sale.save()
+
+            for item in items:
+                item.sale = sale
+            SaleItem.objects.bulk_create(items)
+
+            InventoryLog.objects.bulk_create([
+                InventoryLog(
+                    drug=drugs[drug_id],
+                    quantity_change=-quantity,
+                    operation_type='SALE',
+                    reference=f"Invoice #{sale.invoice_number}",
+                    user=sale.user,
+                )
+                for drug_id, quantity in totals.items()
+            ])
+            # The queryset update above does not send Drug signals
+            invalidate_notification_counts()
+            invalidate_drug_catalogue(totals)
+    except _StockChanged:
+        # Another till sold the stock between our read and the update; report it after rollback
+        stock = dict(Drug.objects.filter(id__in=totals).values_list('id', 'stock_quantity'))
+        raise InsufficientStockError(_shortages(basket_drugs, totals, stock)) from None
+
+    return sale
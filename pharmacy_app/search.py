@@ -0,0 +1,194 @@
+from bisect import bisect_left
+from datetime import timedelta
+import heapq
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import Drug, Patient, Sale, SaleItem
+from .utils import bump_cache_version_on_commit, cache_version, index_is_current, start_of_day
+
+SEARCH_VERSION_KEY = 'autocomplete_search_version:{}'
+# Rebuilt at least this often so the recent sales ranking stays current
+SEARCH_INDEX_MAX_AGE = 300
+
+
+def search_words(text):
+    """Lower-case words of a label or query"""
+    return re.findall(r'\w+', text.lower())
+
+
+class PrefixSearchIndex:
+    """Word prefix index over drug or patient labels for the autocomplete fields.
+
+    Every word of every entry is kept in one sorted list, so the entries
+    with a word starting with the typed text are found by bisecting. A query
+    of several words matches entries with a word starting with each of them.
+    Results rank an exact label match first, then labels starting with the
+    query, then by recent sales and finally alphabetically.
+    """
+
+    def __init__(self, entries, version=None):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.labels = {}
+        self.words = {}
+        self.normalized = {}
+        self.popularity = {}
+
+        pairs = []
+        for entry_id, label, words, popularity in entries:
+            self.labels[entry_id] = label
+            self.words[entry_id] = frozenset(search_words(' '.join(words)))
+            self.normalized[entry_id] = ' '.join(search_words(label))
+            self.popularity[entry_id] = popularity
+            pairs.extend((word, entry_id) for word in self.words[entry_id])
+
+        pairs.sort()
+        self.keys = [word for word, _ in pairs]
+        self.ids = [entry_id for _, entry_id in pairs]
+        # The results of an empty query: most sold first
+        self.by_popularity = sorted(self.labels, key=lambda entry_id: self._rank(entry_id, 2))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _rank(self, entry_id, match):
+        return (match, -self.popularity[entry_id], self.normalized[entry_id], entry_id)
+
+    def _with_prefix(self, prefix):
+        matches = set()
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and self.keys[position].startswith(prefix):
+            matches.add(self.ids[position])
+            position += 1
+        return matches
+
+    def search(self, query, limit=20, offset=0):
+        """Return (ids, has_more) for one page of the entries matching `query`"""
+        words = search_words(query)
+        if not words:
+            ranked = self.by_popularity[offset:offset + limit + 1]
+            return ranked[:limit], len(ranked) > limit
+
+        # Start from the longest word, which usually has the fewest matches
+        longest, *others = sorted(words, key=len, reverse=True)
+        matches = self._with_prefix(longest)
+        for word in others:
+            matches = {
+                entry_id for entry_id in matches
+                if any(entry_word.startswith(word) for entry_word in self.words[entry_id])
+            }
+
+        text = ' '.join(words)
+
+        def rank(entry_id):
+            label = self.normalized[entry_id]
+            return self._rank(entry_id, 0 if label == text else 1 if label.startswith(text) else 2)
+
+        ranked = heapq.nsmallest(offset + limit + 1, matches, key=rank)[offset:]
+        return ranked[:limit], len(ranked) > limit
+
+    def is_current(self, entry_id, entry):
+        """True if the index already holds this (label, words) entry, or no entry when it is None"""
+        if entry is None:
+            return entry_id not in self.labels
+        label, words = entry
+        return (
+            self.labels.get(entry_id) == label
+            and self.words[entry_id] == frozenset(search_words(' '.join(words)))
+        )
+
+
+def drug_search_entry(drug):
+    """(label, words) a drug is found by, or None if it is not offered"""
+    if not drug.is_active:
+        return None
+    return str(drug), (drug.name, drug.brand, drug.barcode or '')
+
+
+def patient_search_entry(patient):
+    """(label, words) a patient is found by; the walk-in customer has its own checkbox"""
+    if patient.is_walk_in:
+        return None
+    return str(patient), (patient.first_name, patient.last_name, patient.phone_number)
+
+
+def _recent_sales_start():
+    return start_of_day(timezone.localdate() - timedelta(days=settings.SEARCH_POPULARITY_DAYS))
+
+
+def _drug_entries():
+    sold = dict(
+        SaleItem.objects.filter(sale__date__gte=_recent_sales_start(), drug__isnull=False)
+        .values('drug').annotate(units=Sum('quantity')).values_list('drug', 'units')
+    )
+    drugs = Drug.objects.filter(is_active=True).only('id', 'name', 'brand', 'barcode', 'is_active')
+    for drug in drugs.order_by().iterator(chunk_size=5000):
+        label, words = drug_search_entry(drug)
+        yield drug.id, label, words, sold.get(drug.id, 0)
+
+
+def _patient_entries():
+    visits = dict(
+        Sale.objects.filter(date__gte=_recent_sales_start(), patient__isnull=False)
+        .values('patient').annotate(sales=Count('id')).values_list('patient', 'sales')
+    )
+    patients = Patient.objects.filter(is_walk_in=False).only(
+        'id', 'first_name', 'last_name', 'phone_number', 'is_walk_in'
+    )
+    for patient in patients.order_by().iterator(chunk_size=5000):
+        label, words = patient_search_entry(patient)
+        yield patient.id, label, words, visits.get(patient.id, 0)
+
+
+# Autocomplete sources: the objects that can be offered and the entries the index is built from
+SEARCH_SOURCES = {
+    'drugs': (Drug.objects.filter(is_active=True), _drug_entries),
+    'patients': (Patient.objects.filter(is_walk_in=False), _patient_entries),
+}
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def invalidate_search_index(source, entry_id=None, entry=None):
+    """Bump a search source's version once the current transaction commits.
+
+    When an entry id is given nothing happens if the loaded index already
+    has that (label, words) entry, so stock updates do not force a rebuild.
+    """
+    index = _indexes.get(source)
+    if entry_id is not None and index is not None and index.is_current(entry_id, entry):
+        return
+    bump_cache_version_on_commit(SEARCH_VERSION_KEY.format(source))
+
+
+def get_search_index(source):
+    """Return the process-local index of a search source, loading it when stale"""
+    version = cache_version(SEARCH_VERSION_KEY.format(source))
+    index = _indexes.get(source)
+    if index_is_current(index, version, SEARCH_INDEX_MAX_AGE):
+        return index
+
+    with _index_lock:
+        if not index_is_current(_indexes.get(source), version, SEARCH_INDEX_MAX_AGE):
+            _, entries = SEARCH_SOURCES[source]
+            _indexes[source] = PrefixSearchIndex(entries(), version)
+        return _indexes[source]
+
+
+def autocomplete_search(source, query, limit, offset=0):
+    """Return (objects, has_more) for one page of autocomplete results.
+
+    The index picks and orders the ids; the objects are then loaded by
+    primary key so prices and stock are current.
+    """
+    queryset, _ = SEARCH_SOURCES[source]
+    ids, has_more = get_search_index(source).search(query, limit, offset)
+    objects = queryset.in_bulk(ids)
+    return [objects[entry_id] for entry_id in ids if entry_id in objects], has_more
@@ -1,8 +1,20 @@
+from django.core.signals import request_started
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User, Group
 from django.utils import timezone
-from .models import UserProfile, Sale, SaleItem, InventoryLog, Drug
+from .models import UserProfile, Sale, SaleItem, InventoryLog, Drug, DrugInteraction, Patient
+from .matching import invalidate_drug_match_index
+from .interactions import invalidate_interaction_graph
+from .utils import invalidate_notification_counts
+from .rollups import sale_day, schedule_daily_sales_refresh
+from .invoice_pdf import invalidate_invoice_pdf
+from .barcodes import invalidate_barcode_index, warm_barcode_index
+from .catalogue import invalidate_drug_catalogue
+from .search import drug_search_entry, invalidate_search_index, patient_search_entry
+
+# Drug fields that feed the low stock and expiring notification counts
+NOTIFICATION_FIELDS = {'stock_quantity', 'reorder_level', 'expiry_date', 'is_active'}
 
 @receiver(post_save, sender=UserProfile)
 def assign_group_based_on_role(sender, instance, created, **kwargs):
@@ -66,3 +78,126 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         # Default to Sales Clerk role
         UserProfile.objects.create(user=instance, role='Sales Clerk')
+
+@receiver(post_save, sender=Drug)
+def refresh_match_index_on_drug_save(sender, instance, **kwargs):
+    """
+    Invalidate the invoice matching index when a drug is renamed or added
+    """
+    invalidate_drug_match_index(instance)
+
+@receiver(post_delete, sender=Drug)
+def refresh_match_index_on_drug_delete(sender, instance, **kwargs):
+    """
+    Invalidate the invoice matching index when a drug is removed
+    """
+    invalidate_drug_match_index()
+
+@receiver(post_save, sender=Drug)
+def refresh_barcode_index_on_drug_save(sender, instance, **kwargs):
+    """
+    Invalidate the barcode index when a drug's barcode or active state changes
+    """
+    invalidate_barcode_index(instance)
+
+@receiver(post_delete, sender=Drug)
+def refresh_barcode_index_on_drug_delete(sender, instance, **kwargs):
+    """
+    Invalidate the barcode index when a drug is removed
+    """
+    invalidate_barcode_index()
+
+@receiver(post_save, sender=Drug)
+@receiver(post_delete, sender=Drug)
+def refresh_drug_catalogue(sender, instance, **kwargs):
+    """
+    Start a new catalogue version so the tills fetch the drug's new name, price or stock
+    """
+    invalidate_drug_catalogue([instance.id])
+
+@receiver(post_save, sender=Drug)
+def refresh_drug_search_on_save(sender, instance, **kwargs):
+    """
+    Invalidate the drug autocomplete index when a drug is renamed, added or deactivated
+    """
+    invalidate_search_index('drugs', instance.id, drug_search_entry(instance))
+
+@receiver(post_delete, sender=Drug)
+def refresh_drug_search_on_delete(sender, instance, **kwargs):
+    """
+    Invalidate the drug autocomplete index when a drug is removed
+    """
+    invalidate_search_index('drugs')
+
+@receiver(post_save, sender=Patient)
+def refresh_patient_search_on_save(sender, instance, **kwargs):
+    """
+    Invalidate the patient autocomplete index when a patient is added or renamed
+    """
+    invalidate_search_index('patients', instance.id, patient_search_entry(instance))
+
+@receiver(post_delete, sender=Patient)
+def refresh_patient_search_on_delete(sender, instance, **kwargs):
+    """
+    Invalidate the patient autocomplete index when a patient is removed
+    """
+    invalidate_search_index('patients')
+
+@receiver(request_started, dispatch_uid='warm_barcode_index')
+def warm_barcode_index_on_startup(sender, **kwargs):
+    """
+    Load the barcode index in the background when the server handles its first request
+    """
+    request_started.disconnect(dispatch_uid='warm_barcode_index')
+    warm_barcode_index()
+
+@receiver(post_save, sender=Drug)
+@receiver(post_delete, sender=Drug)
+def refresh_notification_counts(sender, instance, **kwargs):
+    """
+    Invalidate the cached notification counts when a drug's stock, reorder level or expiry may have changed
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not NOTIFICATION_FIELDS.intersection(update_fields):
+        return
+    invalidate_notification_counts()
+
+@receiver(post_save, sender=DrugInteraction)
+@receiver(post_delete, sender=DrugInteraction)
+def refresh_interaction_graph(sender, instance, **kwargs):
+    """
+    Invalidate the in-memory interaction graph when an interaction changes
+    """
+    invalidate_interaction_graph()
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def refresh_sales_rollup_on_sale_change(sender, instance, **kwargs):
+    """
+    Refresh the daily sales rollup for the day of a saved or deleted sale
+    """
+    schedule_daily_sales_refresh(sale_day(instance))
+
+@receiver(post_save, sender=SaleItem)
+@receiver(post_delete, sender=SaleItem)
+def refresh_sales_rollup_on_item_change(sender, instance, **kwargs):
+    """
+    Refresh the daily sales rollup when an item is added to, changed on or removed from a sale
+    """
+    schedule_daily_sales_refresh(sale_day(instance.sale))
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def refresh_invoice_pdf_on_sale_change(sender, instance, **kwargs):
+    """
+    Drop the cached invoice PDF when a sale is edited or deleted
+    """
+    invalidate_invoice_pdf(instance.id)
+
+@receiver(post_save, sender=SaleItem)
+@receiver(post_delete, sender=SaleItem)
+def refresh_invoice_pdf_on_item_change(sender, instance, **kwargs):
+    """
+    Drop the cached invoice PDF when a sale's items change
+    """
+    invalidate_invoice_pdf(instance.sale_id)
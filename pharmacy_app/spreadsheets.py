@@ -0,0 +1,28 @@
+import openpyxl
+
+
+def _iter_rows(workbook, min_row):
+    try:
+        for row in workbook.active.iter_rows(min_row=min_row, values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+
+def read_sheet_rows(file, min_row=1):
+    """Stream the active sheet of a workbook as tuples of cell values.
+
+    The workbook is opened in read-only mode, so rows are parsed from the
+    file as they are consumed and memory use does not grow with the number
+    of rows. Opening errors are raised immediately; the workbook is closed
+    once the returned iterator is exhausted or garbage collected.
+    """
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    return _iter_rows(workbook, min_row)
+
+
+def cell_at(row, column):
+    """Return the value at a 0-based column of a row tuple, or None if absent"""
+    if column is None or column >= len(row):
+        return None
+    return row[column]
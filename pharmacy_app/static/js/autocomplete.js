@@ -0,0 +1,209 @@
+/**
+ * Autocomplete fields for Pharmacy Management System
+ * Turns the selects rendered by AutocompleteSelect into search-as-you-type
+ * fields backed by the search API, so the page never lists every drug or patient
+ */
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('select[data-autocomplete-url]:not([data-autocomplete-manual])').forEach(initAutocompleteSelect);
+});
+
+const AUTOCOMPLETE_PAGE_SIZE = 20;
+const AUTOCOMPLETE_DELAY = 200;
+
+/**
+ * Select an id in an autocomplete select, adding its option first since
+ * only the selected option is rendered by the server
+ */
+function setAutocompleteSelectValue(selectElement, id, text) {
+    id = id === null || id === undefined ? '' : id.toString();
+    if (id && !Array.from(selectElement.options).some(opt => opt.value === id)) {
+        selectElement.add(new Option(text, id));
+    }
+    selectElement.value = id;
+
+    const input = document.getElementById(selectElement.id + '_autocomplete');
+    if (input) {
+        input.value = id ? text : '';
+    }
+}
+
+function selectedText(selectElement) {
+    const option = selectElement.options[selectElement.selectedIndex];
+    return option && option.value ? option.text : '';
+}
+
+/**
+ * Build the text input and result list for one autocomplete select
+ */
+function initAutocompleteSelect(selectElement) {
+    if (document.getElementById(selectElement.id + '_autocomplete')) return;
+
+    const url = selectElement.dataset.autocompleteUrl;
+
+    const input = document.createElement('input');
+    input.type = 'text';
+    input.id = selectElement.id + '_autocomplete';
+    input.className = 'autocomplete-input';
+    input.autocomplete = 'off';
+    input.placeholder = selectElement.getAttribute('placeholder') || 'Type to search...';
+    input.value = selectedText(selectElement);
+    input.disabled = selectElement.disabled;
+
+    const results = document.createElement('ul');
+    results.className = 'collection autocomplete-results';
+    results.style.display = 'none';
+
+    selectElement.style.display = 'none';
+    selectElement.insertAdjacentElement('afterend', input);
+    input.insertAdjacentElement('afterend', results);
+    if (getComputedStyle(selectElement.parentNode).position === 'static') {
+        selectElement.parentNode.style.position = 'relative';
+    }
+
+    // Keep Materialize labels above the field
+    const label = selectElement.parentNode.querySelector('label');
+    if (label) {
+        label.classList.add('active');
+    }
+
+    let timer = null;
+    let requestSeq = 0;
+    let highlighted = -1;
+
+    function hideResults() {
+        results.style.display = 'none';
+        results.innerHTML = '';
+        highlighted = -1;
+    }
+
+    function choose(result) {
+        setAutocompleteSelectValue(selectElement, result.id, result.text);
+        hideResults();
+        selectElement.dispatchEvent(new Event('change', { bubbles: true }));
+    }
+
+    function highlight(index) {
+        const items = results.querySelectorAll('.autocomplete-result');
+        if (!items.length) return;
+        highlighted = (index + items.length) % items.length;
+        items.forEach((item, i) => item.classList.toggle('active', i === highlighted));
+        items[highlighted].scrollIntoView({block: 'nearest'});
+    }
+
+    function renderResults(data, offset) {
+        const more = results.querySelector('.autocomplete-more');
+        if (more) {
+            more.remove();
+        }
+        if (offset === 0) {
+            results.innerHTML = '';
+            highlighted = -1;
+        }
+
+        data.results.forEach(result => {
+            const item = document.createElement('li');
+            item.className = 'collection-item autocomplete-result';
+            item.textContent = result.text;
+            if (result.available_stock !== undefined) {
+                const stock = document.createElement('span');
+                stock.className = 'secondary-content grey-text';
+                stock.textContent = `Stock: ${result.available_stock}`;
+                item.appendChild(stock);
+            } else if (result.phone_number) {
+                const phone = document.createElement('span');
+                phone.className = 'secondary-content grey-text';
+                phone.textContent = result.phone_number;
+                item.appendChild(phone);
+            }
+            // mousedown fires before the input loses focus
+            item.addEventListener('mousedown', function(e) {
+                e.preventDefault();
+                choose(result);
+            });
+            results.appendChild(item);
+        });
+
+        if (data.has_more) {
+            const moreItem = document.createElement('li');
+            moreItem.className = 'collection-item autocomplete-more center-align blue-text';
+            moreItem.textContent = 'Show more results';
+            moreItem.addEventListener('mousedown', function(e) {
+                e.preventDefault();
+                search(input.value.trim(), data.next_offset);
+            });
+            results.appendChild(moreItem);
+        }
+
+        if (!results.children.length) {
+            const empty = document.createElement('li');
+            empty.className = 'collection-item grey-text';
+            empty.textContent = 'No matches';
+            results.appendChild(empty);
+        }
+        results.style.display = 'block';
+    }
+
+    function search(query, offset) {
+        const seq = ++requestSeq;
+        const params = new URLSearchParams({q: query, limit: AUTOCOMPLETE_PAGE_SIZE, offset: offset});
+
+        fetch(`${url}?${params}`, {
+            headers: {'Accept': 'application/json'},
+            credentials: 'same-origin'
+        })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Network response was not ok');
+                }
+                return response.json();
+            })
+            .then(data => {
+                // Ignore answers to queries the user has already typed past
+                if (seq === requestSeq && document.activeElement === input) {
+                    renderResults(data, offset);
+                }
+            })
+            .catch(error => {
+                console.error('Error searching:', error);
+            });
+    }
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        if (!this.value.trim() && selectElement.value) {
+            setAutocompleteSelectValue(selectElement, '', '');
+            selectElement.dispatchEvent(new Event('change', { bubbles: true }));
+        }
+        timer = setTimeout(() => search(this.value.trim(), 0), AUTOCOMPLETE_DELAY);
+    });
+
+    input.addEventListener('focus', function() {
+        search(this.value === selectedText(selectElement) ? '' : this.value.trim(), 0);
+    });
+
+    input.addEventListener('keydown', function(e) {
+        if (results.style.display === 'none') return;
+
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            highlight(highlighted + (e.key === 'ArrowDown' ? 1 : -1));
+        } else if (e.key === 'Enter') {
+            const items = results.querySelectorAll('.autocomplete-result');
+            if (items.length) {
+                e.preventDefault();
+                items[Math.max(highlighted, 0)].dispatchEvent(new Event('mousedown'));
+            }
+        } else if (e.key === 'Escape') {
+            hideResults();
+        }
+    });
+
+    input.addEventListener('blur', function() {
+        clearTimeout(timer);
+        requestSeq++;
+        hideResults();
+        // Typed text that was not picked from the list is discarded
+        this.value = selectedText(selectElement);
+    });
+}
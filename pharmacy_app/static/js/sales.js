@@ -27,14 +27,151 @@ function initializeSalesForm() {
     // Update the initial total calculation
     updateTotalCalculation();
     
-    // Initialize select fields
-    initializeSelectFields();
-    
     // Set up form validation
     setupFormValidation();
     
     // Set up barcode scanner
     setupBarcodeScanner();
+    
+    // Load prices and stock for rows already in the form, and refresh them when the
+    // till comes back into focus since other tills may have sold the same stock
+    refreshBasketInfo();
+    window.addEventListener('focus', refreshBasketInfo);
+    
+    // Load the drug list from the catalogue cached in the browser, fetching only what changed
+    loadDrugCatalogue();
+    window.addEventListener('focus', loadDrugCatalogue);
+}
+
+const CATALOGUE_STORAGE_KEY = 'pharmacyDrugCatalogue';
+
+// {version, drugs: {id: {id, name, brand, price, stock, barcode}}}
+let drugCatalogue = null;
+let catalogueRequest = null;
+// Lookups built from the catalogue for the autocomplete fields and barcode scans
+let catalogueLookups = null;
+
+function readStoredCatalogue() {
+    try {
+        return JSON.parse(localStorage.getItem(CATALOGUE_STORAGE_KEY));
+    } catch (e) {
+        return null;
+    }
+}
+
+function storeCatalogue(catalogue) {
+    try {
+        localStorage.setItem(CATALOGUE_STORAGE_KEY, JSON.stringify(catalogue));
+    } catch (e) {
+        // Storage full or disabled: the catalogue is simply downloaded again next time
+        console.warn('Could not store the drug catalogue:', e);
+    }
+}
+
+/**
+ * Bring the drug catalogue up to date. The version cached in the browser is
+ * sent along, so only drugs changed since then are downloaded. If the server
+ * cannot be reached the cached catalogue is used as it is.
+ */
+function loadDrugCatalogue() {
+    if (catalogueRequest) return catalogueRequest;
+    
+    const cached = drugCatalogue || readStoredCatalogue();
+    const url = cached ? `/api/drugs/catalogue/?since=${cached.version}` : '/api/drugs/catalogue/';
+    
+    catalogueRequest = fetch(url, {
+        headers: {'Accept': 'application/json'},
+        credentials: 'same-origin'
+    })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            return response.json();
+        })
+        .then(data => {
+            const drugs = (data.full || !cached) ? {} : cached.drugs;
+            data.drugs.forEach(values => {
+                const drug = {};
+                data.fields.forEach((field, i) => {
+                    drug[field] = values[i];
+                });
+                drugs[drug.id] = drug;
+            });
+            data.removed.forEach(drugId => {
+                delete drugs[drugId];
+            });
+            
+            const changed = !drugCatalogue || data.full || data.drugs.length || data.removed.length;
+            drugCatalogue = {version: data.version, drugs: drugs};
+            if (changed) {
+                storeCatalogue(drugCatalogue);
+                updateCatalogueLookups();
+            }
+            return drugCatalogue;
+        })
+        .catch(error => {
+            console.error('Error loading drug catalogue:', error);
+            if (cached && !drugCatalogue) {
+                drugCatalogue = cached;
+                updateCatalogueLookups();
+                M.toast({html: 'Working offline: using the saved drug list', classes: 'orange'});
+            } else if (!cached) {
+                M.toast({html: 'Error loading the drug list', classes: 'red'});
+            }
+            return drugCatalogue;
+        })
+        .finally(() => {
+            catalogueRequest = null;
+        });
+    
+    return catalogueRequest;
+}
+
+function drugLabel(drug) {
+    return `${drug.name} (${drug.brand})`;
+}
+
+/**
+ * Rebuild the autocomplete data and barcode lookup from the catalogue
+ * and hand the new data to every drug autocomplete field
+ */
+function updateCatalogueLookups() {
+    const lookups = {autocompleteData: {}, byLabel: {}, byBarcode: {}};
+    
+    Object.values(drugCatalogue.drugs).forEach(drug => {
+        if (drug.barcode) {
+            lookups.byBarcode[drug.barcode] = drug;
+        }
+        const key = drugLabel(drug).toLowerCase();
+        if (!(key in lookups.byLabel)) {
+            lookups.byLabel[key] = drug;
+        }
+        // Only drugs in stock are suggested
+        if (drug.stock > 0) {
+            lookups.autocompleteData[drugLabel(drug)] = null; // Format required by Materialize
+        }
+    });
+    catalogueLookups = lookups;
+    
+    document.querySelectorAll('input.autocomplete[data-target-select]').forEach(input => {
+        const instance = M.Autocomplete.getInstance(input);
+        if (instance) {
+            instance.updateData(lookups.autocompleteData);
+        }
+    });
+}
+
+/**
+ * Select a drug in a row's select, adding its option first since the page
+ * only renders the options of drugs already chosen
+ */
+function setDrugSelectValue(selectElement, drugId, label) {
+    drugId = drugId.toString();
+    if (!Array.from(selectElement.options).some(opt => opt.value === drugId)) {
+        selectElement.add(new Option(label, drugId));
+    }
+    selectElement.value = drugId;
 }
 
 /**
@@ -97,6 +234,7 @@ function setupRemoveButtons() {
             
             // Update the total calculation
             updateTotalCalculation();
+            checkInteractions();
         });
     });
 }
@@ -113,7 +251,7 @@ function setupItemListeners(index) {
     // Drug selection change event
     drugSelect.addEventListener('change', function() {
         if (this.value) {
-            fetchDrugInfo(this.value, index);
+            refreshBasketInfo();
         } else {
             // Clear the item info if no drug is selected
             const itemInfo = document.querySelector(`#id_saleitems-${index}-drug`).closest('.sale-item-row').querySelector('.item-info');
@@ -121,6 +259,7 @@ function setupItemListeners(index) {
                 itemInfo.style.display = 'none';
             }
             updateTotalCalculation();
+            checkInteractions();
         }
     });
     
@@ -146,18 +285,12 @@ function setupItemListeners(index) {
  * Convert a select dropdown to an autocomplete field
  */
 function convertToAutocomplete(selectElement) {
-    if (!selectElement) return;
+    if (!selectElement || document.getElementById(selectElement.id + '_autocomplete')) return;
     
     // Get the parent container for the select
     const inputField = selectElement.closest('.input-field');
     if (!inputField) return;
     
-    // Hide the original Materialize select dropdown
-    const selectWrapper = inputField.querySelector('.select-wrapper');
-    if (selectWrapper) {
-        selectWrapper.style.display = 'none';
-    }
-    
     // Create autocomplete input
     const autocompleteInput = document.createElement('input');
     autocompleteInput.type = 'text';
@@ -168,31 +301,24 @@ function convertToAutocomplete(selectElement) {
     // Add data attribute to link back to original select
     autocompleteInput.dataset.targetSelect = selectElement.id;
     
-    // Insert autocomplete input after the select wrapper
-    if (selectWrapper) {
-        selectWrapper.insertAdjacentElement('afterend', autocompleteInput);
-    } else {
-        // Fallback if select wrapper not found
-        selectElement.insertAdjacentElement('afterend', autocompleteInput);
-    }
+    // Insert autocomplete input after the (hidden) select
+    selectElement.insertAdjacentElement('afterend', autocompleteInput);
     
-    // Build data object for autocomplete
-    const autocompleteData = {};
-    Array.from(selectElement.options).forEach(option => {
-        if (option.value && option.text) {
-            autocompleteData[option.text] = null; // Format required by Materialize
-        }
-    });
+    // Show the drug already chosen (e.g. when the form comes back with errors)
+    if (selectElement.value && selectElement.selectedIndex >= 0) {
+        autocompleteInput.value = selectElement.options[selectElement.selectedIndex].text;
+    }
     
-    // Initialize Materialize autocomplete
+    // Initialize Materialize autocomplete with the drugs of the cached catalogue
     const instance = M.Autocomplete.init(autocompleteInput, {
-        data: autocompleteData,
+        data: catalogueLookups ? catalogueLookups.autocompleteData : {},
+        limit: 20,
         minLength: 1,
         onAutocomplete: function(text) {
-            // Find the option with matching text and select it
-            const option = Array.from(selectElement.options).find(opt => opt.text === text);
-            if (option) {
-                selectElement.value = option.value;
+            // Find the drug with matching text and select it
+            const drug = findDrugByLabel(text);
+            if (drug) {
+                setDrugSelectValue(selectElement, drug.id, text);
                 // Trigger change event to update drug info
                 selectElement.dispatchEvent(new Event('change', { bubbles: true }));
             }
@@ -203,18 +329,18 @@ function convertToAutocomplete(selectElement) {
     autocompleteInput.addEventListener('blur', function() {
         const enteredText = this.value.trim();
         if (enteredText) {
-            // Try to find a matching option
-            const matchingOption = Array.from(selectElement.options).find(opt => 
-                opt.text.toLowerCase() === enteredText.toLowerCase()
-            );
+            // Try to find a matching drug
+            const drug = findDrugByLabel(enteredText);
             
-            if (matchingOption) {
-                // Select the matching option
-                selectElement.value = matchingOption.value;
+            if (drug) {
+                const label = drugLabel(drug);
+                if (selectElement.value !== drug.id.toString()) {
+                    setDrugSelectValue(selectElement, drug.id, label);
+                    // Trigger change event
+                    selectElement.dispatchEvent(new Event('change', { bubbles: true }));
+                }
                 // Update the input to show the correct casing
-                this.value = matchingOption.text;
-                // Trigger change event
-                selectElement.dispatchEvent(new Event('change', { bubbles: true }));
+                this.value = label;
             } else {
                 // Reset input if no match
                 this.value = '';
@@ -225,13 +351,151 @@ function convertToAutocomplete(selectElement) {
             selectElement.value = '';
         }
     });
+    
+    // Until the catalogue has loaded (or if it cannot be), suggestions come from the search API
+    let searchTimer = null;
+    autocompleteInput.addEventListener('input', function() {
+        if (catalogueLookups) return;
+        
+        clearTimeout(searchTimer);
+        const query = this.value.trim();
+        if (!query) return;
+        
+        searchTimer = setTimeout(function() {
+            const params = new URLSearchParams({q: query, limit: 20});
+            fetch(`${selectElement.dataset.autocompleteUrl}?${params}`, {
+                headers: {'Accept': 'application/json'},
+                credentials: 'same-origin'
+            })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('Network response was not ok');
+                    }
+                    return response.json();
+                })
+                .then(data => {
+                    if (catalogueLookups) return;
+                    const suggestions = {};
+                    data.results.forEach(drug => {
+                        suggestions[drug.text] = null;
+                        searchedDrugs[drug.text.toLowerCase()] = drug;
+                    });
+                    instance.updateData(suggestions);
+                    instance.open();
+                })
+                .catch(error => {
+                    console.error('Error searching drugs:', error);
+                });
+        }, 200);
+    });
 }
 
+// Drugs returned by the search API, by lower-case label, while there is no catalogue
+const searchedDrugs = {};
+
+function findDrugByLabel(text) {
+    const key = text.toLowerCase();
+    return (catalogueLookups && catalogueLookups.byLabel[key]) || searchedDrugs[key];
+}
+
+/**
+ * Return {index, drugId} for every basket row with a drug selected
+ */
+function getBasketRows() {
+    const rows = [];
+    
+    document.querySelectorAll('.sale-item-row').forEach(row => {
+        // Skip rows marked for deletion
+        const deleteCheckbox = row.querySelector('input[id$="-DELETE"]');
+        if (deleteCheckbox && deleteCheckbox.checked) return;
+        
+        const drugSelect = row.querySelector('select[id$="-drug"]');
+        const match = drugSelect && drugSelect.id.match(/^id_saleitems-(\d+)-drug$/);
+        if (match && drugSelect.value) {
+            rows.push({index: parseInt(match[1]), drugId: drugSelect.value});
+        }
+    });
+    
+    return rows;
+}
+
+let basketRefreshTimer = null;
+
 /**
- * Fetch drug information from the API
+ * Fetch price, stock and expiry for every drug in the basket with one request.
+ * Calls made together share a request, and an unchanged basket is revalidated
+ * by the browser (ETag / 304) instead of being downloaded again.
  */
-function fetchDrugInfo(drugId, index) {
-    fetch(`/api/drugs/${drugId}/info/`)
+function refreshBasketInfo() {
+    if (basketRefreshTimer) return;
+    
+    basketRefreshTimer = setTimeout(function() {
+        basketRefreshTimer = null;
+        
+        const rows = getBasketRows();
+        if (!rows.length) {
+            checkInteractions();
+            return;
+        }
+        
+        // Sorted so the same basket always has the same URL and cached response
+        const drugIds = [...new Set(rows.map(row => parseInt(row.drugId)))].sort((a, b) => a - b);
+        
+        fetch(`/api/drugs/info/?ids=${drugIds.join(',')}`, {
+            headers: {'Accept': 'application/json'},
+            credentials: 'same-origin'
+        })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Network response was not ok');
+                }
+                return response.json();
+            })
+            .then(data => {
+                const drugs = {};
+                data.drugs.forEach(drug => {
+                    drugs[drug.id] = drug;
+                });
+                rows.forEach(row => {
+                    if (drugs[row.drugId]) {
+                        updateDrugInfo(drugs[row.drugId], row.index);
+                    }
+                });
+                checkInteractions();
+            })
+            .catch(error => {
+                console.error('Error fetching drug info:', error);
+                M.toast({html: 'Error fetching drug information', classes: 'red'});
+            });
+    }, 0);
+}
+
+/**
+ * Check the drugs currently in the form for interactions and show any warnings
+ */
+function checkInteractions() {
+    const drugIds = [];
+    
+    document.querySelectorAll('.sale-item-row').forEach(row => {
+        // Skip rows marked for deletion
+        const deleteCheckbox = row.querySelector('input[id$="-DELETE"]');
+        if (deleteCheckbox && deleteCheckbox.checked) return;
+        
+        const drugSelect = row.querySelector('select[id$="-drug"]');
+        if (drugSelect && drugSelect.value && !drugIds.includes(drugSelect.value)) {
+            drugIds.push(drugSelect.value);
+        }
+    });
+    
+    if (drugIds.length < 2) {
+        showInteractionWarnings([]);
+        return;
+    }
+    
+    fetch(`/api/drugs/interactions/?ids=${drugIds.join(',')}`, {
+        headers: {'Accept': 'application/json'},
+        credentials: 'same-origin'
+    })
         .then(response => {
             if (!response.ok) {
                 throw new Error('Network response was not ok');
@@ -239,14 +503,55 @@ function fetchDrugInfo(drugId, index) {
             return response.json();
         })
         .then(data => {
-            updateDrugInfo(data, index);
+            showInteractionWarnings(data.interactions || []);
         })
         .catch(error => {
-            console.error('Error fetching drug info:', error);
-            M.toast({html: 'Error fetching drug information', classes: 'red'});
+            console.error('Error checking drug interactions:', error);
         });
 }
 
+/**
+ * Render interaction warnings in the sales form
+ */
+function showInteractionWarnings(interactions) {
+    const panel = document.getElementById('interaction-warnings');
+    if (!panel) return;
+    
+    const list = panel.querySelector('.collection');
+    list.innerHTML = '';
+    
+    interactions.forEach(warning => {
+        let severityClass = 'yellow-text text-darken-3';
+        if (warning.severity === 'SEVERE') {
+            severityClass = 'red-text';
+        } else if (warning.severity === 'MODERATE') {
+            severityClass = 'orange-text';
+        }
+        
+        const item = document.createElement('li');
+        item.className = 'collection-item';
+        
+        const title = document.createElement('span');
+        title.className = 'title';
+        const drug1 = document.createElement('strong');
+        drug1.textContent = warning.drug1;
+        const drug2 = document.createElement('strong');
+        drug2.textContent = warning.drug2;
+        title.append(drug1, ' and ', drug2);
+        
+        const details = document.createElement('p');
+        const severity = document.createElement('span');
+        severity.className = severityClass;
+        severity.textContent = warning.severity;
+        details.append(severity, document.createElement('br'), warning.description);
+        
+        item.append(title, details);
+        list.appendChild(item);
+    });
+    
+    panel.style.display = interactions.length ? 'block' : 'none';
+}
+
 /**
  * Update the drug information display
  */
@@ -389,24 +694,6 @@ function updateTotalCalculation() {
     document.getElementById('summary-total').textContent = total.toFixed(2) + ' IQD';
 }
 
-/**
- * Initialize select fields for drug and patient
- */
-function initializeSelectFields() {
-    // Auto-initialize any selected patient from URL parameters
-    const urlParams = new URLSearchParams(window.location.search);
-    const patientId = urlParams.get('patient');
-    
-    if (patientId) {
-        const patientSelect = document.getElementById('id_patient');
-        if (patientSelect) {
-            patientSelect.value = patientId;
-            // Reinitialize the Materialize select
-            M.FormSelect.init(patientSelect);
-        }
-    }
-}
-
 /**
  * Set up form validation before submission
  */
@@ -537,6 +824,14 @@ function setupBarcodeScanner() {
 function fetchDrugByBarcode(barcode) {
     console.log('Fetching drug by barcode:', barcode);
     
+    // Exact scans are resolved from the cached catalogue, which also works offline;
+    // the price and stock are refreshed from the server once the row is added
+    const drug = catalogueLookups && catalogueLookups.byBarcode[barcode];
+    if (drug) {
+        addDrugToForm({id: drug.id, name: drug.name, brand: drug.brand, price: drug.price, available_stock: drug.stock});
+        return;
+    }
+    
     // Show a toast to indicate the scanning is in progress
     M.toast({html: `Scanning barcode: ${barcode}...`, classes: 'blue'});
     
@@ -659,12 +954,13 @@ function addDrugToForm(drugData) {
                 }
                 
                 // Set values
-                drugSelect.value = drugData.id;
+                setDrugSelectValue(drugSelect, drugData.id, `${drugData.name} (${drugData.brand})`);
+                const autocompleteInput = document.getElementById(drugSelect.id + '_autocomplete');
+                if (autocompleteInput) {
+                    autocompleteInput.value = `${drugData.name} (${drugData.brand})`;
+                }
                 quantityInput.value = 1;
                 
-                // Update the select with Materialize
-                M.FormSelect.init(drugSelect);
-                
                 // Activate the quantity input label (this fixes the label being stuck on the value)
                 M.updateTextFields();
                 
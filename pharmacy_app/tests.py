@@ -0,0 +1,357 @@
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .barcodes import BarcodeIndex, find_drug_by_barcode
+from .catalogue import CATALOGUE_CHANGES_KEY, catalogue_response_body, invalidate_drug_catalogue
+from .invoice_numbers import format_invoice_number
+from .models import Drug, DrugCategory, InventoryLog, Sale, SaleItem
+from .pagination import encode_cursor
+from .reports import inventory_report_context
+from .sales import InsufficientStockError, commit_sale
+from .utils import _notification_cache_key, get_notification_counts
+from .valuation import get_inventory_valuation
+
+# Tests clear the cache, so they get their own instead of the configured shared one
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_drug(name, stock_quantity=10, **fields):
+    fields.setdefault('brand', 'Test')
+    fields.setdefault('cost_price', Decimal('1.00'))
+    fields.setdefault('selling_price', Decimal('2.00'))
+    fields.setdefault('expiry_date', timezone.now().date() + timedelta(days=365))
+    return Drug.objects.create(name=name, stock_quantity=stock_quantity, **fields)
+
+
+def make_user(username, role='Admin'):
+    user = User.objects.create_user(username, password='password')
+    user.profile.role = role
+    user.profile.save()
+    return user
+
+
+def run_in_threads(target, count):
+    """Run target(index) in `count` threads started together; return what each raised"""
+    barrier = threading.Barrier(count)
+    errors = [None] * count
+
+    def run(index):
+        try:
+            barrier.wait()
+            target(index)
+        except Exception as e:
+            errors[index] = e
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class ConcurrencyTestCase(TransactionTestCase):
+    """Tests running threads that write through their own database connections.
+
+    SQLite's default in-memory test database fails concurrent writers with
+    "database table is locked" instead of waiting, so these need PostgreSQL
+    or a file test database (DATABASES['default']['TEST']['NAME']).
+    """
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("needs a database that lets concurrent connections wait for each other")
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CommitSaleConcurrencyTests(ConcurrencyTestCase):
+    """Two tills selling the last unit of a drug at the same time"""
+
+    def test_only_one_till_sells_the_last_unit(self):
+        user = User.objects.create_user('till')
+        drug = make_drug('Amoxicillin', stock_quantity=1)
+
+        def sell(index):
+            commit_sale(Sale(user=user), [(Drug.objects.get(id=drug.id), 1)])
+
+        errors = run_in_threads(sell, 2)
+
+        self.assertEqual(errors.count(None), 1)
+        failure = next(error for error in errors if error is not None)
+        self.assertIsInstance(failure, InsufficientStockError)
+        self.assertEqual(failure.shortages[0][1:], (0, 1))
+
+        drug.refresh_from_db()
+        self.assertEqual(drug.stock_quantity, 0)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(SaleItem.objects.count(), 1)
+        self.assertEqual(InventoryLog.objects.filter(operation_type='SALE').count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class NotificationCountCacheTests(TestCase):
+    """Low stock and expiring counts are cached between drug changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(make_user('pharmacist'))
+        self.drug = make_drug('Ibuprofen', stock_quantity=50, reorder_level=10)
+        make_drug('Cetirizine', stock_quantity=5, reorder_level=10)
+
+    def test_warm_cache_makes_no_queries(self):
+        get_notification_counts()
+        with self.assertNumQueries(0):
+            counts = get_notification_counts()
+        self.assertEqual(counts, {'low_stock_count': 1, 'expiring_count': 0})
+
+    def assertPageSkipsNotificationQueries(self, url):
+        self.client.get(url)
+        cache.delete(_notification_cache_key())
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(url)
+        # Only the two count queries are saved once the counts are cached
+        with self.assertNumQueries(len(cold) - 2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_notifications'], 1)
+
+    def test_dashboard_uses_cached_counts(self):
+        self.assertPageSkipsNotificationQueries(reverse('dashboard'))
+
+    def test_drug_list_uses_cached_counts(self):
+        self.assertPageSkipsNotificationQueries(reverse('drug_list'))
+
+    def test_stock_reorder_and_expiry_changes_invalidate(self):
+        changes = [
+            ('stock_quantity', 5, {'low_stock_count': 2, 'expiring_count': 0}),
+            ('reorder_level', 0, {'low_stock_count': 1, 'expiring_count': 0}),
+            ('expiry_date', timezone.now().date() + timedelta(days=10), {'low_stock_count': 1, 'expiring_count': 1}),
+        ]
+        for field, value, expected in changes:
+            with self.subTest(field=field):
+                get_notification_counts()
+                setattr(self.drug, field, value)
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.drug.save(update_fields=[field])
+                self.assertEqual(get_notification_counts(), expected)
+
+    def test_other_changes_keep_the_cache(self):
+        get_notification_counts()
+        self.drug.description = 'Pain relief'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.drug.save(update_fields=['description'])
+        with self.assertNumQueries(0):
+            get_notification_counts()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class KeysetCursorTests(TestCase):
+    """Tampered list cursors are rejected instead of failing the query"""
+
+    def setUp(self):
+        self.client.force_login(make_user('clerk'))
+
+    def test_sale_list_ignores_invalid_cursor(self):
+        for values in (['garbage', 1], [None, 1], ['2024-01-01T00:00:00+00:00', 'x'], [[1], 2]):
+            with self.subTest(values=values):
+                response = self.client.get(reverse('sale_list'), {'after': encode_cursor(values)})
+                self.assertEqual(response.status_code, 200)
+
+    def test_drug_list_json_rejects_invalid_cursor(self):
+        response = self.client.get(reverse('drug_list'), {'format': 'json', 'after': encode_cursor(['a', 'b', 'x'])})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class InventoryValuationQueryTests(TestCase):
+    """Valuing and listing the inventory costs the same queries however many categories there are"""
+
+    def setUp(self):
+        self.add_categories(0, 3)
+        make_drug('Uncategorised', stock_quantity=3)
+
+    def add_categories(self, first, last):
+        for n in range(first, last):
+            category = DrugCategory.objects.create(name=f"Category {n}")
+            for m in range(3):
+                make_drug(f"Drug {n}-{m}", stock_quantity=m, category=category, cost_price=Decimal('2.50'))
+
+    def test_valuation_is_one_query(self):
+        with self.assertNumQueries(1):
+            valuation = get_inventory_valuation()
+        self.assertEqual(valuation['drug_count'], 10)
+        self.assertEqual(valuation['total_stock_value'], Decimal('25.50'))
+        self.assertEqual(valuation['low_stock_count'], 10)
+        self.assertEqual(len(valuation['categories']), 4)
+
+    def test_inventory_listing_loads_categories_with_the_drugs(self):
+        today = timezone.now().date()
+        context = inventory_report_context(today, today)
+        with self.assertNumQueries(1):
+            names = {drug.category.name if drug.category else None for drug in context['drugs']}
+        self.assertEqual(names, {'Category 0', 'Category 1', 'Category 2', None})
+
+    def test_inventory_report_queries_do_not_grow_with_categories(self):
+        self.client.force_login(make_user('manager', role='Manager'))
+        self.client.get(reverse('inventory_report'))
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('inventory_report'))
+        self.add_categories(3, 6)
+        with self.assertNumQueries(len(few)):
+            response = self.client.get(reverse('inventory_report'))
+        self.assertEqual(len(response.context['valuation']['categories']), 7)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class InvoiceNumberConcurrencyTests(ConcurrencyTestCase):
+    """Tills saving sales at the same time get unique, consecutive invoice numbers"""
+
+    THREADS = 8
+    # Scaled down from a full day of 10,000 sales; set INVOICE_STRESS_SALES=10000 for that
+    SALES = int(os.getenv('INVOICE_STRESS_SALES', '400'))
+
+    def test_concurrent_sales_are_numbered_without_gaps(self):
+        per_thread = self.SALES // self.THREADS
+
+        def sell(index):
+            for _ in range(per_thread):
+                Sale.objects.create()
+
+        errors = run_in_threads(sell, self.THREADS)
+        self.assertEqual(errors, [None] * self.THREADS)
+
+        today = timezone.localdate()
+        prefix = format_invoice_number(today, 0)[:-5]
+        invoice_numbers = list(Sale.objects.values_list('invoice_number', flat=True))
+        self.assertEqual(len(invoice_numbers), per_thread * self.THREADS)
+        self.assertTrue(all(number.startswith(prefix) for number in invoice_numbers))
+
+        # PostgreSQL sequences survive the flush between tests, so count from the lowest number
+        numbers = sorted(int(number[len(prefix):]) for number in invoice_numbers)
+        self.assertEqual(numbers, list(range(numbers[0], numbers[0] + len(numbers))))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BarcodeScanTests(TestCase):
+    """Scans resolve to the same drug as the old exact-then-icontains queries"""
+
+    def setUp(self):
+        # A new cache version makes the barcode index reload these drugs
+        cache.clear()
+        self.zeta = make_drug('Zeta', barcode='12345')
+        self.alpha = make_drug('Alpha', barcode='99123AB')
+        self.beta = make_drug('Beta', barcode='55ab')
+
+    def test_exact_scan_wins(self):
+        self.assertEqual(find_drug_by_barcode('12345'), self.zeta)
+
+    def test_partial_scan_picks_the_first_drug_by_name(self):
+        # Zeta's barcode starts with the scan, but Alpha sorts first by name as with icontains().first()
+        for scan in ('123', '23', 'ab', 'AB'):
+            with self.subTest(scan=scan):
+                expected = Drug.objects.filter(barcode__icontains=scan, is_active=True).first()
+                self.assertEqual(find_drug_by_barcode(scan), expected)
+        self.assertEqual(find_drug_by_barcode('123'), self.alpha)
+        self.assertIsNone(find_drug_by_barcode('777'))
+
+    def test_index_ties_break_by_rank(self):
+        index = BarcodeIndex([(3, 'X10'), (1, 'Y10'), (2, '10Z')])
+        self.assertEqual(index.find('10'), 3)
+        self.assertEqual(index.find('Z'), 2)
+        self.assertIsNone(index.find(''))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DrugCatalogueDeltaTests(TestCase):
+    """Tills holding an older catalogue version fetch only the drugs changed since"""
+
+    def setUp(self):
+        cache.clear()
+        self.aspirin = make_drug('Aspirin', stock_quantity=5)
+        self.codeine = make_drug('Codeine', stock_quantity=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_drug_catalogue()
+        self.version = self.fetch()['version']
+
+    def fetch(self, since=None):
+        return json.loads(catalogue_response_body(since))
+
+    def test_full_catalogue(self):
+        body = self.fetch()
+        self.assertTrue(body['full'])
+        self.assertEqual([row[0] for row in body['drugs']], [self.aspirin.id, self.codeine.id])
+
+    def test_sale_sends_only_the_sold_drug(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            commit_sale(Sale(), [(self.aspirin, 2)])
+        body = self.fetch(self.version)
+        self.assertFalse(body['full'])
+        self.assertEqual(body['drugs'], [[self.aspirin.id, 'Aspirin', 'Test', 2.0, 3, '']])
+        self.assertEqual(body['removed'], [])
+        self.assertEqual(self.fetch(body['version'])['drugs'], [])
+
+    def test_deactivated_drug_is_removed(self):
+        self.codeine.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.codeine.save()
+        body = self.fetch(self.version)
+        self.assertEqual((body['full'], body['drugs'], body['removed']), (False, [], [self.codeine.id]))
+
+    def test_unknown_or_unlogged_versions_send_everything(self):
+        self.assertTrue(self.fetch('garbage')['full'])
+        self.assertTrue(self.fetch(self.version - 1)['full'])
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_drug_catalogue()
+        self.assertTrue(self.fetch(self.version)['full'])
+
+    def test_evicted_change_log_sends_everything(self):
+        for drug in (self.aspirin, self.codeine):
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidate_drug_catalogue([drug.id])
+        cache.delete(CATALOGUE_CHANGES_KEY.format(self.version + 1))
+        self.assertTrue(self.fetch(self.version)['full'])
+        self.assertFalse(self.fetch(self.version + 1)['full'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogueVersionConcurrencyTests(ConcurrencyTestCase):
+    """Drugs changed by concurrent transactions each get their own catalogue version"""
+
+    THREADS = 8
+
+    def test_concurrent_changes_are_all_delivered(self):
+        # The file cache the project uses by default, whose incr is not atomic
+        with tempfile.TemporaryDirectory() as location, self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+        }}):
+            self.check_concurrent_changes()
+
+    def check_concurrent_changes(self):
+        drugs = [make_drug(f"Drug {n}") for n in range(self.THREADS)]
+        version = json.loads(catalogue_response_body())['version']
+
+        def change(index):
+            with transaction.atomic():
+                invalidate_drug_catalogue([drugs[index].id])
+
+        errors = run_in_threads(change, self.THREADS)
+        self.assertEqual(errors, [None] * self.THREADS)
+
+        body = json.loads(catalogue_response_body(version))
+        self.assertEqual(body['version'], version + self.THREADS)
+        self.assertFalse(body['full'])
+        self.assertEqual([row[0] for row in body['drugs']], [drug.id for drug in drugs])
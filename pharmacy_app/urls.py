@@ -13,6 +13,7 @@ urlpatterns = [
     
     # Drug Management
     path('drugs/import/', views.drug_import, name='drug_import'),
+    path('drugs/import/errors/', views.drug_import_errors, name='drug_import_errors'),
     path('drugs/', views.drug_list, name='drug_list'),
     path('drugs/add/', views.drug_add, name='drug_add'),
     path('drugs/<int:drug_id>/', views.drug_detail, name='drug_detail'),
@@ -27,6 +28,7 @@ urlpatterns = [
     # Sales
     path('sales/new/', views.new_sale, name='new_sale'),
     path('sales/', views.sale_list, name='sale_list'),
+    path('sales/invoices/', views.sale_invoice_batch, name='sale_invoice_batch'),
     path('sales/<int:sale_id>/', views.sale_detail, name='sale_detail'),
     path('sales/<int:sale_id>/edit/', views.sale_edit, name='sale_edit'),
     path('sales/<int:sale_id>/delete/', views.sale_delete, name='sale_delete'),
@@ -36,6 +38,8 @@ urlpatterns = [
     path('reports/', views.reports_index, name='reports_index'),
     path('reports/sales/', views.sales_report, name='sales_report'),
     path('reports/inventory/', views.inventory_report, name='inventory_report'),
+    path('reports/exports/<int:job_id>/status/', views.report_job_status, name='report_job_status'),
+    path('reports/exports/<int:job_id>/download/', views.report_job_download, name='report_job_download'),
     
     # User Management
     path('users/', views.user_list, name='user_list'),
@@ -52,10 +56,15 @@ urlpatterns = [
     path('invoices/upload/', views.invoice_upload, name='invoice_upload'),
     path('invoices/<int:invoice_id>/', views.invoice_detail, name='invoice_detail'),
     path('invoices/<int:invoice_id>/process/', views.invoice_process, name='invoice_process'),
+    path('invoices/<int:invoice_id>/status/', views.invoice_status, name='invoice_status'),
     path('invoices/<int:invoice_id>/import/', views.invoice_import, name='invoice_import'),
     path('invoices/item/<int:item_id>/match/', views.invoice_item_match, name='invoice_item_match'),
     
     # API endpoints
     path('api/drugs/<int:drug_id>/info/', views.get_drug_info, name='get_drug_info'),
+    path('api/drugs/info/', views.get_drugs_info, name='get_drugs_info'),
+    path('api/drugs/catalogue/', views.get_drug_catalogue, name='get_drug_catalogue'),
     path('api/drugs/barcode/', views.get_drug_by_barcode, name='get_drug_by_barcode'),
+    path('api/search/<str:source>/', views.autocomplete_search_api, name='autocomplete_search'),
+    path('api/drugs/interactions/', views.get_basket_interactions, name='get_basket_interactions'),
 ]
@@ -1,13 +1,18 @@
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
 from django.template.loader import get_template
 from django.utils import timezone
 from django.shortcuts import redirect
 from django.contrib import messages
-from django.db import models
-from functools import wraps
-from datetime import timedelta
+from django.db import models, transaction
+from functools import partial, wraps
+from datetime import datetime, time, timedelta
 import xhtml2pdf.pisa as pisa
+import csv
 import io
+from time import monotonic, time_ns
+import xlsxwriter
 
 def render_to_pdf(template_src, context_dict={}):
     """Generate PDF from HTML template with context data"""
@@ -27,6 +32,45 @@ def render_to_pdf(template_src, context_dict={}):
         return result.getvalue()
     return None
 
+class EchoBuffer:
+    """Pseudo file whose write() returns the data, so csv.writer rows can be streamed"""
+    def write(self, value):
+        return value
+
+def stream_csv(filename, rows, chunk_rows=None):
+    """Return a StreamingHttpResponse that writes `rows` as CSV while they are produced"""
+    chunk_rows = chunk_rows or settings.EXPORT_CHUNK_SIZE
+    writer = csv.writer(EchoBuffer())
+
+    def chunks():
+        chunk = []
+        for row in rows:
+            chunk.append(writer.writerow(row))
+            if len(chunk) >= chunk_rows:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+
+    response = StreamingHttpResponse(chunks(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+def write_xlsx(output, sheets):
+    """Write (sheet name, rows) pairs to `output` as an Excel workbook.
+
+    Uses xlsxwriter's constant_memory mode, which flushes each row as it is
+    written, so memory stays flat however many rows there are. The first row
+    of each sheet is formatted as its header.
+    """
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    header_format = workbook.add_format({'bold': True, 'bg_color': '#f2f2f2'})
+    for sheet_name, rows in sheets:
+        worksheet = workbook.add_worksheet(sheet_name)
+        for row_number, row in enumerate(rows):
+            worksheet.write_row(row_number, 0, row, header_format if row_number == 0 else None)
+    workbook.close()
+
 def check_role_permission(user, allowed_roles):
     """Check if user has any of the allowed roles"""
     if user.is_superuser:
@@ -54,6 +98,14 @@ def requires_role(allowed_roles):
         return _wrapped_view
     return decorator
 
+def start_of_day(day):
+    """Return the aware datetime at which a calendar day starts in the current timezone.
+
+    Filtering with start_of_day(first) <= date < start_of_day(last + 1 day)
+    keeps the column bare, unlike date__date lookups, so indexes still apply.
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
 def get_low_stock_drugs():
     """Get all drugs with stock below reorder level"""
     from .models import Drug
@@ -73,11 +125,79 @@ def get_expiring_drugs():
         expiry_date__lte=two_months_later
     ).order_by('expiry_date')
 
+def _notification_cache_key():
+    # Expiry windows move with the date, so each day gets its own entry
+    return f"notification_counts:{timezone.now().date().isoformat()}"
+
+def get_notification_counts():
+    """Return the low stock and expiring drug counts, cached between drug changes"""
+    key = _notification_cache_key()
+    counts = cache.get(key)
+    if counts is None:
+        counts = {
+            'low_stock_count': get_low_stock_drugs().count(),
+            'expiring_count': get_expiring_drugs().count(),
+        }
+        cache.set(key, counts, settings.NOTIFICATION_CACHE_TIMEOUT)
+    return counts
+
+def invalidate_notification_counts():
+    """Drop the cached notification counts once the current transaction commits"""
+    transaction.on_commit(lambda: cache.delete(_notification_cache_key()))
+
+def cache_version(key):
+    """Return the data version stored under a cache key, starting one if there is none.
+
+    Process-local indexes (drug matching, barcodes, interactions, autocomplete
+    search) remember the version they were loaded at and reload once it moves.
+    A missing version starts from a time-based value, so a cleared cache never
+    repeats an old one.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time_ns(), None)
+        version = cache.get(key)
+    return version
+
+def bump_cache_version(key):
+    """Move the version under a cache key on and return it, or None if it had to be started again.
+
+    cache.incr is only atomic on backends like memcached or redis; on the
+    file and database caches two concurrent bumps can both read the same
+    value and one increment is lost. That is harmless for data that is
+    always reloaded in full: every bump runs after its commit, so when one is
+    lost both commits happened before either bump was written, and anyone
+    seeing the new version loads rows that include both. Callers that need
+    every version to be distinct must not rely on this.
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, time_ns(), None)
+        return None
+
+def bump_cache_version_on_commit(key):
+    """Bump the version under a cache key once the current transaction commits"""
+    transaction.on_commit(partial(bump_cache_version, key))
+
+def index_is_current(index, version, max_age):
+    """Whether a process-local index was loaded at `version` less than `max_age` seconds ago.
+
+    The age limit is a safety net for deployments whose cache is not shared
+    between processes, where a bump in one process is never seen by another.
+    """
+    return (
+        index is not None
+        and index.version == version
+        and monotonic() - index.built_at < max_age
+    )
+
 def notifications_processor(request):
     """Context processor to add notifications to all templates"""
     if request.user.is_authenticated:
-        low_stock_count = get_low_stock_drugs().count()
-        expiring_count = get_expiring_drugs().count()
+        counts = get_notification_counts()
+        low_stock_count = counts['low_stock_count']
+        expiring_count = counts['expiring_count']
         total_notifications = low_stock_count + expiring_count
         
         return {
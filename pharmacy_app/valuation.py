@@ -0,0 +1,66 @@
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.utils import timezone
+from datetime import timedelta
+import decimal
+
+from .models import Drug
+
+# Drugs expiring within this many days count as expiring soon on the inventory report
+EXPIRING_WITHIN_DAYS = 60
+
+
+def low_stock_filter():
+    """Q matching drugs at or below their reorder level"""
+    return Q(stock_quantity__lte=F('reorder_level'))
+
+
+def expiring_filter():
+    """Q matching drugs that expire within EXPIRING_WITHIN_DAYS but have not expired yet"""
+    today = timezone.now().date()
+    return Q(expiry_date__gt=today, expiry_date__lte=today + timedelta(days=EXPIRING_WITHIN_DAYS))
+
+
+def get_inventory_valuation(drugs=None):
+    """Value stock at cost price, in total and per category, with one grouped query.
+
+    Returns a dict with drug_count, total_stock_value, low_stock_count,
+    expiring_count and `categories`, a list of the same figures per category
+    (category None for uncategorised drugs) ordered by stock value.
+    """
+    if drugs is None:
+        drugs = Drug.objects.filter(is_active=True)
+
+    stock_value = ExpressionWrapper(
+        F('stock_quantity') * F('cost_price'),
+        output_field=DecimalField(max_digits=16, decimal_places=2)
+    )
+    categories = list(
+        drugs.order_by().values('category_id', 'category__name').annotate(
+            drug_count=Count('id'),
+            stock_value=Sum(stock_value),
+            low_stock_count=Count('id', filter=low_stock_filter()),
+            expiring_count=Count('id', filter=expiring_filter()),
+        ).order_by('-stock_value', 'category__name')
+    )
+
+    valuation = {
+        'drug_count': 0,
+        'total_stock_value': decimal.Decimal('0.00'),
+        'low_stock_count': 0,
+        'expiring_count': 0,
+        'categories': [],
+    }
+    for row in categories:
+        category = {
+            'category': row['category__name'],
+            'drug_count': row['drug_count'],
+            'stock_value': row['stock_value'] or decimal.Decimal('0.00'),
+            'low_stock_count': row['low_stock_count'],
+            'expiring_count': row['expiring_count'],
+        }
+        valuation['categories'].append(category)
+        valuation['drug_count'] += category['drug_count']
+        valuation['total_stock_value'] += category['stock_value']
+        valuation['low_stock_count'] += category['low_stock_count']
+        valuation['expiring_count'] += category['expiring_count']
+    return valuation
@@ -4,66 +4,29 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User, Group
 from django.contrib import messages
 from django.db.models import Sum, Count, F, Q, ExpressionWrapper, DecimalField
-from django.db.models.functions import TruncMonth, TruncDay
-from django.http import HttpResponse, JsonResponse
+from django.db.models.functions import TruncMonth
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
 from django.views.decorators.http import require_POST
-from django.template.loader import get_template
+from django.template.loader import get_template, render_to_string
+from django.urls import reverse
+from django.conf import settings
 from datetime import datetime, timedelta
 import json
-import decimal
 import csv
-import xlsxwriter
+import hashlib
 import openpyxl
 import os
 import re
 import tempfile
-
-def truncate_field(value, max_length):
-    """Utility function to truncate text fields to prevent database errors"""
-    if value and len(value) > max_length:
-        return value[:max_length - 3] + '...'
-    return value
-
-def create_safe_invoice_item(invoice, name, brand, quantity, price, **kwargs):
-    """Create invoice item with proper field truncation to prevent database errors"""
-    # Add debug logging
-    print(f"Creating invoice item with: name={name}, brand={brand}, quantity={quantity}, price={price}")
-    
-    # Make sure name is never None, use a default value if it is
-    if name is None:
-        name = "Unknown Item"
-        print(f"Name was None, using default: {name}")
-    
-    # Truncate text fields to fit database column limits
-    safe_name = truncate_field(name, 495)  # 500 char limit - buffer
-    safe_brand = truncate_field(brand, 250) if brand else None  # 255 char limit - buffer
-    
-    # Make sure quantity and price are also not None
-    quantity = quantity if quantity is not None else "1"
-    price = price if price is not None else "0.00"
-    
-    print(f"Final values: name={safe_name}, brand={safe_brand}, quantity={quantity}, price={price}")
-    
-    # Create and return the invoice item
-    return InvoiceItem.objects.create(
-        invoice=invoice,
-        extracted_name=safe_name,
-        extracted_brand=safe_brand,
-        extracted_quantity=quantity,
-        extracted_cost_price=price,
-        **kwargs
-    )
-from io import BytesIO
-from PIL import Image
-from pdf2image import convert_from_path, convert_from_bytes
-import pytesseract
-from fuzzywuzzy import fuzz, process
+from urllib.parse import urlencode
 
 from .models import (
     Drug, DrugCategory, Patient, Sale, SaleItem, 
     InventoryLog, DrugInteraction, UserProfile,
-    Supplier, InvoiceUpload, InvoiceItem
+    Supplier, InvoiceUpload, InvoiceItem, ReportJob
 )
 from .forms import (
     UserLoginForm, UserRegistrationForm, UserProfileForm,
@@ -73,437 +36,28 @@ from .forms import (
 )
 from .utils import (
     render_to_pdf, check_role_permission, get_low_stock_drugs,
-    get_expiring_drugs, requires_role
+    get_expiring_drugs, requires_role, start_of_day, stream_csv
+)
+from .matching import get_drug_match_index, PARTIAL_MATCH_THRESHOLD
+from .interactions import find_drug_interactions, get_drug_interactions
+from .sales import commit_sale, InsufficientStockError
+from .pagination import keyset_page
+from .rollups import get_sales_totals, get_top_drugs
+from .barcodes import find_drug_by_barcode
+from .catalogue import catalogue_response_body
+from .drug_imports import import_drugs
+from .search import SEARCH_SOURCES, autocomplete_search
+from .invoice_pdf import get_invoice_pdf, invoice_batch_sales, invoice_context, invoice_pdf_filename
+from .reports import (
+    report_filename, sales_report_context, inventory_report_context,
+    sales_report_rows, inventory_report_rows
+)
+from .report_jobs import FILE_EXTENSIONS, request_report_job, recent_report_jobs
+from .invoice_processing import (
+    truncate_field, build_safe_invoice_item, process_pdf_invoice,
+    process_image_invoice, process_excel_invoice, match_invoice_items,
+    enqueue_invoice, has_imported_items
 )
-
-# Invoice Processing Functions
-def process_pdf_invoice(invoice):
-    """Process a PDF invoice using OCR to extract items"""
-    # Get file path
-    file_path = invoice.file.path
-    print(f"Processing PDF invoice: {file_path}")
-    
-    # Check if file exists
-    if not os.path.exists(file_path):
-        print(f"Error: File not found: {file_path}")
-        raise FileNotFoundError(f"Invoice file not found: {file_path}")
-    
-    try:
-        # Convert PDF to images
-        print("Converting PDF to images...")
-        images = convert_from_path(file_path)
-        print(f"Converted PDF to {len(images)} images")
-        
-        # Extract text from images using OCR
-        extracted_text = ""
-        for i, image in enumerate(images):
-            print(f"Processing page {i+1} with OCR...")
-            text = pytesseract.image_to_string(image)
-            extracted_text += f"\n\n---- PAGE {i+1} ----\n\n{text}"
-            print(f"Extracted {len(text)} characters from page {i+1}")
-    except Exception as e:
-        print(f"Error in PDF processing: {str(e)}")
-        raise
-    
-    # Extract invoice details (if not already provided)
-    if not invoice.invoice_number:
-        # Look for invoice number patterns
-        invoice_number_patterns = [
-            r'invoice\s*#?\s*:?\s*([A-Za-z0-9\-]+)',
-            r'invoice\s*number\s*:?\s*([A-Za-z0-9\-]+)',
-            r'inv\s*#?\s*:?\s*([A-Za-z0-9\-]+)',
-        ]
-        
-        for pattern in invoice_number_patterns:
-            match = re.search(pattern, extracted_text, re.IGNORECASE)
-            if match:
-                invoice.invoice_number = match.group(1).strip()
-                invoice.save()
-                break
-    
-    # Extract invoice date (if not already provided)
-    if not invoice.invoice_date:
-        date_patterns = [
-            r'date\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-            r'invoice\s*date\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-        ]
-        
-        for pattern in date_patterns:
-            match = re.search(pattern, extracted_text, re.IGNORECASE)
-            if match:
-                date_str = match.group(1)
-                try:
-                    # Try different date formats
-                    for fmt in ['%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%m-%d-%Y']:
-                        try:
-                            date_obj = datetime.strptime(date_str, fmt)
-                            invoice.invoice_date = date_obj
-                            invoice.save()
-                            break
-                        except ValueError:
-                            continue
-                except Exception:
-                    pass
-                break
-    
-    # Extract items from the invoice
-    # This is a simplified version; in a real system, this would be more sophisticated
-    # Look for tables of items, which typically have quantity, description, and price
-    
-    # Use regex patterns to find items with quantity and price
-    item_patterns = [
-        r'(\d+)\s*x?\s*([A-Za-z0-9\s\-\+]+)\s*\$?(\d+[\.,]\d{2})',  # Quantity, Name, Price
-        r'([A-Za-z0-9\s\-\+]+)\s*(\d+)\s*(?:tablets|capsules|units|pcs)\s*\$?(\d+[\.,]\d{2})',  # Name, Quantity, Price
-        r'([A-Za-z0-9\s\-\+]+)\s*(\d+)\s*(?:mg|ml|g)\s*\$?(\d+[\.,]\d{2})',  # Name, Strength, Price
-    ]
-    
-    items = []
-    for pattern in item_patterns:
-        matches = re.findall(pattern, extracted_text, re.IGNORECASE | re.MULTILINE)
-        for match in matches:
-            # The order of fields in the match may vary depending on the pattern
-            if re.match(r'\d+', match[0]):  # If first group is numeric, it's likely quantity
-                quantity = match[0]
-                name = match[1].strip()
-                price = match[2].replace(',', '.')
-            else:  # First group is likely the name
-                name = match[0].strip()
-                quantity = match[1]
-                price = match[2].replace(',', '.')
-            
-            # Extract brand if possible (often in parentheses)
-            brand = None
-            brand_match = re.search(r'\(([A-Za-z0-9\s\-\+]+)\)', name)
-            if brand_match:
-                brand = brand_match.group(1).strip()
-                name = name.replace(f"({brand})", "").strip()
-            
-            # Create invoice item using the safe creation function
-            item = create_safe_invoice_item(
-                invoice=invoice,
-                name=name,
-                brand=brand,
-                quantity=quantity,
-                price=price
-            )
-            items.append(item)
-    
-    return items
-
-def process_image_invoice(invoice):
-    """Process an image invoice using OCR to extract items"""
-    # Similar to PDF processing but starts with the image directly
-    file_path = invoice.file.path
-    print(f"Processing image invoice: {file_path}")
-    
-    # Check if file exists
-    if not os.path.exists(file_path):
-        print(f"Error: File not found: {file_path}")
-        raise FileNotFoundError(f"Invoice file not found: {file_path}")
-    
-    try:
-        # Open the image
-        print(f"Opening image file...")
-        image = Image.open(file_path)
-        print(f"Image opened successfully: {image.format}, {image.size}")
-        
-        # Extract text using OCR
-        print("Applying OCR to image...")
-        extracted_text = pytesseract.image_to_string(image)
-        print(f"OCR extraction completed. Extracted {len(extracted_text)} characters")
-    except Exception as e:
-        print(f"Error in image processing: {str(e)}")
-        raise
-    
-    # The rest is the same as PDF processing
-    # Extract invoice details (if not already provided)
-    if not invoice.invoice_number:
-        invoice_number_patterns = [
-            r'invoice\s*#?\s*:?\s*([A-Za-z0-9\-]+)',
-            r'invoice\s*number\s*:?\s*([A-Za-z0-9\-]+)',
-            r'inv\s*#?\s*:?\s*([A-Za-z0-9\-]+)',
-        ]
-        
-        for pattern in invoice_number_patterns:
-            match = re.search(pattern, extracted_text, re.IGNORECASE)
-            if match:
-                invoice.invoice_number = match.group(1).strip()
-                invoice.save()
-                break
-    
-    # Extract invoice date (if not already provided)
-    if not invoice.invoice_date:
-        date_patterns = [
-            r'date\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-            r'invoice\s*date\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-        ]
-        
-        for pattern in date_patterns:
-            match = re.search(pattern, extracted_text, re.IGNORECASE)
-            if match:
-                date_str = match.group(1)
-                try:
-                    # Try different date formats
-                    for fmt in ['%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%m-%d-%Y']:
-                        try:
-                            date_obj = datetime.strptime(date_str, fmt)
-                            invoice.invoice_date = date_obj
-                            invoice.save()
-                            break
-                        except ValueError:
-                            continue
-                except Exception:
-                    pass
-                break
-    
-    # Extract items using the same patterns as the PDF function
-    item_patterns = [
-        r'(\d+)\s*x?\s*([A-Za-z0-9\s\-\+]+)\s*\$?(\d+[\.,]\d{2})',  # Quantity, Name, Price
-        r'([A-Za-z0-9\s\-\+]+)\s*(\d+)\s*(?:tablets|capsules|units|pcs)\s*\$?(\d+[\.,]\d{2})',  # Name, Quantity, Price
-        r'([A-Za-z0-9\s\-\+]+)\s*(\d+)\s*(?:mg|ml|g)\s*\$?(\d+[\.,]\d{2})',  # Name, Strength, Price
-    ]
-    
-    items = []
-    for pattern in item_patterns:
-        matches = re.findall(pattern, extracted_text, re.IGNORECASE | re.MULTILINE)
-        for match in matches:
-            # The order of fields in the match may vary depending on the pattern
-            if re.match(r'\d+', match[0]):  # If first group is numeric, it's likely quantity
-                quantity = match[0]
-                name = match[1].strip()
-                price = match[2].replace(',', '.')
-            else:  # First group is likely the name
-                name = match[0].strip()
-                quantity = match[1]
-                price = match[2].replace(',', '.')
-            
-            # Extract brand if possible (often in parentheses)
-            brand = None
-            brand_match = re.search(r'\(([A-Za-z0-9\s\-\+]+)\)', name)
-            if brand_match:
-                brand = brand_match.group(1).strip()
-                name = name.replace(f"({brand})", "").strip()
-            
-            # Create invoice item using the safe creation function
-            item = create_safe_invoice_item(
-                invoice=invoice,
-                name=name,
-                brand=brand,
-                quantity=quantity,
-                price=price
-            )
-            items.append(item)
-    
-    return items
-
-def process_excel_invoice(invoice):
-    """Process an Excel invoice to extract items"""
-    file_path = invoice.file.path
-    print(f"Processing Excel invoice: {file_path}")
-    
-    # Check if file exists
-    if not os.path.exists(file_path):
-        print(f"Error: File not found: {file_path}")
-        raise FileNotFoundError(f"Invoice file not found: {file_path}")
-    
-    try:
-        # Load the Excel file
-        print("Loading Excel workbook...")
-        workbook = openpyxl.load_workbook(file_path, data_only=True)
-        sheet = workbook.active
-        print(f"Excel workbook loaded. Active sheet: {sheet.title}")
-    except Exception as e:
-        print(f"Error loading Excel file: {str(e)}")
-        raise
-    
-    # Try to determine header row
-    header_row = None
-    name_col = None
-    quantity_col = None
-    price_col = None
-    brand_col = None
-    
-    # Look for common header names
-    for row_idx, row in enumerate(sheet.iter_rows(min_row=1, max_row=10), 1):
-        for col_idx, cell in enumerate(row, 1):
-            cell_value = str(cell.value).lower() if cell.value else ""
-            if cell_value:
-                if cell_value in ['item', 'description', 'product', 'name', 'drug name']:
-                    header_row = row_idx
-                    name_col = col_idx
-                elif cell_value in ['qty', 'quantity', 'amount']:
-                    header_row = row_idx
-                    quantity_col = col_idx
-                elif cell_value in ['price', 'unit price', 'cost', 'cost price']:
-                    header_row = row_idx
-                    price_col = col_idx
-                elif cell_value in ['brand', 'manufacturer']:
-                    header_row = row_idx
-                    brand_col = col_idx
-        
-        # If we found at least name and price columns, we can proceed
-        if header_row and name_col and price_col:
-            break
-    
-    # If no explicit headers found, assume first row is header
-    if not header_row:
-        header_row = 1
-        # Try to guess columns based on data types
-        for col_idx, cell in enumerate(next(sheet.iter_rows(min_row=1, max_row=1)), 1):
-            cell_value = str(cell.value).lower() if cell.value else ""
-            
-            # Check second row to see what kind of data is in each column
-            second_row_cell = sheet.cell(row=2, column=col_idx).value
-            
-            if second_row_cell:
-                if isinstance(second_row_cell, str) and len(second_row_cell) > 3:
-                    # Longer text is likely the name
-                    name_col = col_idx
-                elif isinstance(second_row_cell, (int, float)) and second_row_cell > 0 and second_row_cell < 1000:
-                    # Smaller numbers might be quantities
-                    if not quantity_col:
-                        quantity_col = col_idx
-                    # Larger numbers might be prices
-                    elif not price_col and second_row_cell > 1:
-                        price_col = col_idx
-    
-    # If still can't determine columns, make a best guess
-    if not name_col:
-        name_col = 1  # First column is often the name
-    
-    if not quantity_col:
-        quantity_col = 2  # Second column is often quantity
-    
-    if not price_col:
-        price_col = 3  # Third column is often price
-    
-    # Extract items from rows after the header
-    items = []
-    for row_idx, row in enumerate(sheet.iter_rows(min_row=header_row+1), header_row+1):
-        name_cell = sheet.cell(row=row_idx, column=name_col).value
-        
-        # Skip empty rows
-        if not name_cell:
-            continue
-        
-        # Get other cell values
-        quantity = sheet.cell(row=row_idx, column=quantity_col).value if quantity_col else None
-        price = sheet.cell(row=row_idx, column=price_col).value if price_col else None
-        brand = sheet.cell(row=row_idx, column=brand_col).value if brand_col else None
-        
-        # Skip rows where name is a header or subtotal
-        if name_cell and isinstance(name_cell, str):
-            if any(x in name_cell.lower() for x in ['total', 'subtotal', 'item', 'product', 'description']):
-                continue
-        
-        # Skip if missing essential data
-        if not name_cell or not price:
-            continue
-        
-        # Convert quantity to string
-        quantity_str = str(quantity) if quantity is not None else '1'
-        
-        # Convert price to string
-        price_str = str(price)
-        
-        # Create invoice item using the safe creation function
-        item = create_safe_invoice_item(
-            invoice=invoice,
-            name=str(name_cell),
-            brand=str(brand) if brand else None,
-            quantity=quantity_str,
-            price=price_str
-        )
-        items.append(item)
-    
-    return items
-
-def match_invoice_items(invoice):
-    """Match extracted invoice items with drugs in the database"""
-    # Get all drugs for matching
-    all_drugs = list(Drug.objects.values('id', 'name', 'brand'))
-    
-    # Get all items from this invoice
-    items = InvoiceItem.objects.filter(invoice=invoice)
-    
-    for item in items:
-        # Prepare the search terms
-        search_name = item.extracted_name.lower() if item.extracted_name else ""
-        search_brand = item.extracted_brand.lower() if item.extracted_brand else ""
-        
-        # Create search strings for matching
-        search_terms = []
-        if search_name:
-            search_terms.append(search_name)
-        if search_brand:
-            search_terms.append(search_brand)
-            if search_name:
-                search_terms.append(f"{search_name} {search_brand}")
-                search_terms.append(f"{search_brand} {search_name}")
-        
-        if not search_terms:
-            continue
-        
-        # Try to find matches using fuzzy string matching
-        best_match = None
-        best_score = 0
-        
-        for drug in all_drugs:
-            drug_name = drug['name'].lower() if drug['name'] else ""
-            drug_brand = drug['brand'].lower() if drug['brand'] else ""
-            
-            # Create strings to match against
-            match_strings = [drug_name]
-            if drug_brand:
-                match_strings.append(drug_brand)
-                match_strings.append(f"{drug_name} {drug_brand}")
-                match_strings.append(f"{drug_brand} {drug_name}")
-            
-            # Find the best match score between all combinations
-            for search in search_terms:
-                for match in match_strings:
-                    score = fuzz.ratio(search, match)
-                    
-                    # Adjust score if brand matches exactly
-                    if search_brand and drug_brand and search_brand == drug_brand:
-                        score += 20
-                    
-                    if score > best_score:
-                        best_score = score
-                        best_match = drug
-        
-        # Update the item with the match information
-        if best_match and best_score >= 70:  # 70% similarity threshold for a match
-            item.matched_drug_id = best_match['id']
-            item.match_status = 'MATCHED'
-            item.match_confidence = min(best_score, 100)  # Cap at 100
-            
-            # If we have quantity info, save it
-            if item.extracted_quantity:
-                try:
-                    quantity = int(float(item.extracted_quantity.replace(',', '.')))
-                    item.quantity = quantity
-                except (ValueError, TypeError):
-                    pass
-            
-            # If we have price info, save it
-            if item.extracted_cost_price:
-                try:
-                    cost_price = float(item.extracted_cost_price.replace(',', '.'))
-                    item.cost_price = cost_price
-                except (ValueError, TypeError):
-                    pass
-            
-            item.save()
-        elif best_match and best_score >= 50:  # 50-70% similarity is a partial match
-            item.matched_drug_id = best_match['id']
-            item.match_status = 'PARTIAL_MATCH'
-            item.match_confidence = best_score
-            item.save()
-        else:
-            # No good match found
-            item.match_status = 'UNMATCHED'
-            item.save()
 
 # Authentication Views
 from django.views.decorators.csrf import ensure_csrf_cookie
@@ -567,32 +121,25 @@ def dashboard(request):
     # Get counts for main entities
     drugs_count = Drug.objects.filter(is_active=True).count()
     patients_count = Patient.objects.count()
-    sales_count = Sale.objects.count()
     
     # Get low stock and expiring medications
     low_stock_drugs = get_low_stock_drugs()
     expiring_drugs = get_expiring_drugs()
     
-    # Calculate revenue stats
-    today = timezone.now().date()
-    today_sales = Sale.objects.filter(date__date=today).aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
+    # Calculate revenue stats; closed days come from the daily rollups
+    today = timezone.localdate()
+    sales_count = get_sales_totals()[0]
+    today_sales = get_sales_totals(today, today)[1]
     
     # Get this month's sales data
     month_start = today.replace(day=1)
-    month_sales = Sale.objects.filter(date__date__gte=month_start).aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
+    month_sales = get_sales_totals(month_start, today)[1]
     
     # Get recent sales
     recent_sales = Sale.objects.select_related('patient', 'user').order_by('-date')[:5]
     
     # Get top selling drugs this month
-    top_drugs = SaleItem.objects.filter(sale__date__date__gte=month_start)\
-        .values('drug_name')\
-        .annotate(total_quantity=Sum('quantity'))\
-        .order_by('-total_quantity')[:5]
+    top_drugs = get_top_drugs(month_start, today, limit=5)
     
     # Context data
     context = {
@@ -610,6 +157,9 @@ def dashboard(request):
     return render(request, 'dashboard.html', context)
 
 # Drug Management Views
+# Keyset ordering for the drug list; id breaks ties between identical name/brand pairs
+DRUG_LIST_ORDERING = ['name', 'brand', 'id']
+
 @login_required
 @requires_role(['Admin', 'Pharmacist', 'Manager'])
 def drug_list(request):
@@ -620,7 +170,7 @@ def drug_list(request):
     expiry_status = request.GET.get('expiry_status', '')
     barcode = request.GET.get('barcode', '')
     
-    drugs = Drug.objects.all()
+    drugs = Drug.objects.select_related('category')
     
     # Apply filters
     if barcode:
@@ -644,6 +194,48 @@ def drug_list(request):
     elif expiry_status == 'expired':
         drugs = drugs.filter(expiry_date__lt=timezone.now().date())
     
+    # Page through the results in (name, brand) order with a keyset cursor
+    try:
+        drugs, next_cursor = keyset_page(
+            drugs, DRUG_LIST_ORDERING, request.GET.get('after'), settings.DRUG_LIST_PAGE_SIZE
+        )
+    except ValueError:
+        if request.GET.get('format') == 'json':
+            return JsonResponse({'error': 'Invalid cursor', 'success': False}, status=400)
+        drugs, next_cursor = keyset_page(drugs, DRUG_LIST_ORDERING, None, settings.DRUG_LIST_PAGE_SIZE)
+    
+    next_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params.pop('format', None)
+        params['after'] = next_cursor
+        next_query = params.urlencode()
+    
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'success': True,
+            'drugs': [
+                {
+                    'id': drug.id,
+                    'name': drug.name,
+                    'brand': drug.brand,
+                    'barcode': drug.barcode,
+                    'category': drug.category.name if drug.category else None,
+                    'stock_quantity': drug.stock_quantity,
+                    'cost_price': float(drug.cost_price),
+                    'selling_price': float(drug.selling_price),
+                    'expiry_date': drug.expiry_date.strftime('%Y-%m-%d'),
+                    'is_active': drug.is_active,
+                    'is_low_stock': drug.is_low_stock(),
+                    'is_expired': drug.is_expired(),
+                }
+                for drug in drugs
+            ],
+            'html': render_to_string('partials/drug_rows.html', {'drugs': drugs}, request=request),
+            'next_cursor': next_cursor,
+            'next_query': next_query,
+        })
+    
     # Get categories for filter dropdown
     categories = DrugCategory.objects.all()
     
@@ -655,6 +247,8 @@ def drug_list(request):
         'stock_status': stock_status,
         'expiry_status': expiry_status,
         'barcode': barcode,
+        'next_cursor': next_cursor,
+        'next_query': next_query,
     }
     
     return render(request, 'drugs/list.html', context)
@@ -715,77 +309,58 @@ def drug_edit(request, drug_id):
     return render(request, 'drugs/edit.html', {'form': form, 'drug': drug})
 
 
+# Skipped rows listed on the import page; the error report file has all of them
+DRUG_IMPORT_ERROR_PREVIEW = 10
+
 @login_required
 @requires_role(['Admin', 'Pharmacist'])
 def drug_import(request):
     """Import drugs from Excel file"""
+    result = None
+    
     if request.method == 'POST':
         form = DrugImportForm(request.POST, request.FILES)
         if form.is_valid():
             excel_file = request.FILES['excel_file']
             
             try:
-                from openpyxl import load_workbook
-                wb = load_workbook(excel_file)
-                ws = wb.active
-                
-                success_count = 0
-                error_count = 0
-                errors = []
-                
-                # Skip header row
-                for row in ws.iter_rows(min_row=2):
-                    try:
-                        drug_data = {
-                            'name': row[0].value,
-                            'brand': row[1].value,
-                            'description': row[2].value,
-                            'stock_quantity': int(row[3].value or 0),
-                            'cost_price': float(row[4].value or 0),
-                            'selling_price': float(row[5].value or 0),
-                            'reorder_level': int(row[6].value or 0),
-                            'expiry_date': row[7].value,
-                            'batch_number': row[8].value,
-                        }
-                        
-                        # Create or update drug
-                        drug, created = Drug.objects.update_or_create(
-                            name=drug_data['name'],
-                            brand=drug_data['brand'],
-                            defaults=drug_data
-                        )
-                        
-                        # Log the inventory addition if new drug
-                        if created:
-                            InventoryLog.objects.create(
-                                drug=drug,
-                                quantity_change=drug.stock_quantity,
-                                operation_type='ADD',
-                                notes="Initial stock from Excel import",
-                                user=request.user
-                            )
-                        
-                        success_count += 1
-                        
-                    except Exception as e:
-                        error_count += 1
-                        errors.append(f"Row {row[0].row}: {str(e)}")
-                
-                if success_count > 0:
-                    messages.success(request, f"Successfully imported {success_count} drugs.")
-                if error_count > 0:
-                    messages.warning(request, f"Failed to import {error_count} drugs. Check the logs for details.")
-                    for error in errors:
-                        messages.error(request, error)
-                
-                return redirect('drug_list')
-                
+                result = import_drugs(excel_file, user=request.user)
             except Exception as e:
                 messages.error(request, f"Error processing file: {str(e)}")
+            else:
+                if result.imported:
+                    messages.success(
+                        request,
+                        f"Successfully imported {result.imported} drugs "
+                        f"({result.created} new, {result.updated} updated)."
+                    )
+                if not result.errors:
+                    return redirect('drug_list')
+                
+                # Bad rows are listed in a downloadable report rather than one message each
+                request.session['drug_import_error_report'] = result.error_report
+                messages.warning(request, f"{len(result.errors)} rows could not be imported.")
     else:
         form = DrugImportForm()
     
-    return render(request, 'drugs/import.html', {'form': form})
+    error_preview = result.errors[:DRUG_IMPORT_ERROR_PREVIEW] if result else []
+    return render(request, 'drugs/import.html', {
+        'form': form,
+        'result': result,
+        'error_preview': error_preview,
+        'more_errors': len(result.errors) - len(error_preview) if result else 0,
+    })
+
+@login_required
+@requires_role(['Admin', 'Pharmacist'])
+def drug_import_errors(request):
+    """Download the error report of the user's last drug import"""
+    name = request.session.get('drug_import_error_report')
+    if not name or not default_storage.exists(name):
+        messages.error(request, "The import error report is no longer available.")
+        return redirect('drug_import')
+    
+    return FileResponse(default_storage.open(name, 'rb'), as_attachment=True, filename=os.path.basename(name))
 
 @login_required
 @requires_role(['Admin', 'Pharmacist', 'Manager', 'Sales Clerk'])
@@ -797,9 +372,7 @@ def drug_detail(request, drug_id):
     inventory_logs = InventoryLog.objects.filter(drug=drug).order_by('-timestamp')[:20]
     
     # Get drug interactions
-    interactions = DrugInteraction.objects.filter(
-        Q(drug_one=drug) | Q(drug_two=drug)
-    ).select_related('drug_one', 'drug_two')
+    interactions = get_drug_interactions(drug)
     
     context = {
         'drug': drug,
@@ -897,94 +470,66 @@ def new_sale(request):
                     walk_in_customer = Patient.get_or_create_walk_in()
                     sale.patient = walk_in_customer
                 
-                sale.save()
-                
                 formset = SaleItemFormSet(request.POST, instance=sale)
                 print(f"Formset validity: {formset.is_valid()}")
                 print(f"Formset errors: {formset.errors if hasattr(formset, 'errors') else 'No errors'}")
                 
                 if formset.is_valid():
-                    # Validate stock availability before saving
-                    items_valid = True
-                    for form in formset:
-                        if form.cleaned_data and not form.cleaned_data.get('DELETE', False):
-                            drug = form.cleaned_data.get('drug')
-                            quantity = form.cleaned_data.get('quantity')
-                            
-                            if drug and drug.stock_quantity < quantity:
-                                messages.error(request, f"Not enough stock for {drug.name}. Available: {drug.stock_quantity}")
-                                items_valid = False
-                                break
+                    lines = [
+                        (item_form.cleaned_data['drug'], item_form.cleaned_data['quantity'])
+                        for item_form in formset
+                        if item_form.cleaned_data
+                        and not item_form.cleaned_data.get('DELETE', False)
+                        and item_form.cleaned_data.get('drug')
+                    ]
                     
-                    if items_valid:
-                        # Save the formset
-                        items = formset.save(commit=False)
-                        
-                        # Calculate sale totals
-                        subtotal = decimal.Decimal('0.00')
-                        for item in items:
-                            item.drug_name = item.drug.name if item.drug else "Unknown Drug"
-                            item.price = item.drug.selling_price if item.drug else decimal.Decimal('0.00')
-                            item.save()
-                            subtotal += item.price * item.quantity
-                        
-                        # Apply tax and discount calculations
-                        # Use the tax value from the form instead of calculating it
-                        sale.subtotal = subtotal
-                        # Tax value was already set from the form's cleaned_data
-                        sale.total_amount = subtotal + sale.tax - sale.discount
-                        sale.save()
-                        
+                    try:
+                        # Stock is checked and decremented atomically with the sale
+                        commit_sale(sale, lines)
+                    except InsufficientStockError as e:
+                        if not e.shortages:
+                            messages.error(request, "Stock changed while the sale was being saved. Please try again.")
+                        for drug, available, _ in e.shortages:
+                            messages.error(request, f"Not enough stock for {drug.name}. Available: {available}")
+                        # Keep the user's formset data for better user experience
+                        formset = SaleItemFormSet(request.POST)
+                    else:
                         # Check for drug interactions
-                        interactions = check_drug_interactions(sale)
+                        interactions = find_drug_interactions([drug for drug, _ in lines])
                         if interactions:
                             # Store in session to display on next page
                             request.session['interaction_warnings'] = interactions
                         
                         messages.success(request, f"Sale recorded successfully. Invoice #: {sale.invoice_number}")
                         return redirect('sale_detail', sale_id=sale.id)
-                    else:
-                        # If any item validation failed, delete the sale
-                        sale.delete()
-                        # Keep the user's formset data for better user experience
-                        formset = SaleItemFormSet(request.POST)
                 else:
                     print(f"Sale item formset is invalid. Errors: {formset.errors}")
                     messages.error(request, "There was an error with the sale items. Please check that you have at least one item with valid quantity.")
-                    sale.delete()
                     # Keep the user's formset data
                     formset = SaleItemFormSet(request.POST)
             except Exception as e:
                 print(f"Exception in sale processing: {str(e)}")
                 messages.error(request, f"An unexpected error occurred: {str(e)}")
-                # Make sure to delete the sale if it was created but not completed
-                if 'sale' in locals() and sale and sale.id:
-                    sale.delete()
         else:
             print(f"Sale form is invalid. Errors: {form.errors}")
             messages.error(request, "There was an error with the sale information.")
             # Keep the user's formset data instead of resetting it
             formset = SaleItemFormSet(request.POST)
     else:
-        form = SaleForm()
+        # A sale started from a patient's page comes with ?patient=<id>
+        form = SaleForm(initial={'patient': request.GET.get('patient')})
         formset = SaleItemFormSet()
     
     # If formset is still None at this point, initialize it
     if formset is None:
         formset = SaleItemFormSet()
     
-    # Get all active drugs for the form
-    drugs = Drug.objects.filter(is_active=True, stock_quantity__gt=0)
-    patients = Patient.objects.all()
-    
     # Make sure we have a walk-in customer
     walk_in_customer = Patient.get_or_create_walk_in()
     
     context = {
         'form': form,
         'formset': formset,
-        'drugs': drugs,
-        'patients': patients,
         'walk_in_customer_id': walk_in_customer.id,
     }
     
@@ -992,30 +537,12 @@ def new_sale(request):
 
 def check_drug_interactions(sale):
     """Check for drug interactions among items in a sale"""
-    interactions = []
-    sale_items = sale.saleitems.all()
+    sale_items = sale.saleitems.select_related('drug')
     drugs = [item.drug for item in sale_items if item.drug]
-    
-    # Check each pair of drugs
-    for i in range(len(drugs)):
-        for j in range(i+1, len(drugs)):
-            drug1, drug2 = drugs[i], drugs[j]
-            
-            # Check for interactions in both directions
-            interaction = DrugInteraction.objects.filter(
-                (Q(drug_one=drug1) & Q(drug_two=drug2)) | 
-                (Q(drug_one=drug2) & Q(drug_two=drug1))
-            ).first()
-            
-            if interaction and interaction.severity != 'NONE':
-                interactions.append({
-                    'drug1': drug1.name,
-                    'drug2': drug2.name,
-                    'severity': interaction.severity,
-                    'description': interaction.description
-                })
-    
-    return interactions
+    return find_drug_interactions(drugs)
+
+# Keyset ordering for the sale list; id breaks ties between sales with the same timestamp
+SALE_LIST_ORDERING = ['-date', '-id']
 
 @login_required
 def sale_list(request):
@@ -1024,7 +551,7 @@ def sale_list(request):
     date_from = request.GET.get('date_from', '')
     date_to = request.GET.get('date_to', '')
     
-    sales = Sale.objects.all()
+    sales = Sale.objects.select_related('patient', 'user')
     
     # Apply filters
     if query:
@@ -1034,25 +561,51 @@ def sale_list(request):
             Q(patient__last_name__icontains=query)
         )
     
+    # Dates are compared as half-open datetime ranges so the date index can be used
     if date_from:
         try:
             date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
-            sales = sales.filter(date__date__gte=date_from)
+            sales = sales.filter(date__gte=start_of_day(date_from))
         except ValueError:
             pass
     
     if date_to:
         try:
             date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
-            sales = sales.filter(date__date__lte=date_to)
+            sales = sales.filter(date__lt=start_of_day(date_to + timedelta(days=1)))
         except ValueError:
             pass
     
+    # Newest first, one page at a time
+    after = request.GET.get('after')
+    try:
+        sales, next_cursor = keyset_page(sales, SALE_LIST_ORDERING, after, settings.SALE_LIST_PAGE_SIZE)
+    except ValueError:
+        after = None
+        sales, next_cursor = keyset_page(sales, SALE_LIST_ORDERING, None, settings.SALE_LIST_PAGE_SIZE)
+    
+    # Count items for the whole page in one query
+    item_counts = dict(
+        SaleItem.objects.filter(sale__in=sales).values('sale').annotate(n=Count('id')).values_list('sale', 'n')
+    )
+    for sale in sales:
+        sale.saleitem_count = item_counts.get(sale.id, 0)
+    
+    params = request.GET.copy()
+    params.pop('after', None)
+    first_query = params.urlencode()
+    next_query = None
+    if next_cursor:
+        params['after'] = next_cursor
+        next_query = params.urlencode()
+    
     context = {
         'sales': sales,
         'query': query,
         'date_from': date_from,
         'date_to': date_to,
+        'next_query': next_query,
+        'first_query': first_query if after else None,
     }
     
     return render(request, 'sales/list.html', context)
@@ -1160,30 +713,49 @@ def sale_delete(request, sale_id):
 @login_required
 def sale_invoice(request, sale_id):
     """Display and print invoice for a sale"""
-    sale = get_object_or_404(Sale, id=sale_id)
-    items = sale.saleitems.all()
-    
-    context = {
-        'sale': sale,
-        'items': items,
-        'company_name': 'Pharmacy Management System',
-        'company_address': '123 Health Street, Medical City',
-        'company_phone': '+1 234 567 8900',
-        'company_email': 'info@pharmacymanagement.com',
-    }
+    sale = get_object_or_404(Sale.objects.select_related('patient', 'user'), id=sale_id)
     
     # Check if PDF generation is requested
     if 'pdf' in request.GET:
-        pdf = render_to_pdf('sales/invoice.html', context)
+        pdf = get_invoice_pdf(sale)
         if pdf:
             response = HttpResponse(pdf, content_type='application/pdf')
-            filename = f"Invoice_{sale.invoice_number}.pdf"
+            filename = invoice_pdf_filename(sale)
             content = f"inline; filename={filename}"
             response['Content-Disposition'] = content
             return response
     
+    context = invoice_context(sale, sale.saleitems.all())
     return render(request, 'sales/invoice.html', context)
 
+# Formats a batch of sale invoices can be printed in
+INVOICE_BATCH_FORMATS = {'pdf': 'PDF', 'zip': 'ZIP'}
+
+@login_required
+@requires_role(['Admin', 'Manager', 'Pharmacist'])
+def sale_invoice_batch(request):
+    """Print the invoices of every sale in a date range (today by default) as one PDF or a ZIP"""
+    form, start_date, end_date = report_date_range(request, month_to_date=False)
+    sale_count = invoice_batch_sales(start_date, end_date).count()
+    
+    # The batch is rendered by the report worker, like the other long exports
+    export_format = request.GET.get('export')
+    if export_format in INVOICE_BATCH_FORMATS:
+        if not sale_count:
+            messages.warning(request, "There are no sales to print in this date range.")
+        else:
+            return queue_report_export(request, 'INVOICES', INVOICE_BATCH_FORMATS[export_format],
+                                       start_date, end_date, 'sale_invoice_batch')
+    
+    context = {
+        'form': form,
+        'start_date': start_date,
+        'end_date': end_date,
+        'sale_count': sale_count,
+        'report_jobs': recent_report_jobs('INVOICES'),
+    }
+    return render(request, 'sales/invoice_batch.html', context)
+
 # Report Views
 @login_required
 @requires_role(['Admin', 'Manager'])
@@ -1191,10 +763,11 @@ def reports_index(request):
     """Display available reports"""
     return render(request, 'reports/index.html')
 
-@login_required
-@requires_role(['Admin', 'Manager'])
-def sales_report(request):
-    """Generate sales report based on date range"""
+# Export formats rendered in the background by the report worker
+QUEUED_EXPORT_FORMATS = {'pdf': 'PDF', 'excel': 'EXCEL'}
+
+def report_date_range(request, month_to_date=True):
+    """Return (form, start_date, end_date) for a report, defaulting to the current month (or today)"""
     form = DateRangeForm(request.GET or None)
     
     if form.is_valid():
@@ -1203,299 +776,117 @@ def sales_report(request):
     else:
         # Default to current month
         today = timezone.now().date()
-        start_date = today.replace(day=1)
+        start_date = today.replace(day=1) if month_to_date else today
         end_date = today
+    return form, start_date, end_date
+
+def queue_report_export(request, report_type, export_format, start_date, end_date, url_name):
+    """Queue (or reuse) a background export job and send the user back to the report page"""
+    job, created = request_report_job(report_type, export_format, start_date, end_date, request.user)
+    if created:
+        messages.success(request, f"Your {job.get_export_format_display()} export is being prepared. "
+                                  "A download link will appear below when it is ready.")
+    elif job.is_ready:
+        messages.info(request, f"This {job.get_export_format_display()} export is ready to download below.")
+    else:
+        messages.info(request, f"This {job.get_export_format_display()} export is already being prepared.")
     
-    # Filter sales by date range
-    sales = Sale.objects.filter(date__date__gte=start_date, date__date__lte=end_date)
-    
-    # Calculate summary statistics
-    total_sales = sales.count()
-    total_revenue = sales.aggregate(total=Sum('total_amount'))['total'] or 0
-    avg_sale_value = total_revenue / total_sales if total_sales > 0 else 0
-    
-    # Daily sales breakdown
-    daily_sales = sales.annotate(
-        day=TruncDay('date')
-    ).values('day').annotate(
-        count=Count('id'),
-        total=Sum('total_amount')
-    ).order_by('day')
-    
-    # Top selling drugs
-    top_drugs = SaleItem.objects.filter(
-        sale__date__date__gte=start_date,
-        sale__date__date__lte=end_date
-    ).values('drug_name').annotate(
-        total_quantity=Sum('quantity'),
-        total_value=Sum(F('quantity') * F('price'))
-    ).order_by('-total_quantity')[:10]
-    
-    context = {
-        'form': form,
-        'start_date': start_date,
-        'end_date': end_date,
-        'total_sales': total_sales,
-        'total_revenue': total_revenue,
-        'avg_sale_value': avg_sale_value,
-        'daily_sales': daily_sales,
-        'top_drugs': top_drugs,
-        'sales': sales,
-    }
+    query = urlencode({'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()})
+    return redirect(f"{reverse(url_name)}?{query}")
+
+@login_required
+@requires_role(['Admin', 'Manager'])
+def sales_report(request):
+    """Generate sales report based on date range"""
+    form, start_date, end_date = report_date_range(request)
     
     # Check if export is requested
-    if 'export' in request.GET:
-        export_format = request.GET.get('export')
-        if export_format == 'pdf':
-            # Add current date to context for footer
-            context['current_date'] = timezone.now()
-            # Use a simplified template for PDF to avoid CSS parsing issues
-            pdf = render_to_pdf('reports/sales_report_pdf.html', context)
-            if pdf:
-                response = HttpResponse(pdf, content_type='application/pdf')
-                filename = f"Sales_Report_{start_date.strftime('%Y-%m-%d')}_to_{end_date.strftime('%Y-%m-%d')}.pdf"
-                content = f"attachment; filename={filename}"
-                response['Content-Disposition'] = content
-                return response
-        elif export_format == 'excel':
-            return export_sales_report_excel(sales, start_date, end_date)
-        elif export_format == 'csv':
-            return export_sales_report_csv(sales, start_date, end_date)
-    
-    return render(request, 'reports/sales_report.html', context)
-
-def export_sales_report_excel(sales, start_date, end_date):
-    """Export sales report as Excel file"""
-    output = BytesIO()
-    workbook = xlsxwriter.Workbook(output)
-    worksheet = workbook.add_worksheet('Sales Report')
-    
-    # Add header
-    header_format = workbook.add_format({'bold': True, 'bg_color': '#f2f2f2'})
-    worksheet.write(0, 0, 'Invoice #', header_format)
-    worksheet.write(0, 1, 'Date', header_format)
-    worksheet.write(0, 2, 'Patient Name', header_format)
-    worksheet.write(0, 3, 'Total Amount', header_format)
-    worksheet.write(0, 4, 'Items Count', header_format)
-    worksheet.write(0, 5, 'Payment Method', header_format)
-    worksheet.write(0, 6, 'Status', header_format)
-    
-    # Add data
-    for i, sale in enumerate(sales, 1):
-        worksheet.write(i, 0, sale.invoice_number)
-        worksheet.write(i, 1, sale.date.strftime('%Y-%m-%d %H:%M'))
-        worksheet.write(i, 2, sale.patient.full_name if sale.patient else 'N/A')
-        worksheet.write(i, 3, float(sale.total_amount))
-        worksheet.write(i, 4, sale.item_count)
-        worksheet.write(i, 5, sale.payment_method)
-        worksheet.write(i, 6, sale.payment_status)
-    
-    workbook.close()
-    output.seek(0)
+    export_format = request.GET.get('export')
+    if export_format in QUEUED_EXPORT_FORMATS:
+        return queue_report_export(request, 'SALES', QUEUED_EXPORT_FORMATS[export_format],
+                                   start_date, end_date, 'sales_report')
     
-    response = HttpResponse(
-        output,
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    filename = f"Sales_Report_{start_date.strftime('%Y-%m-%d')}_to_{end_date.strftime('%Y-%m-%d')}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename={filename}'
+    context = sales_report_context(start_date, end_date)
+    if export_format == 'csv':
+        return export_sales_report_csv(context['sales'], start_date, end_date)
     
-    return response
+    context['form'] = form
+    context['report_jobs'] = recent_report_jobs('SALES')
+    return render(request, 'reports/sales_report.html', context)
 
 def export_sales_report_csv(sales, start_date, end_date):
-    """Export sales report as CSV file"""
-    response = HttpResponse(content_type='text/csv')
-    filename = f"Sales_Report_{start_date.strftime('%Y-%m-%d')}_to_{end_date.strftime('%Y-%m-%d')}.csv"
-    response['Content-Disposition'] = f'attachment; filename={filename}'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Invoice #', 'Date', 'Patient Name', 'Total Amount', 'Items Count', 'Payment Method', 'Status'])
-    
-    for sale in sales:
-        writer.writerow([
-            sale.invoice_number,
-            sale.date.strftime('%Y-%m-%d %H:%M'),
-            sale.patient.full_name if sale.patient else 'N/A',
-            float(sale.total_amount),
-            sale.item_count,
-            sale.payment_method,
-            sale.payment_status
-        ])
-    
-    return response
+    """Stream the sales report as a CSV file"""
+    filename = report_filename('SALES', start_date, end_date, 'csv')
+    return stream_csv(filename, sales_report_rows(sales))
 
 @login_required
 @requires_role(['Admin', 'Manager', 'Pharmacist'])
 def inventory_report(request):
     """Generate inventory report"""
-    form = DateRangeForm(request.GET or None)
-    
-    if form.is_valid():
-        start_date = form.cleaned_data['start_date']
-        end_date = form.cleaned_data['end_date']
-    else:
-        # Default to current month
-        today = timezone.now().date()
-        start_date = today.replace(day=1)
-        end_date = today
-    
-    # Get all active drugs
-    drugs = Drug.objects.filter(is_active=True)
-    
-    # Get total stock value
-    total_stock_value = sum(drug.stock_quantity * drug.cost_price for drug in drugs)
-    
-    # Get low stock drugs
-    low_stock_drugs = drugs.filter(stock_quantity__lte=F('reorder_level'))
-    
-    # Get expiring drugs (within 2 months)
-    today = timezone.now().date()
-    two_months_later = today + timedelta(days=60)
-    expiring_drugs = drugs.filter(expiry_date__gt=today, expiry_date__lte=two_months_later)
-    
-    # Get inventory movement during the period
-    inventory_logs = InventoryLog.objects.filter(
-        timestamp__date__gte=start_date,
-        timestamp__date__lte=end_date
-    ).select_related('drug', 'user')
-    
-    context = {
-        'form': form,
-        'start_date': start_date,
-        'end_date': end_date,
-        'drugs': drugs,
-        'total_stock_value': total_stock_value,
-        'low_stock_drugs': low_stock_drugs,
-        'expiring_drugs': expiring_drugs,
-        'inventory_logs': inventory_logs,
-    }
+    form, start_date, end_date = report_date_range(request)
     
     # Check if export is requested
-    if 'export' in request.GET:
-        export_format = request.GET.get('export')
-        if export_format == 'pdf':
-            # Add current date to context for footer
-            context['current_date'] = timezone.now()
-            # Use a simplified template for PDF to avoid CSS parsing issues
-            pdf = render_to_pdf('reports/inventory_report_pdf.html', context)
-            if pdf:
-                response = HttpResponse(pdf, content_type='application/pdf')
-                filename = f"Inventory_Report_{start_date.strftime('%Y-%m-%d')}_to_{end_date.strftime('%Y-%m-%d')}.pdf"
-                content = f"attachment; filename={filename}"
-                response['Content-Disposition'] = content
-                return response
-        elif export_format == 'excel':
-            return export_inventory_report_excel(drugs, inventory_logs, start_date, end_date)
-        elif export_format == 'csv':
-            return export_inventory_report_csv(drugs, inventory_logs, start_date, end_date)
-    
-    return render(request, 'reports/inventory_report.html', context)
-
-def export_inventory_report_excel(drugs, inventory_logs, start_date, end_date):
-    """Export inventory report as Excel file"""
-    output = BytesIO()
-    workbook = xlsxwriter.Workbook(output)
-    
-    # Current Inventory sheet
-    worksheet1 = workbook.add_worksheet('Current Inventory')
-    header_format = workbook.add_format({'bold': True, 'bg_color': '#f2f2f2'})
-    
-    # Headers
-    worksheet1.write(0, 0, 'Drug Name', header_format)
-    worksheet1.write(0, 1, 'Brand', header_format)
-    worksheet1.write(0, 2, 'Category', header_format)
-    worksheet1.write(0, 3, 'Current Stock', header_format)
-    worksheet1.write(0, 4, 'Reorder Level', header_format)
-    worksheet1.write(0, 5, 'Cost Price', header_format)
-    worksheet1.write(0, 6, 'Selling Price', header_format)
-    worksheet1.write(0, 7, 'Expiry Date', header_format)
-    worksheet1.write(0, 8, 'Stock Value', header_format)
-    
-    # Data
-    for i, drug in enumerate(drugs, 1):
-        worksheet1.write(i, 0, drug.name)
-        worksheet1.write(i, 1, drug.brand)
-        worksheet1.write(i, 2, drug.category.name if drug.category else 'N/A')
-        worksheet1.write(i, 3, drug.stock_quantity)
-        worksheet1.write(i, 4, drug.reorder_level)
-        worksheet1.write(i, 5, float(drug.cost_price))
-        worksheet1.write(i, 6, float(drug.selling_price))
-        worksheet1.write(i, 7, drug.expiry_date.strftime('%Y-%m-%d'))
-        worksheet1.write(i, 8, float(drug.stock_quantity * drug.cost_price))
-    
-    # Inventory Movement sheet
-    worksheet2 = workbook.add_worksheet('Inventory Movement')
-    
-    # Headers
-    worksheet2.write(0, 0, 'Date', header_format)
-    worksheet2.write(0, 1, 'Drug Name', header_format)
-    worksheet2.write(0, 2, 'Quantity Change', header_format)
-    worksheet2.write(0, 3, 'Operation Type', header_format)
-    worksheet2.write(0, 4, 'Reference', header_format)
-    worksheet2.write(0, 5, 'User', header_format)
-    worksheet2.write(0, 6, 'Notes', header_format)
-    
-    # Data
-    for i, log in enumerate(inventory_logs, 1):
-        worksheet2.write(i, 0, log.timestamp.strftime('%Y-%m-%d %H:%M'))
-        worksheet2.write(i, 1, log.drug.name if log.drug else 'N/A')
-        worksheet2.write(i, 2, log.quantity_change)
-        worksheet2.write(i, 3, log.get_operation_type_display())
-        worksheet2.write(i, 4, log.reference or 'N/A')
-        worksheet2.write(i, 5, log.user.username if log.user else 'N/A')
-        worksheet2.write(i, 6, log.notes or 'N/A')
-    
-    workbook.close()
-    output.seek(0)
+    export_format = request.GET.get('export')
+    if export_format in QUEUED_EXPORT_FORMATS:
+        return queue_report_export(request, 'INVENTORY', QUEUED_EXPORT_FORMATS[export_format],
+                                   start_date, end_date, 'inventory_report')
     
-    response = HttpResponse(
-        output,
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    filename = f"Inventory_Report_{start_date.strftime('%Y-%m-%d')}_to_{end_date.strftime('%Y-%m-%d')}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename={filename}'
+    context = inventory_report_context(start_date, end_date)
+    if export_format == 'csv':
+        return export_inventory_report_csv(context['drugs'], context['inventory_logs'], start_date, end_date)
     
-    return response
+    context['form'] = form
+    context['report_jobs'] = recent_report_jobs('INVENTORY')
+    return render(request, 'reports/inventory_report.html', context)
 
 def export_inventory_report_csv(drugs, inventory_logs, start_date, end_date):
-    """Export inventory report as CSV file"""
-    response = HttpResponse(content_type='text/csv')
-    filename = f"Inventory_Report_{start_date.strftime('%Y-%m-%d')}_to_{end_date.strftime('%Y-%m-%d')}.csv"
-    response['Content-Disposition'] = f'attachment; filename={filename}'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Drug Name', 'Brand', 'Category', 'Current Stock', 'Reorder Level', 
-                     'Cost Price', 'Selling Price', 'Expiry Date', 'Stock Value'])
+    """Stream the inventory report as a CSV file"""
+    filename = report_filename('INVENTORY', start_date, end_date, 'csv')
+    return stream_csv(filename, inventory_report_rows(drugs, inventory_logs))
+
+# Sales reports are restricted to these roles; inventory reports also allow Pharmacists
+SALES_REPORT_ROLES = ['Admin', 'Manager']
+
+# Page each kind of background export is requested from
+REPORT_JOB_PAGES = {'SALES': 'sales_report', 'INVENTORY': 'inventory_report', 'INVOICES': 'sale_invoice_batch'}
+
+@login_required
+@requires_role(['Admin', 'Manager', 'Pharmacist'])
+def report_job_status(request, job_id):
+    """API to poll whether a background report export is ready"""
+    job = get_object_or_404(ReportJob, id=job_id)
+    if job.report_type == 'SALES' and not check_role_permission(request.user, SALES_REPORT_ROLES):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress': job.progress,
+        'is_finished': job.is_finished,
+        'is_ready': job.is_ready,
+        'error': job.error,
+    })
+
+@login_required
+@requires_role(['Admin', 'Manager', 'Pharmacist'])
+def report_job_download(request, job_id):
+    """Download the file of a finished background report export"""
+    job = get_object_or_404(ReportJob, id=job_id)
+    if job.report_type == 'SALES' and not check_role_permission(request.user, SALES_REPORT_ROLES):
+        messages.error(request, "You don't have permission to access this page.")
+        return redirect('dashboard')
     
-    for drug in drugs:
-        writer.writerow([
-            drug.name,
-            drug.brand,
-            drug.category.name if drug.category else 'N/A',
-            drug.stock_quantity,
-            drug.reorder_level,
-            float(drug.cost_price),
-            float(drug.selling_price),
-            drug.expiry_date.strftime('%Y-%m-%d'),
-            float(drug.stock_quantity * drug.cost_price)
-        ])
-    
-    writer.writerow([])
-    writer.writerow(['Inventory Movement:'])
-    writer.writerow(['Date', 'Drug Name', 'Quantity Change', 'Operation Type', 'Reference', 'User', 'Notes'])
-    
-    for log in inventory_logs:
-        writer.writerow([
-            log.timestamp.strftime('%Y-%m-%d %H:%M'),
-            log.drug.name if log.drug else 'N/A',
-            log.quantity_change,
-            log.get_operation_type_display(),
-            log.reference or 'N/A',
-            log.user.username if log.user else 'N/A',
-            log.notes or 'N/A'
-        ])
+    url_name = REPORT_JOB_PAGES[job.report_type]
+    if not job.is_ready:
+        messages.error(request, "This export is not available. It may still be generating or may have expired.")
+        return redirect(url_name)
     
-    return response
+    extension = FILE_EXTENSIONS[job.export_format]
+    return FileResponse(
+        job.file.open('rb'),
+        as_attachment=True,
+        filename=report_filename(job.report_type, job.start_date, job.end_date, extension)
+    )
 
 # User Management Views
 @login_required
@@ -1546,24 +937,150 @@ def user_edit(request, user_id):
     return render(request, 'users/edit.html', {'form': form, 'user': user})
 
 # API endpoints for AJAX requests
+def drug_info(drug):
+    """Price, stock and expiry of a drug as returned by the sales form APIs"""
+    return {
+        'id': drug.id,
+        'name': drug.name,
+        'brand': drug.brand,
+        'price': float(drug.selling_price),
+        'available_stock': drug.stock_quantity,
+        'expiry_date': drug.expiry_date.strftime('%Y-%m-%d'),
+        'is_expired': drug.is_expired(),
+    }
+
 @login_required
 def get_drug_info(request, drug_id):
     """API to get drug information for sales form"""
     try:
         drug = Drug.objects.get(id=drug_id)
-        data = {
-            'id': drug.id,
-            'name': drug.name,
-            'brand': drug.brand,
-            'price': float(drug.selling_price),
-            'available_stock': drug.stock_quantity,
-            'expiry_date': drug.expiry_date.strftime('%Y-%m-%d'),
-            'is_expired': drug.is_expired(),
-        }
-        return JsonResponse(data)
+        return JsonResponse(drug_info(drug))
     except Drug.DoesNotExist:
         return JsonResponse({'error': 'Drug not found'}, status=404)
 
+# Most drugs the batch drug info API accepts in one request
+DRUG_INFO_BATCH_LIMIT = 200
+
+def split_query_list(value):
+    """Split a comma separated query parameter into its non-empty values, keeping order"""
+    return list(dict.fromkeys(part.strip() for part in value.split(',') if part.strip()))
+
+@login_required
+def get_drugs_info(request):
+    """API to get drug information for every drug in the sales form in one query.
+    
+    Takes comma separated `ids` and/or `barcodes` and answers with an ETag of
+    the data, so a basket whose prices and stock have not changed is
+    revalidated with a 304 instead of being sent again.
+    """
+    ids = [int(value) for value in split_query_list(request.GET.get('ids', '')) if value.isdigit()]
+    barcodes = split_query_list(request.GET.get('barcodes', ''))
+    if not ids and not barcodes:
+        return JsonResponse({'error': 'No drug ids or barcodes provided', 'success': False}, status=400)
+    if len(ids) + len(barcodes) > DRUG_INFO_BATCH_LIMIT:
+        return JsonResponse({
+            'error': f'At most {DRUG_INFO_BATCH_LIMIT} drugs can be requested at once',
+            'success': False
+        }, status=400)
+    
+    drugs = Drug.objects.filter(Q(id__in=ids) | Q(barcode__in=barcodes)).only(
+        'id', 'name', 'brand', 'barcode', 'selling_price', 'stock_quantity', 'expiry_date'
+    )
+    by_id = {}
+    by_barcode = {}
+    for drug in drugs:
+        by_id[drug.id] = drug
+        if drug.barcode:
+            by_barcode[drug.barcode] = drug
+    
+    # Drugs are listed in the order requested, ids first, each once
+    requested = [by_id[drug_id] for drug_id in ids if drug_id in by_id]
+    requested += [by_barcode[barcode] for barcode in barcodes if barcode in by_barcode]
+    payload = {
+        'success': True,
+        'drugs': [drug_info(drug) for drug in dict.fromkeys(requested)],
+        'missing_ids': [drug_id for drug_id in ids if drug_id not in by_id],
+        'missing_barcodes': [barcode for barcode in barcodes if barcode not in by_barcode],
+    }
+    
+    # Stock changes through queryset updates that leave updated_at alone, so the
+    # ETag is a hash of the response itself rather than of modification times
+    content = json.dumps(payload).encode()
+    etag = quote_etag(hashlib.md5(content).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    # Stock must never be read from a stale copy: the browser may keep it but revalidates every time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@login_required
+def get_drug_catalogue(request):
+    """API returning the active drugs for the sales page to cache client-side.
+    
+    Rows are [id, name, brand, price, stock, barcode] arrays. A till passes the
+    version it already holds as `since` and gets only what changed after it.
+    """
+    use_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    response = HttpResponse(
+        catalogue_response_body(request.GET.get('since'), gzip=use_gzip),
+        content_type='application/json'
+    )
+    if use_gzip:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    # Stock changes with every sale, so the browser must never answer from its own copy
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+def autocomplete_result(source, obj):
+    """One autocomplete suggestion: the id and label, plus what the page shows next to it"""
+    if source == 'drugs':
+        return {**drug_info(obj), 'text': str(obj)}
+    return {'id': obj.id, 'text': str(obj), 'phone_number': obj.phone_number}
+
+@login_required
+def autocomplete_search_api(request, source):
+    """API behind the autocomplete select fields.
+    
+    Searches drug or patient names by word prefix (`q`) and returns one page of
+    matches (`limit`, `offset`), best matches and most often sold first.
+    """
+    if source not in SEARCH_SOURCES:
+        return JsonResponse({'error': 'Unknown search', 'success': False}, status=404)
+    
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), settings.AUTOCOMPLETE_MAX_RESULTS)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        return JsonResponse({'error': 'limit and offset must be numbers', 'success': False}, status=400)
+    
+    objects, has_more = autocomplete_search(source, request.GET.get('q', ''), limit, offset)
+    return JsonResponse({
+        'success': True,
+        'results': [autocomplete_result(source, obj) for obj in objects],
+        'has_more': has_more,
+        'next_offset': offset + limit if has_more else None,
+    })
+
+@login_required
+def get_basket_interactions(request):
+    """API to check drug interactions among the drugs currently in the sales form"""
+    ids = []
+    for value in request.GET.get('ids', '').split(','):
+        value = value.strip()
+        if value.isdigit():
+            ids.append(int(value))
+    
+    drugs_by_id = Drug.objects.in_bulk(set(ids))
+    drugs = [drugs_by_id[drug_id] for drug_id in dict.fromkeys(ids) if drug_id in drugs_by_id]
+    
+    return JsonResponse({
+        'success': True,
+        'interactions': find_drug_interactions(drugs),
+    })
+
 @login_required
 def get_drug_by_barcode(request):
     """API to get drug information by barcode"""
@@ -1575,37 +1092,14 @@ def get_drug_by_barcode(request):
     try:
         # Make sure barcode is not empty when searching
         if barcode.strip():
-            try:
-                # First try to find a drug with exact barcode match
-                drug = Drug.objects.get(barcode=barcode, is_active=True)
-            except Drug.DoesNotExist:
-                # If not found, try to find a drug with barcode containing the search term
-                # This is more forgiving for partial barcode scans
-                drugs = Drug.objects.filter(barcode__icontains=barcode, is_active=True)
-                if drugs.exists():
-                    drug = drugs.first()
-                else:
-                    return JsonResponse({'error': 'No drug found with this barcode', 'success': False}, status=404)
+            # Exact and partial scans are resolved by the in-memory barcode index
+            drug = find_drug_by_barcode(barcode)
+            if drug is None:
+                return JsonResponse({'error': 'No drug found with this barcode', 'success': False}, status=404)
             
-            data = {
-                'id': drug.id,
-                'name': drug.name,
-                'brand': drug.brand,
-                'price': float(drug.selling_price),
-                'available_stock': drug.stock_quantity,
-                'expiry_date': drug.expiry_date.strftime('%Y-%m-%d'),
-                'is_expired': drug.is_expired(),
-                'success': True
-            }
-            
-            # Log successful scan for debugging
-            print(f"Successfully found drug by barcode: {barcode} -> {drug.name}")
-            
-            return JsonResponse(data)
+            return JsonResponse({**drug_info(drug), 'success': True})
         else:
             return JsonResponse({'error': 'Empty barcode provided', 'success': False}, status=400)
-    except Drug.DoesNotExist:
-        return JsonResponse({'error': 'No drug found with this barcode', 'success': False}, status=404)
     except Exception as e:
         # Log the error
         print(f"Error in get_drug_by_barcode: {str(e)}")
@@ -1691,6 +1185,10 @@ def invoice_detail(request, invoice_id):
         'unmatched_items': items.filter(match_status='UNMATCHED').count(),
         'partially_matched_items': items.filter(match_status='PARTIAL_MATCH').count(),
         'ignored_items': items.filter(match_status='IGNORED').count(),
+        'can_reprocess': (
+            invoice.processing_status not in ('PENDING', 'PROCESSING')
+            and not has_imported_items(invoice)
+        ),
     }
     
     return render(request, 'invoices/detail.html', context)
@@ -1698,69 +1196,34 @@ def invoice_detail(request, invoice_id):
 @login_required
 @requires_role(['Admin', 'Pharmacist'])
 def invoice_process(request, invoice_id):
-    """Process an uploaded invoice to extract items"""
+    """Queue an uploaded invoice for background processing"""
     invoice = get_object_or_404(InvoiceUpload, id=invoice_id)
     
-    # Update status to processing
-    invoice.processing_status = 'PROCESSING'
-    invoice.save()
-    
-    try:
-        # Process based on file type
-        print(f"Processing invoice ID {invoice.id} with file type: {invoice.file_type}")
-        
-        if invoice.file_type == 'PDF':
-            print("Starting PDF processing")
-            items = process_pdf_invoice(invoice)
-            print(f"PDF processing completed with {len(items)} items")
-        elif invoice.file_type == 'IMAGE':
-            print("Starting image processing")
-            items = process_image_invoice(invoice)
-            print(f"Image processing completed with {len(items)} items")
-        elif invoice.file_type == 'EXCEL':
-            print("Starting Excel processing")
-            items = process_excel_invoice(invoice)
-            print(f"Excel processing completed with {len(items)} items")
-        else:
-            print(f"Unsupported file type: {invoice.file_type}")
-            messages.error(request, f"Unsupported file type: {invoice.file_type}")
-            invoice.processing_status = 'FAILED'
-            invoice.processing_notes = f"Unsupported file type: {invoice.file_type}"
-            invoice.save()
-            return redirect('invoice_detail', invoice_id=invoice.id)
-        
-        # Auto-match items with drugs in the database
-        match_invoice_items(invoice)
-        
-        # Update invoice status
-        invoice.total_items_found = invoice.items.count()
-        invoice.total_items_matched = invoice.items.filter(match_status__in=['MATCHED', 'MANUALLY_MATCHED']).count()
-        
-        if invoice.total_items_matched == 0:
-            invoice.processing_status = 'FAILED'
-            invoice.processing_notes = "No items could be matched to drugs in the database."
-        elif invoice.total_items_matched < invoice.total_items_found:
-            invoice.processing_status = 'PARTIALLY_PROCESSED'
-            invoice.processing_notes = f"{invoice.total_items_matched} out of {invoice.total_items_found} items matched."
-        else:
-            invoice.processing_status = 'COMPLETED'
-            invoice.processing_notes = "All items matched successfully."
-        
-        invoice.save()
-        
-        messages.success(request, f"Invoice processed. {invoice.total_items_matched} out of {invoice.total_items_found} items matched.")
-    except Exception as e:
-        import traceback
-        tb = traceback.format_exc()
-        print(f"Error in invoice processing: {str(e)}")
-        print(tb)
-        invoice.processing_status = 'FAILED'
-        invoice.processing_notes = f"Error processing invoice: {str(e)}"
-        invoice.save()
-        messages.error(request, f"Error processing invoice: {str(e)}")
+    if has_imported_items(invoice):
+        messages.error(request, "Items of this invoice have already been imported to the inventory, so it cannot be reprocessed.")
+    elif enqueue_invoice(invoice):
+        messages.success(request, "Invoice queued for processing. This page will update when it is done.")
+    else:
+        messages.info(request, "This invoice is already being processed.")
     
     return redirect('invoice_detail', invoice_id=invoice.id)
 
+@login_required
+@requires_role(['Admin', 'Pharmacist'])
+def invoice_status(request, invoice_id):
+    """API to poll the processing progress of an invoice"""
+    invoice = get_object_or_404(InvoiceUpload, id=invoice_id)
+    return JsonResponse({
+        'id': invoice.id,
+        'status': invoice.processing_status,
+        'status_display': invoice.get_processing_status_display(),
+        'progress': invoice.progress,
+        'notes': invoice.processing_notes,
+        'total_items_found': invoice.total_items_found,
+        'total_items_matched': invoice.total_items_matched,
+        'is_finished': invoice.processing_status not in ('PENDING', 'PROCESSING'),
+    })
+
 @login_required
 @requires_role(['Admin', 'Pharmacist'])
 def invoice_item_match(request, item_id):
@@ -1782,20 +1245,17 @@ def invoice_item_match(request, item_id):
     else:
         form = InvoiceItemMatchForm(instance=item)
     
-    # Get all drugs for selection
-    drugs = Drug.objects.all()
-    
     # If we have a name, try to find potential matches
     suggested_matches = []
     if item.extracted_name:
-        suggested_matches = Drug.objects.filter(
-            Q(name__icontains=item.extracted_name) | Q(brand__icontains=item.extracted_name)
-        ).distinct()[:5]
+        ranked = get_drug_match_index().rank(item.extracted_name, item.extracted_brand, limit=5)
+        suggested_ids = [drug['id'] for drug, score in ranked if score >= PARTIAL_MATCH_THRESHOLD]
+        drugs_by_id = Drug.objects.in_bulk(suggested_ids)
+        suggested_matches = [drugs_by_id[drug_id] for drug_id in suggested_ids if drug_id in drugs_by_id]
     
     context = {
         'form': form,
         'item': item,
-        'drugs': drugs,
         'suggested_matches': suggested_matches,
     }
     
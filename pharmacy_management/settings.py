@@ -129,6 +129,36 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Cache shared by the web server and the background workers (process_invoices,
+# process_report_jobs). Cache invalidation and the version keys of the in-memory
+# drug indexes only reach every process if all of them use the same cache, so
+# the default is a file cache on this host; use CACHE_BACKEND/CACHE_LOCATION to
+# point all processes at e.g. Redis or a database cache table instead.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '5000')),
+        },
+    }
+}
+
+# Logging: the app's messages (background workers included) go to the console
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'pharmacy_app': {
+            'handlers': ['console'],
+            'level': os.getenv('PHARMACY_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -154,3 +184,40 @@ ROLES = [ADMIN_ROLE, PHARMACIST_ROLE, SALES_CLERK_ROLE, MANAGER_ROLE]
 
 # Drug expiry notification threshold (in days)
 DRUG_EXPIRY_THRESHOLD = 60  # 2 months
+
+# Rows per page of the drug list (further pages load with a keyset cursor)
+DRUG_LIST_PAGE_SIZE = 50
+SALE_LIST_PAGE_SIZE = 50
+
+# Seconds the low stock / expiring notification counts are cached between drug changes
+NOTIFICATION_CACHE_TIMEOUT = int(os.getenv('NOTIFICATION_CACHE_TIMEOUT', '60'))
+
+# Invoice OCR settings
+INVOICE_OCR_WORKERS = int(os.getenv('INVOICE_OCR_WORKERS', '2'))  # Processes used to OCR PDF pages
+INVOICE_OCR_DPI = 200  # Resolution used when rasterising PDF pages
+INVOICE_ITEM_BATCH_SIZE = 500  # Rows per bulk INSERT/UPDATE of extracted invoice items
+
+# OCR results are cached per file content hash so reprocessing skips Tesseract
+OCR_CACHE_DIR = os.path.join(MEDIA_ROOT, 'ocr_cache')
+OCR_CACHE_MAX_BYTES = int(os.getenv('OCR_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+
+# Rows fetched per database round trip (and written per chunk) by the streaming report exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Hours a background report export stays downloadable before the worker deletes it
+REPORT_JOB_EXPIRY_HOURS = int(os.getenv('REPORT_JOB_EXPIRY_HOURS', '24'))
+
+# Seconds a rendered sale invoice PDF stays cached (it is also dropped when the sale changes)
+INVOICE_PDF_CACHE_TIMEOUT = int(os.getenv('INVOICE_PDF_CACHE_TIMEOUT', str(24 * 60 * 60)))
+INVOICE_BATCH_WORKERS = int(os.getenv('INVOICE_BATCH_WORKERS', '2'))  # Processes used to render a batch of invoice PDFs
+
+# Seconds the ids changed in a drug catalogue version are kept so tills holding an older version
+# can fetch only the drugs changed since
+CATALOGUE_CHANGES_TIMEOUT = int(os.getenv('CATALOGUE_CHANGES_TIMEOUT', str(60 * 60)))
+
+# Autocomplete search: days of sales that rank drugs and patients, and the most results per request
+SEARCH_POPULARITY_DAYS = int(os.getenv('SEARCH_POPULARITY_DAYS', '30'))
+AUTOCOMPLETE_MAX_RESULTS = 50
+
+# Spreadsheet rows looked up and written per bulk query by the drug import
+DRUG_IMPORT_CHUNK_SIZE = 1000